@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import Canteen, Category, MenuItem, Order, OrderItem
+from .models import (
+    Canteen, Category, CheckoutCart, MenuItem, Order, OrderItem, StockReservation, PickupSlot, PickupSlotUsage, PrepTimeStat,
+    IdempotencyRecord,
+)
 
 # Register your models here.
 
@@ -9,6 +12,12 @@ admin.site.register(Category)
 admin.site.register(MenuItem)
 admin.site.register(Order)
 admin.site.register(OrderItem)
+admin.site.register(StockReservation)
+admin.site.register(PickupSlot)
+admin.site.register(PickupSlotUsage)
+admin.site.register(PrepTimeStat)
+admin.site.register(IdempotencyRecord)
+admin.site.register(CheckoutCart) # FAILED carts are captured payments awaiting a refund
 
 # We can customize the admin display later if needed, for example:
 # class OrderItemInline(admin.TabularInline):
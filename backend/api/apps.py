@@ -1,6 +1,24 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_migrate, post_save
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from django.contrib.auth.models import User
+
+        from .availability import invalidate_index
+        from .models import AvailabilityWindow, Canteen, Category, MenuItem
+        from .pricing import invalidate_prices
+        from .sharding import delete_from_shards, mirror_to_shards, reserve_id_blocks
+
+        for model in (Canteen, Category, User):
+            post_save.connect(mirror_to_shards, sender=model, dispatch_uid=f'shard-mirror-{model._meta.label_lower}')
+            post_delete.connect(delete_from_shards, sender=model, dispatch_uid=f'shard-delete-{model._meta.label_lower}')
+        post_migrate.connect(reserve_id_blocks, sender=self)
+        post_save.connect(invalidate_index, sender=AvailabilityWindow, dispatch_uid='availability-index-save')
+        post_delete.connect(invalidate_index, sender=AvailabilityWindow, dispatch_uid='availability-index-delete')
+        post_save.connect(invalidate_prices, sender=MenuItem, dispatch_uid='price-table-save')
+        post_delete.connect(invalidate_prices, sender=MenuItem, dispatch_uid='price-table-delete')
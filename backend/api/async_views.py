@@ -0,0 +1,217 @@
+"""
+Async read path for the high fan-out GET endpoints.
+
+DRF views are synchronous, so under ASGI each request to them holds a worker
+thread for its whole lifetime. ``AsyncReadView`` serves the same reads as
+plain Django async views: authentication, queryset, filtering, shard pinning,
+permissions, conditional GET and serializer all come from the existing
+viewset named in ``viewset_class``, while the database is read with the
+async ORM. Responses carry the same JSON and validators as the sync endpoints.
+
+Catalog routes are switched over with ``settings.ASYNC_READ_VIEWS`` (for ASGI
+deployments); ``OrderStatusView`` is always mounted.
+"""
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
+from django.views import View
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from .availability import cache_max_age, get_index
+from .catalog import acategory_counts, amenu_version, parse_canteen_id
+from .conditional import ConditionalGetMixin, not_modified, set_validators, validator_aggregates, validators_from
+from .eta import ACTIVE_STATUSES, estimate_ready_at, queue_depth
+from .inventory import ensure_stock_rolled_over
+from .sharding import CanteenShardMixin, _ordering_key, fan_out, sharding_enabled, use_shard
+from .views import CustomerCanteenViewSet, CustomerCategoryListViewSet, CustomerMenuItemListViewSet, OrderViewSet
+
+
+def _json(data, status=200, headers=None):
+    response = HttpResponse(JSONRenderer().render(data), status=status, content_type='application/json')
+    for name, value in (headers or {}).items():
+        response[name] = value
+    return response
+
+
+async def authenticate(request, authenticators):
+    """``(user, auth)`` like ``Request.user``; token auth runs on the async ORM, anything else in a thread."""
+    if all(type(authenticator) is TokenAuthentication for authenticator in authenticators):
+        header = request.headers.get('Authorization', '').split()
+        if not header or header[0].lower() != 'token':
+            return None, None
+        if len(header) != 2:
+            raise exceptions.AuthenticationFailed("Invalid token header.")
+        try:
+            token = await Token.objects.select_related('user').aget(key=header[1])
+        except Token.DoesNotExist:
+            raise exceptions.AuthenticationFailed("Invalid token.")
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed("User inactive or deleted.")
+        return token.user, token
+
+    drf_request = Request(request, authenticators=authenticators)
+    return await sync_to_async(lambda: (drf_request.user, drf_request.auth))()
+
+
+class AsyncReadView(View):
+    """
+    GET-only async counterpart of one action (``list`` or ``retrieve``) of
+    ``viewset_class``. ``select_related``/``prefetch_related`` must cover every
+    relation the serializer touches, as lazy loads are not allowed here.
+    """
+    http_method_names = ['get', 'head', 'options']
+    viewset_class = None
+    action = 'list'
+    select_related = ()
+    prefetch_related = ()
+
+    async def get(self, request, *args, **kwargs):
+        viewset = self.viewset_class(
+            request=None, args=args, kwargs=kwargs, action=self.action, format_kwarg=None, headers={},
+        )
+        authenticators = viewset.get_authenticators()
+        try:
+            user, auth = await authenticate(request, authenticators)
+        except exceptions.AuthenticationFailed as exc:
+            return self.denied(authenticators, exc)
+        drf_request = Request(request, authenticators=authenticators)
+        drf_request.user, drf_request.auth = user or AnonymousUser(), auth
+        viewset.request = drf_request
+
+        for permission in viewset.get_permissions():
+            if not permission.has_permission(drf_request, viewset):
+                denial = exceptions.PermissionDenied(getattr(permission, 'message', None))
+                return self.denied(authenticators, denial, user)
+
+        alias = None
+        if isinstance(viewset, CanteenShardMixin) and sharding_enabled():
+            alias = viewset.get_shard(drf_request)
+        if alias is None:
+            return await self.respond(request, viewset)
+        with use_shard(alias):
+            return await self.respond(request, viewset)
+
+    def denied(self, authenticators, exc, user=None):
+        if user is None or not user.is_authenticated:
+            header = authenticators[0].authenticate_header(None) if authenticators else None
+            if header:
+                exc = exc if isinstance(exc, exceptions.AuthenticationFailed) else exceptions.NotAuthenticated()
+                return _json({'detail': exc.detail}, status=401, headers={'WWW-Authenticate': header})
+        return _json({'detail': exc.detail}, status=exc.status_code)
+
+    def get_queryset(self, viewset):
+        queryset = viewset.filter_queryset(viewset.get_queryset())
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*self.prefetch_related)
+        lookup = viewset.lookup_url_kwarg or viewset.lookup_field
+        if self.action != 'list':
+            queryset = queryset.filter(**{viewset.lookup_field: viewset.kwargs[lookup]})
+        return queryset
+
+    async def respond(self, request, viewset):
+        queryset = self.get_queryset(viewset)
+        if not isinstance(viewset, ConditionalGetMixin):
+            return await self.render(viewset, queryset)
+
+        aggregates = validator_aggregates(viewset.conditional_fields)
+        parts = [await qs.aaggregate(**aggregates) for qs in fan_out(viewset.get_conditional_queryset())]
+        last_modified, etag = viewset.finish_validators(*validators_from(parts))
+        response = not_modified(request, last_modified, etag)
+        if response is None:
+            response = await self.render(viewset, queryset)
+            if response.status_code != 200:
+                return response
+        return set_validators(response, last_modified, etag, viewset.get_cache_max_age())
+
+    async def render(self, viewset, queryset):
+        if self.action == 'list':
+            querysets = fan_out(queryset)
+            objects = [obj for qs in querysets async for obj in qs]
+            key, reverse = _ordering_key(queryset)
+            if key is not None and len(querysets) > 1:
+                objects.sort(key=key, reverse=reverse)
+            return _json(await self.serialize(viewset, objects, many=True))
+
+        obj = await queryset.afirst()
+        if obj is None:
+            return _json({'detail': f"No {queryset.model._meta.object_name} matches the given query."}, status=404)
+        for permission in viewset.get_permissions():
+            if not permission.has_object_permission(viewset.request, viewset, obj):
+                return _json({'detail': exceptions.PermissionDenied.default_detail}, status=403)
+        return _json(await self.serialize(viewset, obj))
+
+    async def serialize(self, viewset, instance, many=False):
+        return viewset.get_serializer(instance, many=many).data
+
+
+class CanteenListView(AsyncReadView):
+    viewset_class = CustomerCanteenViewSet
+
+
+class CanteenDetailView(CanteenListView):
+    action = 'retrieve'
+
+
+class CategoryListView(AsyncReadView):
+    viewset_class = CustomerCategoryListViewSet
+
+    async def respond(self, request, viewset):
+        await sync_to_async(get_index)() # Loaded here, as the counts and validators use it
+        await sync_to_async(ensure_stock_rolled_over)()
+        if 'canteen' not in request.GET:
+            return await super().respond(request, viewset)
+        canteen_id = parse_canteen_id(request.GET['canteen'])
+        if canteen_id is None:
+            return _json({'error': "Invalid canteen id"}, status=400)
+        last_modified, etag = await amenu_version(canteen_id)
+        response = not_modified(request, last_modified, etag)
+        if response is None:
+            response = _json(await acategory_counts(canteen_id, etag))
+        return set_validators(response, last_modified, etag, cache_max_age())
+
+
+class CategoryDetailView(CategoryListView):
+    action = 'retrieve'
+
+
+class MenuItemListView(AsyncReadView):
+    viewset_class = CustomerMenuItemListViewSet
+    select_related = ('canteen', 'category')
+
+    async def respond(self, request, viewset):
+        await sync_to_async(get_index)() # The queryset and validators use the availability index
+        await sync_to_async(ensure_stock_rolled_over)()
+        return await super().respond(request, viewset)
+
+
+class MenuItemDetailView(MenuItemListView):
+    action = 'retrieve'
+
+
+class OrderStatusView(AsyncReadView):
+    """
+    ``GET /api/orders/<pk>/status/``: the fields a customer polls while waiting,
+    without the items and customer of the full order.
+    """
+    viewset_class = OrderViewSet
+    action = 'retrieve'
+    prefetch_related = ('items',)
+
+    async def serialize(self, viewset, order, many=False):
+        # The ETA model reads stats and the queue with the sync ORM
+        queue_ahead = await sync_to_async(queue_depth)(order) if order.status in ACTIVE_STATUSES else 0
+        estimated = await sync_to_async(estimate_ready_at)(order, [item.menu_item_id for item in order.items.all()], queue_ahead)
+        return {
+            'id': order.id,
+            'status': order.status,
+            'pickup_token': order.pickup_token,
+            'ready_at': order.ready_at,
+            'estimated_ready_at': estimated,
+            'updated_at': order.updated_at,
+        }
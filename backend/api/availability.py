@@ -0,0 +1,157 @@
+"""
+Menu availability schedules.
+
+A menu item with ``AvailabilityWindow`` rows can only be ordered inside one of
+them (local time); items without windows follow ``is_available`` alone.
+
+``AvailabilityIndex`` compiles every window into the sorted minute-of-week
+boundaries where some item opens or closes. Between two boundaries the set of
+open items is fixed, so the week is cut into segments with a precomputed
+``frozenset`` of closed items each, and a minute -> segment table answers
+"which segment is it now?" with one array lookup. The index is built once per
+process and rebuilt after ``AVAILABILITY_INDEX_SECONDS`` or when a window is
+saved in this process; other requests answer from memory.
+
+Catalog validators (``roll_validators``) include the current segment, and
+cache lifetimes stop at the next boundary (``seconds_to_next_change``), so
+ETags and cached responses roll over when a window opens or closes.
+"""
+import asyncio
+from datetime import timedelta
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.http import quote_etag
+import numpy as np
+
+from .models import AvailabilityWindow, MenuItem
+from .sharding import shard_aliases
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+
+def _minute_of_day(value):
+    return value.hour * 60 + value.minute
+
+
+class AvailabilityIndex:
+    """Open/closed scheduled menu items per segment of the week, from ``(menu_item_id, weekdays, start, end)``."""
+
+    def __init__(self, windows):
+        intervals, scheduled = [], set()
+        for menu_item_id, weekdays, start_time, end_time in windows:
+            scheduled.add(menu_item_id)
+            for day in range(7):
+                if weekdays & (1 << day):
+                    offset = day * MINUTES_PER_DAY
+                    intervals.append((menu_item_id, offset + _minute_of_day(start_time), offset + _minute_of_day(end_time)))
+        self.scheduled = frozenset(scheduled)
+        self.boundaries = np.unique(
+            [0] + [start for _, start, _ in intervals] + [end for _, _, end in intervals if end < MINUTES_PER_WEEK]
+        )
+        open_items = [set() for _ in self.boundaries]
+        for menu_item_id, start, end in intervals:
+            first, stop = np.searchsorted(self.boundaries, [start, end])
+            for segment in range(first, stop):
+                open_items[segment].add(menu_item_id)
+        self.closed = [self.scheduled - items for items in open_items]
+        self.segment_of = np.searchsorted(self.boundaries, np.arange(MINUTES_PER_WEEK), side='right') - 1
+
+    def locate(self, now=None):
+        """``(segment, start of the week)`` for ``now`` in local time."""
+        local = timezone.localtime(now)
+        week_start = (local - timedelta(days=local.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
+        return int(self.segment_of[local.weekday() * MINUTES_PER_DAY + _minute_of_day(local)]), week_start
+
+    def closed_items(self, now=None):
+        """Ids of scheduled items outside all their windows at ``now``."""
+        segment, _ = self.locate(now)
+        return self.closed[segment]
+
+    def is_open(self, menu_item_id, now=None):
+        return menu_item_id not in self.scheduled or menu_item_id not in self.closed_items(now)
+
+    def segment_bounds(self, now=None):
+        """``(start, end)`` datetimes of the segment containing ``now``; ``end`` is None without schedules."""
+        segment, week_start = self.locate(now)
+        start = week_start + timedelta(minutes=int(self.boundaries[segment]))
+        if len(self.boundaries) == 1:
+            return start, None
+        following = self.boundaries[segment + 1] if segment + 1 < len(self.boundaries) else MINUTES_PER_WEEK
+        return start, week_start + timedelta(minutes=int(following))
+
+
+_index = None
+_built_at = None
+_lock = threading.Lock()
+
+
+def load_windows():
+    return [
+        row
+        for alias in shard_aliases()
+        for row in AvailabilityWindow.objects.using(alias).values_list('menu_item_id', 'weekdays', 'start_time', 'end_time')
+    ]
+
+
+def _in_event_loop():
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def get_index():
+    """
+    This process's ``AvailabilityIndex``, rebuilt when older than
+    ``AVAILABILITY_INDEX_SECONDS``. Async views load it with ``sync_to_async``
+    first; inside the event loop an expired index is used as is rather than queried.
+    """
+    global _index, _built_at
+    with _lock:
+        expired = _index is None or time.monotonic() - _built_at > settings.AVAILABILITY_INDEX_SECONDS
+        if expired and not (_index is not None and _in_event_loop()):
+            _index, _built_at = AvailabilityIndex(load_windows()), time.monotonic()
+        return _index
+
+
+def invalidate_index(sender=None, instance=None, using=None, **kwargs):
+    """post_save/post_delete handler: rebuild the index on next use and change the item's validators."""
+    global _index
+    with _lock:
+        _index = None
+    if instance is not None:
+        MenuItem.objects.using(using).filter(pk=instance.menu_item_id).update(updated_at=timezone.now())
+
+
+def is_orderable(menu_item, now=None):
+    """``is_available`` and inside an availability window (if the item has any)."""
+    return menu_item.is_available and get_index().is_open(menu_item.pk, now)
+
+
+def roll_validators(last_modified, etag, now=None):
+    """Catalog validators that also change when any item opens or closes."""
+    index = get_index()
+    if not index.scheduled:
+        return last_modified, etag
+    start, _ = index.segment_bounds(now)
+    version = f"{etag}:{start.isoformat()}"
+    return max(filter(None, [last_modified, start])), quote_etag(hashlib.sha1(version.encode()).hexdigest())
+
+
+def seconds_to_next_change(now=None):
+    """Whole seconds until some item opens or closes, or None without schedules."""
+    now = now or timezone.now()
+    _, end = get_index().segment_bounds(now)
+    return None if end is None else max(0, int((end - now).total_seconds()))
+
+
+def cache_max_age(now=None):
+    """``CATALOG_CACHE_MAX_AGE``, cut short at the next window boundary."""
+    remaining = seconds_to_next_change(now)
+    return settings.CATALOG_CACHE_MAX_AGE if remaining is None else min(settings.CATALOG_CACHE_MAX_AGE, remaining)
@@ -0,0 +1,88 @@
+"""
+Categories of one canteen's menu with their item counts.
+
+``Category`` has no canteen of its own: a canteen's categories are those its
+available menu items use. ``category_counts`` groups the canteen's available
+items by category in one aggregate query on its shard. The result is cached
+under the canteen's menu version, the conditional GET validators of its
+available items (the same aggregate ``ConditionalGetMixin`` uses) rolled over
+at availability window boundaries, so any menu change moves the cache key and
+stale entries just expire.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+from .availability import get_index, roll_validators
+from .conditional import validator_aggregates, validators_from
+from .models import MenuItem
+from .sharding import shard_for_canteen
+
+# Everything the counts depend on: the items, and the names of their categories
+MENU_VERSION_FIELDS = ('updated_at', 'category__updated_at')
+
+
+def parse_canteen_id(value):
+    """The canteen id from a query parameter, or None if it isn't one."""
+    try:
+        canteen_id = int(value)
+    except (TypeError, ValueError):
+        return None
+    return canteen_id if canteen_id > 0 else None
+
+
+def available_items(canteen_id):
+    items = MenuItem.objects.using(shard_for_canteen(canteen_id)).filter(canteen_id=canteen_id, is_available=True)
+    closed = get_index().closed_items()
+    return items.exclude(pk__in=closed) if closed else items
+
+
+def _counts_queryset(canteen_id):
+    return (
+        available_items(canteen_id).filter(category__isnull=False)
+        .values('category_id', 'category__name')
+        .annotate(item_count=Count('pk'))
+        .order_by('category__name')
+    )
+
+
+def _cache_key(canteen_id, etag):
+    version = etag.strip('"')
+    return f"category-counts:{canteen_id}:{version}"
+
+
+def _rows(values):
+    return [
+        {'id': row['category_id'], 'name': row['category__name'], 'item_count': row['item_count']}
+        for row in values
+    ]
+
+
+def menu_version(canteen_id):
+    """``(last_modified, etag)`` of the canteen's available menu."""
+    parts = [available_items(canteen_id).order_by().aggregate(**validator_aggregates(MENU_VERSION_FIELDS))]
+    return roll_validators(*validators_from(parts))
+
+
+def category_counts(canteen_id, etag):
+    """``[{'id', 'name', 'item_count'}]`` by name for the menu version ``etag``."""
+    key = _cache_key(canteen_id, etag)
+    rows = cache.get(key)
+    if rows is None:
+        rows = _rows(_counts_queryset(canteen_id))
+        cache.set(key, rows, settings.CATEGORY_COUNTS_CACHE_SECONDS)
+    return rows
+
+
+async def amenu_version(canteen_id):
+    parts = [await available_items(canteen_id).order_by().aaggregate(**validator_aggregates(MENU_VERSION_FIELDS))]
+    return roll_validators(*validators_from(parts))
+
+
+async def acategory_counts(canteen_id, etag):
+    key = _cache_key(canteen_id, etag)
+    rows = await cache.aget(key)
+    if rows is None:
+        rows = _rows([row async for row in _counts_queryset(canteen_id)])
+        await cache.aset(key, rows, settings.CATEGORY_COUNTS_CACHE_SECONDS)
+    return rows
@@ -0,0 +1,87 @@
+"""
+Conditional GET for the public catalog endpoints.
+
+``ConditionalGetMixin`` derives ``Last-Modified`` and an ``ETag`` from one
+aggregate over the filtered queryset, ``MAX(updated_at)`` plus ``COUNT(*)`` so
+deletions change the tag too. Requests whose validators still match get a 304
+before anything is fetched or serialized.
+"""
+import hashlib
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from .sharding import aggregate_across
+
+
+def validator_aggregates(fields):
+    """Aggregates whose per-shard results ``validators_from`` turns into validators."""
+    aggregates = {f'max_{i}': Max(field) for i, field in enumerate(fields)}
+    return {'rows': Count('pk'), **aggregates}
+
+
+def validators_from(parts):
+    """``(last_modified, etag)`` from the per-shard results of ``validator_aggregates``."""
+    rows = sum(part['rows'] for part in parts)
+    stamps = [value for part in parts for name, value in part.items() if name != 'rows' and value is not None]
+    last_modified = max(stamps, default=None)
+    version = f"{rows}:{last_modified.isoformat() if last_modified else '-'}"
+    return last_modified, quote_etag(hashlib.sha1(version.encode()).hexdigest())
+
+
+def not_modified(request, last_modified, etag):
+    """The 304 response when the request's validators still match, else None."""
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    return get_conditional_response(request, etag=etag, last_modified=timestamp)
+
+
+def set_validators(response, last_modified, etag, max_age=None):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(int(last_modified.timestamp()))
+    patch_cache_control(response, public=True, max_age=settings.CATALOG_CACHE_MAX_AGE if max_age is None else max_age)
+    return response
+
+
+class ConditionalGetMixin:
+    """
+    ``conditional_fields`` lists every timestamp the serialized output depends
+    on, including those of related rows shown by name (e.g. ``category__updated_at``).
+    """
+    conditional_fields = ('updated_at',)
+
+    def get_conditional_queryset(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup = self.lookup_url_kwarg or self.lookup_field
+        if lookup in self.kwargs:
+            queryset = queryset.filter(**{self.lookup_field: self.kwargs[lookup]})
+        return queryset.order_by()
+
+    def get_validators(self):
+        """``(last_modified, etag)`` of what this request would return."""
+        parts = aggregate_across(self.get_conditional_queryset(), **validator_aggregates(self.conditional_fields))
+        return self.finish_validators(*validators_from(parts))
+
+    def finish_validators(self, last_modified, etag):
+        """Hook for output that depends on more than the rows, e.g. the time of day."""
+        return last_modified, etag
+
+    def get_cache_max_age(self):
+        return settings.CATALOG_CACHE_MAX_AGE
+
+    def conditional_response(self, request, handler, *args, **kwargs):
+        last_modified, etag = self.get_validators()
+        response = not_modified(request, last_modified, etag)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        return set_validators(response, last_modified, etag, self.get_cache_max_age())
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(request, super().retrieve, *args, **kwargs)
@@ -0,0 +1,168 @@
+"""
+Estimated ready times.
+
+``refresh_prep_stats`` turns past PENDING->READY durations into a small
+``PrepTimeStat`` lookup table with vectorized NumPy group quantiles. At request
+time an ETA only needs that table (cached in memory) plus the canteen's queue
+depth, so the cost is O(items in the order) with no history scan.
+"""
+from bisect import bisect_left
+from datetime import timedelta
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import DurationField, ExpressionWrapper, F
+from django.utils import timezone
+import numpy as np
+
+from .models import Order, OrderItem, PrepTimeStat
+from .sharding import shard_aliases, use_shard
+
+logger = logging.getLogger(__name__)
+
+PREP_TABLE_CACHE_KEY = 'api:prep-time-table'
+ACTIVE_STATUSES = ('PENDING', 'PROCESSING')
+
+
+def grouped_quantiles(keys, values, quantiles):
+    """
+    Per-key linear-interpolated quantiles of ``values``.
+
+    Returns ``(unique_keys, counts, result)`` where ``result[i, j]`` is quantile
+    ``quantiles[j]`` of the values belonging to ``unique_keys[i]``.
+    """
+    order = np.lexsort((values, keys))
+    keys, values = keys[order], values[order]
+    unique_keys, starts, counts = np.unique(keys, return_index=True, return_counts=True)
+    positions = starts[:, None] + (counts[:, None] - 1) * np.asarray(quantiles)[None, :]
+    lower = np.floor(positions).astype(np.int64)
+    upper = np.ceil(positions).astype(np.int64)
+    weight = positions - lower
+    result = values[lower] * (1 - weight) + values[upper] * weight
+    return unique_keys, counts, result
+
+
+def _seconds(durations):
+    return np.fromiter((d.total_seconds() for d in durations), dtype=np.float64)
+
+
+def refresh_prep_stats(window_days=None, now=None):
+    """Rebuild ``PrepTimeStat`` from orders that became READY inside the rolling window."""
+    window_days = window_days or settings.PREP_STATS_WINDOW_DAYS
+    now = now or timezone.now()
+    total = 0
+    for alias in shard_aliases():
+        with use_shard(alias):
+            total += _refresh_shard_prep_stats(alias, window_days, now)
+    cache.delete(PREP_TABLE_CACHE_KEY)
+    return total
+
+
+def _refresh_shard_prep_stats(alias, window_days, now):
+    ready_orders = Order.objects.filter(ready_at__isnull=False, ready_at__gte=now - timedelta(days=window_days))
+    prep_time = ExpressionWrapper(F('ready_at') - F('created_at'), output_field=DurationField())
+    order_prep_time = ExpressionWrapper(F('order__ready_at') - F('order__created_at'), output_field=DurationField())
+    max_seconds = settings.PREP_STATS_MAX_SECONDS
+
+    order_rows = list(ready_orders.annotate(prep=prep_time).values_list('canteen_id', 'prep'))
+    item_rows = list(
+        OrderItem.objects.filter(order__in=ready_orders)
+        .annotate(prep=order_prep_time)
+        .values_list('order__canteen_id', 'menu_item_id', 'prep')
+    )
+
+    stats = []
+    if order_rows:
+        canteens = np.fromiter((row[0] for row in order_rows), dtype=np.int64)
+        seconds = _seconds(row[1] for row in order_rows)
+        keep = (seconds > 0) & (seconds <= max_seconds) # Drop clock skew and forgotten orders
+        if keep.any():
+            keys, counts, result = grouped_quantiles(canteens[keep], seconds[keep], [0.5, 0.9])
+            stats += [
+                PrepTimeStat(canteen_id=int(key), menu_item=None, sample_count=int(count),
+                             median_seconds=float(q[0]), p90_seconds=float(q[1]))
+                for key, count, q in zip(keys, counts, result)
+            ]
+    if item_rows:
+        item_canteen = {menu_item_id: canteen_id for canteen_id, menu_item_id, _ in item_rows}
+        items = np.fromiter((row[1] for row in item_rows), dtype=np.int64)
+        seconds = _seconds(row[2] for row in item_rows)
+        keep = (seconds > 0) & (seconds <= max_seconds)
+        if keep.any():
+            keys, counts, result = grouped_quantiles(items[keep], seconds[keep], [0.5, 0.9])
+            stats += [
+                PrepTimeStat(canteen_id=item_canteen[int(key)], menu_item_id=int(key), sample_count=int(count),
+                             median_seconds=float(q[0]), p90_seconds=float(q[1]))
+                for key, count, q in zip(keys, counts, result)
+            ]
+
+    with transaction.atomic(using=alias):
+        PrepTimeStat.objects.all().delete()
+        PrepTimeStat.objects.bulk_create(stats)
+    logger.info(f"Refreshed {len(stats)} prep time statistics from {len(order_rows)} orders on '{alias}'")
+    return len(stats)
+
+
+def get_prep_table():
+    """``{'items': {menu_item_id: seconds}, 'canteens': {canteen_id: seconds}}`` of median prep times."""
+    table = cache.get(PREP_TABLE_CACHE_KEY)
+    if table is None:
+        table = {'items': {}, 'canteens': {}}
+        for alias in shard_aliases():
+            for canteen_id, menu_item_id, median in PrepTimeStat.objects.using(alias).values_list(
+                'canteen_id', 'menu_item_id', 'median_seconds'
+            ):
+                if menu_item_id is None:
+                    table['canteens'][canteen_id] = median
+                else:
+                    table['items'][menu_item_id] = median
+        cache.set(PREP_TABLE_CACHE_KEY, table, settings.PREP_STATS_CACHE_SECONDS)
+    return table
+
+
+def queue_depth(order):
+    """Active orders of the same canteen that were placed before ``order``."""
+    return Order.objects.using(order._state.db).filter(
+        canteen_id=order.canteen_id, status__in=ACTIVE_STATUSES, created_at__lt=order.created_at
+    ).count()
+
+
+def queue_depths(orders):
+    """
+    ``{order id: queue_depth(order)}`` for the active ``orders``, with one query
+    per canteen instead of one per order (for lists of orders).
+    """
+    by_canteen = {}
+    for order in orders:
+        if order.status in ACTIVE_STATUSES:
+            by_canteen.setdefault((order._state.db, order.canteen_id), []).append(order)
+    depths = {}
+    for (alias, canteen_id), group in by_canteen.items():
+        placed = sorted(Order.objects.using(alias).filter(
+            canteen_id=canteen_id, status__in=ACTIVE_STATUSES, created_at__lt=max(o.created_at for o in group)
+        ).values_list('created_at', flat=True))
+        depths.update((order.pk, bisect_left(placed, order.created_at)) for order in group)
+    return depths
+
+
+def estimate_ready_at(order, menu_item_ids, queue_ahead, table=None, now=None):
+    """
+    Predict when ``order`` will be READY. Items are cooked in parallel, so an order
+    takes as long as its slowest item; orders ahead of it share the kitchen's
+    ``KITCHEN_PARALLELISM`` stations.
+    """
+    if order.status in ('READY', 'COMPLETED'):
+        return order.ready_at
+    if order.status not in ACTIVE_STATUSES:
+        return None
+    table = table or get_prep_table()
+    now = now or timezone.now()
+    per_order = table['canteens'].get(order.canteen_id, settings.ETA_DEFAULT_PREP_SECONDS)
+    prep = max((table['items'].get(item_id, per_order) for item_id in menu_item_ids), default=per_order)
+    if order.status == 'PROCESSING':
+        # updated_at was stamped when the kitchen started on the order
+        return max(now, order.updated_at + timedelta(seconds=prep))
+    wait = queue_ahead * per_order / settings.KITCHEN_PARALLELISM
+    return now + timedelta(seconds=wait + prep)
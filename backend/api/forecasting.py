@@ -0,0 +1,110 @@
+"""
+Hourly demand forecasts for kitchen prep.
+
+``forecast_demand`` streams a canteen's sold quantities per menu item, local
+date and hour (summed in the database, read in chunks) and folds each chunk
+into a menu item x weekday x hour array of exponentially decayed sums: a week
+older weighs ``0.5 ** (1 / FORECAST_HALF_LIFE_WEEKS)`` as much. Memory is set by
+the menu size, not by how many years of history are read.
+
+The forecast for an hour is that decayed sum over the matching weekday divided
+by the decayed number of such weekdays since the item first sold, i.e. a
+recency-weighted average that counts days without sales as zero.
+"""
+from datetime import datetime, time, timedelta
+from itertools import islice
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import ExtractHour, TruncDate
+from django.utils import timezone
+import numpy as np
+
+from .models import DemandForecast, MenuItem, OrderItem
+from .sharding import shard_for_canteen
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 20000
+
+
+def hourly_quantities(canteen_id, alias, since, until):
+    """``(menu_item_id, local date, hour, quantity)`` rows of uncancelled orders placed in ``[since, until)``."""
+    return (
+        OrderItem.objects.using(alias)
+        .filter(order__canteen_id=canteen_id, order__created_at__gte=since, order__created_at__lt=until)
+        .exclude(order__status='CANCELLED')
+        .annotate(day=TruncDate('order__created_at'), hour=ExtractHour('order__created_at'))
+        .values('menu_item_id', 'day', 'hour')
+        .annotate(quantity=Sum('quantity'))
+        .order_by()
+        .values_list('menu_item_id', 'day', 'hour', 'quantity')
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+
+def seasonal_profile(rows, item_ids, today, decay):
+    """
+    ``(sums, first_sold)``: decayed quantities per item x weekday x hour, and
+    each item's first sale as a date ordinal, from ``hourly_quantities`` rows.
+    """
+    sums = np.zeros((len(item_ids), 7, 24))
+    first_sold = np.full(len(item_ids), today.toordinal(), dtype=np.int64)
+    reference = today.toordinal()
+    while True:
+        chunk = list(islice(rows, CHUNK_SIZE))
+        if not chunk:
+            break
+        items = np.searchsorted(item_ids, np.fromiter((row[0] for row in chunk), dtype=np.int64, count=len(chunk)))
+        days = np.fromiter((row[1].toordinal() for row in chunk), dtype=np.int64, count=len(chunk))
+        hours = np.fromiter((row[2] for row in chunk), dtype=np.int64, count=len(chunk))
+        quantities = np.fromiter((row[3] for row in chunk), dtype=np.float64, count=len(chunk))
+        weekdays = (days - 1) % 7 # date.fromordinal(1) is a Monday
+        weights = decay ** ((reference - days) / 7)
+        np.add.at(sums, (items, weekdays, hours), quantities * weights)
+        np.minimum.at(first_sold, items, days)
+    return sums, first_sold
+
+
+def decayed_day_counts(first_sold, today, decay):
+    """Items x weekday: decayed number of past days of each weekday since the item first sold."""
+    # Age in days of the most recent past day of each weekday (1..7)
+    latest = (today.weekday() - np.arange(7) - 1) % 7 + 1
+    history = (today.toordinal() - first_sold)[:, None] # Oldest age per item
+    counts = np.where(history >= latest, (history - latest) // 7 + 1, 0)
+    return decay ** (latest / 7) * (1 - decay ** counts) / (1 - decay)
+
+
+def forecast_demand(canteen, days=1, weeks=None, today=None):
+    """Store forecasts for the ``days`` days after ``today``; returns the number of rows written."""
+    canteen_id = getattr(canteen, 'pk', canteen)
+    weeks = weeks or settings.FORECAST_HISTORY_WEEKS
+    today = today or timezone.localdate()
+    decay = 0.5 ** (1 / settings.FORECAST_HALF_LIFE_WEEKS)
+    alias = shard_for_canteen(canteen_id)
+
+    # Whole days only: today so far would read as a slow day
+    until = timezone.make_aware(datetime.combine(today, time.min))
+    since = until - timedelta(weeks=weeks)
+    item_ids = np.array(
+        sorted(MenuItem.objects.using(alias).filter(canteen_id=canteen_id).values_list('pk', flat=True)), dtype=np.int64,
+    )
+    sums, first_sold = seasonal_profile(hourly_quantities(canteen_id, alias, since, until), item_ids, today, decay)
+    expected = sums / np.maximum(decayed_day_counts(first_sold, today, decay), 1e-9)[:, :, None]
+
+    dates = [today + timedelta(days=n) for n in range(1, days + 1)]
+    forecasts = []
+    for date in dates:
+        items, hours = np.nonzero(expected[:, date.weekday(), :] >= settings.FORECAST_MIN_QUANTITY)
+        forecasts += [
+            DemandForecast(canteen_id=canteen_id, menu_item_id=int(item_ids[i]), date=date, hour=int(h),
+                           quantity=round(float(expected[i, date.weekday(), h]), 2))
+            for i, h in zip(items, hours)
+        ]
+    with transaction.atomic(using=alias):
+        DemandForecast.objects.using(alias).filter(canteen_id=canteen_id, date__in=dates).delete()
+        DemandForecast.objects.using(alias).bulk_create(forecasts, batch_size=5000)
+    logger.info(f"Stored {len(forecasts)} demand forecasts for canteen {canteen_id} ({dates[0]}..{dates[-1]})")
+    return len(forecasts)
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, must_update_salt
+
+
+class TunedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    Django's PBKDF2-SHA256 with the work factor from ``PASSWORD_HASH_ITERATIONS``,
+    never below Django's own default.
+
+    It keeps the ``pbkdf2_sha256`` algorithm name, so existing hashes still
+    verify. Hashes are only re-hashed on login when they are weaker than the
+    configured cost; a stronger hash is never traded for a cheaper one.
+    """
+
+    @property
+    def iterations(self):
+        return max(PBKDF2PasswordHasher.iterations, settings.PASSWORD_HASH_ITERATIONS)
+
+    def must_update(self, encoded):
+        decoded = self.decode(encoded)
+        return decoded['iterations'] < self.iterations or must_update_salt(decoded['salt'], self.salt_entropy)
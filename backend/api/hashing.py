@@ -0,0 +1,44 @@
+"""
+Password hashing off the request threads.
+
+Each signup hashes a password, which costs a few hundred milliseconds of CPU.
+During a signup spike every request thread would otherwise hash at the same
+time and starve the rest of the site. ``hash_password`` runs hashes on a pool
+of ``PASSWORD_HASH_WORKERS`` threads (hashlib releases the GIL, so they run in
+parallel) and turns callers away with ``HashingBusy`` once
+``PASSWORD_HASH_QUEUE`` more are waiting, so the view can answer 429 at once.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing pool and its queue are full."""
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_slots = None
+
+
+def _get_pool():
+    global _pool, _slots
+    with _pool_lock:
+        if _pool is None:
+            _slots = threading.BoundedSemaphore(settings.PASSWORD_HASH_WORKERS + settings.PASSWORD_HASH_QUEUE)
+            _pool = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix='password-hash')
+        return _pool
+
+
+def hash_password(raw_password):
+    """``make_password(raw_password)`` computed on the hashing pool."""
+    pool = _get_pool()
+    if not _slots.acquire(blocking=False):
+        raise HashingBusy("Too many signups in progress, please retry shortly.")
+    try:
+        return pool.submit(make_password, raw_password).result()
+    finally:
+        _slots.release()
@@ -0,0 +1,142 @@
+"""
+``Idempotency-Key`` support for endpoints that create orders or payments.
+
+The first request with a key inserts an ``IdempotencyRecord``; the unique
+(user, key) constraint doubles as the lock, so a concurrent duplicate never runs
+the handler again. It polls the record for up to ``IDEMPOTENCY_WAIT_SECONDS``
+and replays the first response once stored, or gets a 409 if that takes longer.
+Once the first response is rendered its exact bytes are stored and replayed to
+retries until the record expires. A first request that fails with a server
+error or an unhandled exception releases the key so it can be retried.
+"""
+from datetime import timedelta
+from functools import wraps
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyRecord
+
+IDEMPOTENCY_HEADER = 'HTTP_IDEMPOTENCY_KEY'
+
+
+def _fingerprint(request):
+    payload = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(f"{request.method} {request.path}\n{payload}".encode()).hexdigest()
+
+
+def _claim(user, key, endpoint, request_hash):
+    """Insert the record for ``key`` or return the existing one as ``(record, created)``."""
+    now = timezone.now()
+    stale_lock = now - timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT_SECONDS)
+    # Expired replays and locks left behind by a crashed worker no longer count
+    IdempotencyRecord.objects.filter(user=user, key=key).filter(
+        Q(expires_at__lte=now) | Q(status_code__isnull=True, created_at__lt=stale_lock)
+    ).delete()
+    try:
+        with transaction.atomic():
+            record = IdempotencyRecord.objects.create(
+                user=user, key=key, endpoint=endpoint, request_hash=request_hash,
+                expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL_SECONDS),
+            )
+        return record, True
+    except IntegrityError:
+        return IdempotencyRecord.objects.get(user=user, key=key), False
+
+
+def _matches(record, endpoint, request_hash):
+    return record.endpoint == endpoint and record.request_hash == request_hash
+
+
+def _claim_or_wait(user, key, endpoint, request_hash):
+    """``_claim``, then wait while another request with the same key and body is in flight."""
+    record, created = _claim(user, key, endpoint, request_hash)
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+    while (not created and record.status_code is None and _matches(record, endpoint, request_hash)
+           and time.monotonic() < deadline):
+        time.sleep(settings.IDEMPOTENCY_POLL_SECONDS)
+        try:
+            record.refresh_from_db(fields=['status_code', 'content_type', 'response_body'])
+        except IdempotencyRecord.DoesNotExist: # The first request failed and released the key
+            record, created = _claim(user, key, endpoint, request_hash)
+    return record, created
+
+
+def _release(request):
+    record = getattr(request, 'idempotency_record', None)
+    request.idempotency_record = None
+    if record is not None:
+        record.delete()
+
+
+def idempotent(handler):
+    """Decorate a view handler (``post``/``create``) to honour ``Idempotency-Key``."""
+    @wraps(handler)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.META.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return handler(self, request, *args, **kwargs)
+        if len(key) > 255:
+            return Response({"error": "Idempotency-Key is too long"}, status=status.HTTP_400_BAD_REQUEST)
+
+        request_hash = _fingerprint(request)
+        record, created = _claim_or_wait(request.user, key, request.path, request_hash)
+        if not created:
+            if not _matches(record, request.path, request_hash):
+                return Response(
+                    {"error": "Idempotency-Key was already used for a different request"},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                )
+            if record.status_code is None:
+                response = Response(
+                    {"error": "A request with this Idempotency-Key is still being processed"},
+                    status=status.HTTP_409_CONFLICT,
+                )
+                response['Retry-After'] = '1'
+                return response
+            response = HttpResponse(
+                bytes(record.response_body), status=record.status_code, content_type=record.content_type
+            )
+            response['Idempotent-Replayed'] = 'true'
+            return response
+
+        request.idempotency_record = record
+        return handler(self, request, *args, **kwargs)
+    return wrapper
+
+
+class IdempotencyMixin:
+    """Stores the rendered response for requests claimed by ``@idempotent`` handlers, or releases failed ones."""
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        record = getattr(request, 'idempotency_record', None)
+        if record is None:
+            return response
+        request.idempotency_record = None
+        if response.status_code >= 500:
+            record.delete() # Let the client retry a server failure
+            return response
+        if hasattr(response, 'render') and not response.is_rendered:
+            response.render()
+        record.status_code = response.status_code
+        record.content_type = response.get('Content-Type', '')
+        record.response_body = response.content
+        record.save(update_fields=['status_code', 'content_type', 'response_body'])
+        return response
+
+    def handle_exception(self, exc):
+        try:
+            return super().handle_exception(exc)
+        except Exception:
+            # Unhandled errors skip finalize_response; don't leave the key locked until the lock timeout
+            _release(self.request)
+            raise
@@ -0,0 +1,196 @@
+"""
+Stock tracking for menu items.
+
+All stock changes go through conditional ``F()`` updates so that concurrent
+buyers can never take the counter below zero: a decrement only matches the
+row while ``stock_remaining >= quantity``. Callers must run these helpers
+inside ``transaction.atomic()`` so a failed line rolls back earlier ones.
+
+A sold-out item is switched off until the daily reset. Sales reset the items
+they touch; menu reads call ``ensure_stock_rolled_over`` so items that are off
+(and so cannot be sold) come back on a new day too.
+"""
+from collections import defaultdict
+from datetime import timedelta
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+
+from .models import MenuItem, StockReservation
+from .sharding import current_shard, shard_aliases, use_shard
+
+logger = logging.getLogger(__name__)
+
+
+class OutOfStock(Exception):
+    """Raised when a menu item does not have enough stock left for a line."""
+
+    def __init__(self, menu_item):
+        self.menu_item = menu_item
+        super().__init__(f"'{menu_item.name}' is sold out or does not have enough stock left.")
+
+
+def aggregate_quantities(lines):
+    """Collapse ``(menu_item, quantity)`` pairs into ``{menu_item: quantity}``."""
+    totals = defaultdict(int)
+    for menu_item, quantity in lines:
+        totals[menu_item] += quantity
+    return dict(totals)
+
+
+def _roll_over(queryset, today):
+    return queryset.filter(daily_stock__isnull=False).exclude(stock_date=today).update(
+        # Items that sold out yesterday come back; manually disabled ones stay off.
+        is_available=Case(When(stock_remaining=0, then=Value(True)), default=F('is_available')),
+        stock_remaining=F('daily_stock'),
+        stock_date=today,
+        updated_at=timezone.now(),
+    )
+
+
+def roll_over_daily_stock(menu_items, today=None):
+    """Reset ``stock_remaining`` to ``daily_stock`` for items last sold on an earlier day."""
+    today = today or timezone.localdate()
+    stale_ids = [item.pk for item in menu_items if item.daily_stock is not None and item.stock_date != today]
+    if not stale_ids:
+        return 0
+    return _roll_over(MenuItem.objects.filter(pk__in=stale_ids), today)
+
+
+_rolled_over_on = None
+
+
+def roll_over_all_stock(today=None):
+    """``roll_over_daily_stock`` for every stock-tracked item on every shard; returns the number reset."""
+    today = today or timezone.localdate()
+    total = 0
+    for alias in shard_aliases():
+        with use_shard(alias):
+            total += _roll_over(MenuItem.objects.all(), today)
+    return total
+
+
+def ensure_stock_rolled_over():
+    """Run ``roll_over_all_stock`` once per process and day (one UPDATE per shard, then nothing)."""
+    global _rolled_over_on
+    today = timezone.localdate()
+    if _rolled_over_on != today:
+        roll_over_all_stock(today)
+        _rolled_over_on = today
+
+
+def decrement_stock(quantities):
+    """
+    Take ``{menu_item: quantity}`` out of stock, raising ``OutOfStock`` on the first
+    line that cannot be satisfied. Items without stock tracking are ignored.
+    """
+    tracked = sorted((item for item in quantities if item.is_stock_tracked), key=lambda item: item.pk)
+    if not tracked:
+        return
+    roll_over_daily_stock(tracked)
+    # Lock rows in primary key order so parallel orders cannot deadlock.
+    for menu_item in tracked:
+        quantity = quantities[menu_item]
+        updated = MenuItem.objects.filter(pk=menu_item.pk, stock_remaining__gte=quantity).update(
+            stock_remaining=F('stock_remaining') - quantity, updated_at=timezone.now()
+        )
+        if not updated:
+            raise OutOfStock(menu_item)
+    MenuItem.objects.filter(pk__in=[item.pk for item in tracked], stock_remaining=0, is_available=True) \
+        .update(is_available=False, updated_at=timezone.now())
+
+
+def restock(quantities):
+    """Put ``{menu_item_id: quantity}`` back into today's stock."""
+    today = timezone.localdate()
+    for menu_item_id, quantity in sorted(quantities.items()):
+        # Stock held against an earlier day was already replaced by the daily reset.
+        MenuItem.objects.filter(pk=menu_item_id, stock_remaining__isnull=False) \
+            .filter(Q(daily_stock__isnull=True) | Q(stock_date=today)) \
+            .update(
+                is_available=Case(When(stock_remaining=0, then=Value(True)), default=F('is_available')),
+                stock_remaining=F('stock_remaining') + quantity,
+                updated_at=timezone.now(),
+            )
+
+
+def reserve_stock(customer, razorpay_order_id, quantities):
+    """
+    Decrement stock for a checkout and record the hold so it can be consumed by
+    ``VerifyPaymentView`` or released once the payment window expires.
+    """
+    release_expired_reservations()
+    ttl = timedelta(seconds=settings.STOCK_RESERVATION_TTL_SECONDS)
+    with transaction.atomic(using=current_shard()):
+        decrement_stock(quantities)
+        expires_at = timezone.now() + ttl
+        StockReservation.objects.bulk_create([
+            StockReservation(
+                menu_item=menu_item,
+                customer=customer,
+                razorpay_order_id=razorpay_order_id,
+                quantity=quantity,
+                expires_at=expires_at,
+            )
+            for menu_item, quantity in quantities.items()
+            if menu_item.is_stock_tracked
+        ])
+
+
+def consume_reservation(customer, razorpay_order_id):
+    """
+    Claim the stock held for a paid Razorpay order. Returns ``{menu_item_id: quantity}``
+    for whatever was still held; expired holds that were already released are absent.
+    """
+    with transaction.atomic(using=current_shard()):
+        reservations = list(
+            StockReservation.objects.select_for_update()
+            .filter(customer=customer, razorpay_order_id=razorpay_order_id)
+        )
+        held = defaultdict(int)
+        for reservation in reservations:
+            held[reservation.menu_item_id] += reservation.quantity
+        StockReservation.objects.filter(pk__in=[r.pk for r in reservations]).delete()
+    return dict(held)
+
+
+def commit_paid_order(customer, razorpay_order_id, quantities):
+    """
+    Settle stock for a verified payment: use the reservation where one exists and
+    decrement directly for anything that was not (or is no longer) held.
+    """
+    held = consume_reservation(customer, razorpay_order_id)
+    shortfall = {}
+    for menu_item, quantity in quantities.items():
+        still_needed = quantity - held.pop(menu_item.pk, 0)
+        if still_needed > 0:
+            shortfall[menu_item] = still_needed
+        elif still_needed < 0:
+            held[menu_item.pk] = -still_needed
+    decrement_stock(shortfall)
+    if held:
+        # The cart shrank between checkout and verification.
+        restock(held)
+
+
+def release_expired_reservations(now=None, batch_size=500):
+    """Return stock held by abandoned checkouts. Safe to call from several workers."""
+    now = now or timezone.now()
+    with transaction.atomic(using=current_shard()):
+        expired = list(
+            StockReservation.objects.select_for_update(skip_locked=True)
+            .filter(expires_at__lte=now)
+            .values_list('pk', 'menu_item_id', 'quantity')[:batch_size]
+        )
+        if not expired:
+            return 0
+        StockReservation.objects.filter(pk__in=[pk for pk, _, _ in expired]).delete()
+        released = defaultdict(int)
+        for _, menu_item_id, quantity in expired:
+            released[menu_item_id] += quantity
+        restock(released)
+    logger.info(f"Released {len(expired)} expired stock reservations")
+    return len(expired)
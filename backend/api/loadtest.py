@@ -0,0 +1,331 @@
+"""
+In-process load testing.
+
+``run_load`` drives the real ``canteen_backend.wsgi`` or ``canteen_backend.asgi``
+application (middleware, auth, throttling, database and all) from worker
+threads without a web server, so latencies cover everything but the network
+and the server's worker model. Each virtual customer browses the menu, pays
+through ``FakeGateway``, polls its order and has an admin move it to
+completion. Data lives in canteens and users named ``loadtest-*``; the staff
+user is deleted again after every run (``retire_admin``).
+
+Customers send their requests from their own addresses, as on a campus
+network, so the per-IP throttles see many clients rather than one.
+"""
+import asyncio
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from io import BytesIO
+import json
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+import uuid
+from wsgiref.util import setup_testing_defaults
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connections
+import numpy as np
+from rest_framework.authtoken.models import Token
+
+from .models import Canteen, Category, MenuItem
+from .payments import FakeGateway
+
+PREFIX = 'loadtest'
+ADMIN_FLOW = ('PROCESSING', 'READY', 'COMPLETED')
+
+
+def seed(canteens=2, items=25, customers=50):
+    """Create (or reuse) the load-test canteens, menu and users; returns what the flows need."""
+    fixture = {'menus': {}, 'customers': [], 'admin': None}
+    for c in range(canteens):
+        canteen, _ = Canteen.objects.get_or_create(name=f"{PREFIX}-canteen-{c}")
+        category, _ = Category.objects.get_or_create(name=f"{PREFIX}-category-{c}")
+        menu = []
+        for i in range(items):
+            item, _ = MenuItem.objects.get_or_create(
+                canteen=canteen, name=f"{PREFIX}-item-{c}-{i}",
+                defaults={'category': category, 'price': Decimal(10 + (i * 7) % 90)},
+            )
+            menu.append((item.id, item.price))
+        fixture['menus'][canteen.id] = menu
+
+    for n in range(customers):
+        user, created = User.objects.get_or_create(username=f"{PREFIX}-customer-{n}")
+        if created:
+            user.set_unusable_password()
+            user.save(update_fields=['password'])
+        fixture['customers'].append(Token.objects.get_or_create(user=user)[0].key)
+    admin, _ = User.objects.get_or_create(username=f"{PREFIX}-admin", defaults={'is_staff': True})
+    fixture['admin'] = Token.objects.get_or_create(user=admin)[0].key
+    return fixture
+
+
+def retire_admin():
+    """Delete the staff user ``seed`` creates (and its token) so it never outlives a run."""
+    User.objects.filter(username=f"{PREFIX}-admin").delete()
+
+
+def cleanup():
+    """Delete everything ``seed`` created, including the orders placed against it."""
+    User.objects.filter(username__startswith=f"{PREFIX}-").delete()
+    Canteen.objects.filter(name__startswith=f"{PREFIX}-").delete()
+    Category.objects.filter(name__startswith=f"{PREFIX}-").delete()
+
+
+def _default_host():
+    hosts = [host.lstrip('.') for host in settings.ALLOWED_HOSTS if host != '*']
+    return hosts[0] if hosts else 'localhost'
+
+
+class WSGIDriver:
+    def __init__(self, application, host=None):
+        self.application = application
+        self.host = host or _default_host()
+
+    def request(self, method, path, data=None, token=None, headers=None, client_ip='127.0.0.1'):
+        body = json.dumps(data).encode() if data is not None else b''
+        url = urlsplit(path)
+        environ = {
+            'REMOTE_ADDR': client_ip,
+            'REQUEST_METHOD': method,
+            'PATH_INFO': url.path,
+            'QUERY_STRING': url.query,
+            'HTTP_HOST': self.host,
+            'SERVER_NAME': self.host,
+            'CONTENT_TYPE': 'application/json',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.input': BytesIO(body),
+            'wsgi.url_scheme': 'https',
+        }
+        setup_testing_defaults(environ)
+        if token:
+            environ['HTTP_AUTHORIZATION'] = f"Token {token}"
+        for name, value in (headers or {}).items():
+            environ['HTTP_' + name.upper().replace('-', '_')] = value
+
+        status = []
+        result = self.application(environ, lambda s, h, exc_info=None: status.append(int(s.split()[0])))
+        try:
+            content = b''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return status[0], content
+
+
+class ASGIDriver:
+    """Runs the ASGI application on one event loop per worker thread."""
+
+    def __init__(self, application, host=None):
+        self.application = application
+        self.host = host or _default_host()
+        self._local = threading.local()
+
+    def request(self, method, path, data=None, token=None, headers=None, client_ip='127.0.0.1'):
+        loop = getattr(self._local, 'loop', None)
+        if loop is None:
+            loop = self._local.loop = asyncio.new_event_loop()
+        return loop.run_until_complete(self._request(method, path, data, token, headers or {}, client_ip))
+
+    async def _request(self, method, path, data, token, headers, client_ip):
+        body = json.dumps(data).encode() if data is not None else b''
+        url = urlsplit(path)
+        raw_headers = [(b'host', self.host.encode()), (b'content-type', b'application/json'),
+                       (b'content-length', str(len(body)).encode())]
+        if token:
+            raw_headers.append((b'authorization', f"Token {token}".encode()))
+        raw_headers += [(name.lower().encode(), value.encode()) for name, value in headers.items()]
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'scheme': 'https',
+            'method': method, 'path': url.path, 'raw_path': url.path.encode(),
+            'query_string': url.query.encode(), 'headers': raw_headers,
+            'client': (client_ip, 0), 'server': (self.host, 443),
+        }
+        sent, finished = False, asyncio.Event()
+        status, chunks = None, []
+
+        async def receive():
+            nonlocal sent
+            if sent:
+                # Django treats an early disconnect as an aborted request
+                await finished.wait()
+                return {'type': 'http.disconnect'}
+            sent = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+
+        async def send(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            elif message['type'] == 'http.response.body':
+                chunks.append(message.get('body', b''))
+                if not message.get('more_body'):
+                    finished.set()
+
+        await self.application(scope, receive, send)
+        return status, b''.join(chunks)
+
+    def close(self):
+        loop = getattr(self._local, 'loop', None)
+        if loop is not None:
+            loop.close()
+            self._local.loop = None
+
+
+class Recorder:
+    """Latencies and status codes per endpoint, shared by all workers."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def call(self, driver, endpoint, method, path, **kwargs):
+        started = time.perf_counter()
+        status, content = driver.request(method, path, **kwargs)
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.latencies[endpoint].append(elapsed)
+            self.statuses[endpoint][status] += 1
+        try:
+            return status, json.loads(content) if content else None
+        except ValueError:
+            return status, None
+
+    def report(self, wall_time):
+        """One row per endpoint: requests, 5xx responses, throughput and latency percentiles in ms."""
+        rows = []
+        for endpoint in sorted(self.latencies):
+            samples = np.array(self.latencies[endpoint]) * 1000
+            p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+            statuses = self.statuses[endpoint]
+            rows.append({
+                'endpoint': endpoint,
+                'requests': len(samples),
+                'errors': sum(count for status, count in statuses.items() if status >= 500),
+                'statuses': dict(sorted(statuses.items())),
+                'rps': len(samples) / wall_time if wall_time else 0.0,
+                'p50': p50, 'p95': p95, 'p99': p99,
+            })
+        return rows
+
+
+def customer_ip(n):
+    """A stable private address for the ``n``th seeded customer."""
+    host = n + 1 # 10.0.0.0 is the network address
+    return f"10.{host >> 16 & 255}.{host >> 8 & 255}.{host & 255}"
+
+
+def customer_flow(driver, recorder, fixture, rng, polls=3):
+    """One customer journey; returns True when the order made it to COMPLETED."""
+    n = rng.randrange(len(fixture['customers']))
+    token, client_ip = fixture['customers'][n], customer_ip(n)
+    canteen_id = rng.choice(list(fixture['menus']))
+    recorder.call(driver, 'GET /api/canteens/', 'GET', '/api/canteens/', token=token, client_ip=client_ip)
+    recorder.call(
+        driver, 'GET /api/menu-items/', 'GET', f'/api/menu-items/?canteen={canteen_id}', token=token,
+        client_ip=client_ip,
+    )
+
+    cart = rng.sample(fixture['menus'][canteen_id], k=min(3, len(fixture['menus'][canteen_id])))
+    items = [{'menu_item_id': item_id, 'quantity': rng.randint(1, 3)} for item_id, _ in cart]
+    total = sum(price * line['quantity'] for (_, price), line in zip(cart, items))
+    status, created = recorder.call(
+        driver, 'POST /api/payment/create-razorpay-order/', 'POST', '/api/payment/create-razorpay-order/',
+        data={'amount': int(total * 100), 'canteen': canteen_id, 'items': items}, token=token,
+        headers={'Idempotency-Key': uuid.uuid4().hex}, client_ip=client_ip,
+    )
+    if status != 201:
+        return False
+
+    payment, signature = FakeGateway().capture(created['order_id'])
+    status, verified = recorder.call(
+        driver, 'POST /api/payment/verify-payment/', 'POST', '/api/payment/verify-payment/',
+        data={
+            'razorpay_order_id': created['order_id'], 'razorpay_payment_id': payment['id'],
+            'razorpay_signature': signature,
+            'local_order_details': {'canteen': canteen_id, 'items': items},
+        },
+        token=token, headers={'Idempotency-Key': uuid.uuid4().hex}, client_ip=client_ip,
+    )
+    if status != 201:
+        return False
+
+    order_id = verified['orderId']
+    for _ in range(polls):
+        recorder.call(
+            driver, 'GET /api/orders/{id}/status/', 'GET', f'/api/orders/{order_id}/status/', token=token,
+            client_ip=client_ip,
+        )
+    for new_status in ADMIN_FLOW:
+        status, _ = recorder.call(
+            driver, 'PATCH /api/admin/orders/{id}/', 'PATCH', f'/api/admin/orders/{order_id}/',
+            data={'status': new_status}, token=fixture['admin'],
+        )
+        if status != 200:
+            return False
+    return True
+
+
+def signup_flow(driver, recorder, fixture, rng, polls=0):
+    """One registration from its own address, as during a start-of-semester rush."""
+    name = f"{PREFIX}-signup-{uuid.uuid4().hex[:12]}"
+    status, _ = recorder.call(
+        driver, 'POST /api/register/', 'POST', '/api/register/',
+        data={'username': name, 'email': f"{name}@example.com", 'password': 'Kettle-Samosa-42',
+              'password2': 'Kettle-Samosa-42'},
+        client_ip=f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}",
+    )
+    return status == 201
+
+
+FLOWS = {'order': customer_flow, 'signup': signup_flow}
+
+
+def run_load(driver, fixture, concurrency=10, duration=None, iterations=None, polls=3, seed_value=None,
+             flow=customer_flow):
+    """
+    Run ``flow`` (``customer_flow`` by default) on ``concurrency`` threads until ``duration`` seconds
+    have passed or ``iterations`` flows have started. Returns
+    ``(report rows, completed flows, failed flows, wall time)``.
+    """
+    if duration is None and iterations is None:
+        raise ValueError("Give a duration or a number of iterations")
+    recorder = Recorder()
+    deadline = time.perf_counter() + duration if duration is not None else None
+    remaining = iter(range(iterations)) if iterations is not None else None
+    lock = threading.Lock()
+    outcomes = []
+
+    def next_flow():
+        if deadline is not None and time.perf_counter() >= deadline:
+            return False
+        if remaining is not None:
+            with lock:
+                return next(remaining, None) is not None
+        return True
+
+    def worker(index):
+        rng = random.Random(None if seed_value is None else seed_value + index)
+        try:
+            while next_flow():
+                try:
+                    ok = flow(driver, recorder, fixture, rng, polls)
+                except Exception:
+                    ok = False
+                with lock:
+                    outcomes.append(ok)
+        finally:
+            if hasattr(driver, 'close'):
+                driver.close()
+            connections.close_all()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    wall_time = time.perf_counter() - started
+    return recorder.report(wall_time), outcomes.count(True), outcomes.count(False), wall_time
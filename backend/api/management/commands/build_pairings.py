@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import Canteen
+from api.recommendations import build_pairings
+
+
+class Command(BaseCommand):
+    help = (
+        "Add orders placed since the last run to each canteen's item co-occurrence matrix and store the "
+        "top pairings used for \"frequently ordered together\" recommendations."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--canteen', type=int, action='append', default=None,
+                            help="Only this canteen id (repeatable; default: all canteens).")
+        parser.add_argument('--rebuild', action='store_true',
+                            help="Recount every order instead of only the new ones.")
+        parser.add_argument('--top-k', type=int, default=None, help="Neighbours kept per item (default: PAIRING_TOP_K).")
+        parser.add_argument('--min-orders', type=int, default=None,
+                            help="Orders two items must share to be paired (default: PAIRING_MIN_ORDERS).")
+
+    def handle(self, *args, **options):
+        if options['top_k'] is not None and options['top_k'] < 1:
+            raise CommandError("--top-k must be at least 1")
+        canteen_ids = options['canteen'] or list(Canteen.objects.order_by('pk').values_list('pk', flat=True))
+        total = 0
+        for canteen_id in canteen_ids:
+            total += build_pairings(
+                canteen_id, rebuild=options['rebuild'], top_k=options['top_k'], min_orders=options['min_orders'],
+            )
+        self.stdout.write(self.style.SUCCESS(f"Stored {total} pairings for {len(canteen_ids)} canteens."))
@@ -0,0 +1,33 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+
+from api.notifications import Dispatcher
+
+
+class Command(BaseCommand):
+    help = "Deliver queued order notifications (email, web push, webhooks), polling until stopped."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Deliver what is due now and exit.")
+        parser.add_argument('--poll', type=float, default=None,
+                            help="Seconds between polls (default: NOTIFICATION_POLL_SECONDS).")
+
+    def handle(self, *args, **options):
+        dispatcher = Dispatcher()
+        if not dispatcher.channels:
+            self.stdout.write(self.style.WARNING("No notification channels configured."))
+            return
+        try:
+            if options['once']:
+                sent, failed = dispatcher.run_once()
+                self.stdout.write(self.style.SUCCESS(f"Sent {sent} notifications, {failed} failed attempts."))
+                return
+            stop = threading.Event()
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(signum, lambda *_: stop.set())
+            self.stdout.write(f"Dispatching via {', '.join(dispatcher.channels)}.")
+            dispatcher.run(options['poll'], stop)
+        finally:
+            dispatcher.close()
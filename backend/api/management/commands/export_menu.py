@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from api.menu_io import export_rows, write_rows
+
+
+class Command(BaseCommand):
+    help = "Write menu items as CSV or JSON in the format import_menu reads."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--canteen', type=int, action='append', help="Only this canteen (repeatable).")
+        parser.add_argument('--format', choices=['csv', 'json'], default='json')
+        parser.add_argument('--output', default='-', help="File to write (default: stdout).")
+
+    def handle(self, *args, **options):
+        rows = export_rows(options['canteen'])
+        if options['output'] == '-':
+            write_rows(rows, self.stdout, options['format'])
+            return
+        with open(options['output'], 'w', encoding='utf-8', newline='') as f:
+            write_rows(rows, f, options['format'])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
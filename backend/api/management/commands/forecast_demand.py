@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.forecasting import forecast_demand
+from api.models import Canteen
+
+
+class Command(BaseCommand):
+    help = "Forecast each menu item's demand per hour for the coming days from the order history."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--canteen', type=int, action='append', default=None,
+                            help="Only this canteen id (repeatable; default: all canteens).")
+        parser.add_argument('--days', type=int, default=1, help="Days after today to forecast (1-7, default: 1).")
+        parser.add_argument('--weeks', type=int, default=None,
+                            help="Weeks of history to read (default: FORECAST_HISTORY_WEEKS).")
+
+    def handle(self, *args, **options):
+        if not 1 <= options['days'] <= 7:
+            raise CommandError("--days must be between 1 and 7")
+        canteen_ids = options['canteen'] or list(Canteen.objects.order_by('pk').values_list('pk', flat=True))
+        total = sum(forecast_demand(canteen_id, days=options['days'], weeks=options['weeks']) for canteen_id in canteen_ids)
+        self.stdout.write(self.style.SUCCESS(f"Stored {total} hourly forecasts for {len(canteen_ids)} canteens."))
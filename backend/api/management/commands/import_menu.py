@@ -0,0 +1,34 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.menu_io import MenuImportError, import_menu, parse_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Upsert menu items from a CSV or JSON file (flat rows or a dumpdata fixture such as data_dump.json), "
+        "applying only the differences in one transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'json'], default=None, help="Default: from the file extension.")
+        parser.add_argument('--prune', action='store_true',
+                            help="Mark items of the imported canteens that the file does not list unavailable.")
+        parser.add_argument('--dry-run', action='store_true', help="Report the changes without applying them.")
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or ('csv' if options['path'].lower().endswith('.csv') else 'json')
+        try:
+            with open(options['path'], encoding='utf-8') as f:
+                rows = parse_rows(f.read(), fmt)
+            counts = import_menu(rows, prune=options['prune'], dry_run=options['dry_run'])
+        except OSError as e:
+            raise CommandError(str(e))
+        except MenuImportError as e:
+            for error in e.errors:
+                self.stderr.write(f"Row {error['row']}: {json.dumps(error['errors'])}")
+            raise CommandError(str(e))
+        summary = ', '.join(f"{count} {kind}" for kind, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f"{'Would apply' if options['dry_run'] else 'Applied'}: {summary}."))
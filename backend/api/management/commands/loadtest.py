@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from api.loadtest import FLOWS, ASGIDriver, WSGIDriver, cleanup, retire_admin, run_load, seed
+from api.payments import FakeGateway
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed loadtest-* data and drive browse -> pay -> verify -> poll -> admin status changes "
+        "through the WSGI or ASGI application, reporting latency percentiles and throughput per endpoint. "
+        "Payments use the in-process FakeGateway; orders are real rows in the configured database. "
+        "The staff user driving the admin steps is deleted after every run. "
+        "--flow signup benchmarks registrations instead."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--app', choices=['wsgi', 'asgi'], default='wsgi', help="Application to drive.")
+        parser.add_argument('--flow', choices=sorted(FLOWS), default='order',
+                            help="order: the full customer journey; signup: registrations only.")
+        parser.add_argument('--concurrency', type=int, default=10, help="Parallel virtual customers.")
+        parser.add_argument('--duration', type=float, default=None, help="Seconds to run (default: 30).")
+        parser.add_argument('--iterations', type=int, default=None, help="Run this many flows instead of a duration.")
+        parser.add_argument('--polls', type=int, default=3, help="Order status polls per flow.")
+        parser.add_argument('--canteens', type=int, default=2)
+        parser.add_argument('--items', type=int, default=25, help="Menu items per canteen.")
+        parser.add_argument('--customers', type=int, default=50)
+        parser.add_argument('--host', default=None, help="Host header (default: first ALLOWED_HOSTS entry).")
+        parser.add_argument('--seed', type=int, default=None, help="Random seed for reproducible carts.")
+        parser.add_argument('--cleanup', action='store_true', help="Delete the loadtest-* data afterwards.")
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1:
+            raise CommandError("--concurrency must be at least 1")
+        duration = options['duration']
+        if duration is None and options['iterations'] is None:
+            duration = 30.0
+
+        if options['app'] == 'asgi':
+            from canteen_backend.asgi import application
+            driver = ASGIDriver(application, host=options['host'])
+        else:
+            from canteen_backend.wsgi import application
+            driver = WSGIDriver(application, host=options['host'])
+
+        FakeGateway.reset()
+        try:
+            fixture = seed(options['canteens'], options['items'], options['customers'])
+            with override_settings(PAYMENT_GATEWAY='api.payments.FakeGateway'):
+                rows, completed, failed, wall_time = run_load(
+                    driver, fixture, concurrency=options['concurrency'], duration=duration,
+                    iterations=options['iterations'], polls=options['polls'], seed_value=options['seed'],
+                    flow=FLOWS[options['flow']],
+                )
+        finally:
+            FakeGateway.reset()
+            retire_admin()
+            if options['cleanup']:
+                cleanup()
+
+        self.stdout.write(
+            f"{options['app'].upper()}, {options['concurrency']} workers, {wall_time:.1f}s: "
+            f"{completed} flows completed, {failed} failed ({completed / wall_time:.1f} flows/s)"
+        )
+        header = f"{'endpoint':<44} {'reqs':>6} {'5xx':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}  statuses"
+        self.stdout.write(header)
+        for row in rows:
+            statuses = ' '.join(f"{status}:{count}" for status, count in row['statuses'].items())
+            self.stdout.write(
+                f"{row['endpoint']:<44} {row['requests']:>6} {row['errors']:>5} {row['rps']:>8.1f} "
+                f"{row['p50']:>8.1f} {row['p95']:>8.1f} {row['p99']:>8.1f}  {statuses}"
+            )
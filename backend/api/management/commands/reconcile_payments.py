@@ -0,0 +1,167 @@
+import csv
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from api.models import CheckoutCart, Order
+from api.payments import PaymentNotFound, get_gateway
+from api.sharding import shard_aliases
+
+COLUMNS = ['kind', 'payment_id', 'gateway_order_id', 'order_id', 'payment_status', 'gateway_amount', 'order_amount']
+
+
+def _parse_day(value, name):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f"--{name} must be YYYY-MM-DD")
+
+
+def _paise(amount):
+    return int((Decimal(amount) * 100).to_integral_value())
+
+
+class Command(BaseCommand):
+    help = (
+        "Match gateway payments of a date range against orders and write the discrepancies as CSV. "
+        "Payments are read a page at a time with one indexed order lookup per page and shard; "
+        "orders are then checked a page at a time against the payments of their stretch of time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='start', default=None, help="First day (YYYY-MM-DD, default: yesterday).")
+        parser.add_argument('--to', dest='end', default=None, help="Last day, inclusive (default: --from).")
+        parser.add_argument('--page-size', type=int, default=100, help="Gateway payments fetched per page.")
+        parser.add_argument('--output', default='-', help="CSV file for the report (default: stdout).")
+
+    def handle(self, *args, **options):
+        first = _parse_day(options['start'], 'from') if options['start'] else timezone.localdate() - timedelta(days=1)
+        last = _parse_day(options['end'], 'to') if options['end'] else first
+        if last < first:
+            raise CommandError("--to must not be before --from")
+        start = timezone.make_aware(datetime.combine(first, time.min))
+        end = timezone.make_aware(datetime.combine(last + timedelta(days=1), time.min))
+
+        to_stdout = options['output'] == '-'
+        stream = self.stdout if to_stdout else open(options['output'], 'w', newline='')
+        try:
+            writer = csv.writer(stream, lineterminator='\n')
+            writer.writerow(COLUMNS)
+            counts = self._reconcile(writer, start, end, options['page_size'])
+        finally:
+            if not to_stdout:
+                stream.close()
+
+        summary = ', '.join(f"{count} {kind}" for kind, count in sorted(counts.items())) or "no discrepancies"
+        # Keep stdout clean when the report itself is written there
+        (self.stderr if to_stdout else self.stdout).write(f"Reconciled {first} to {last}: {summary}.")
+
+    def _reconcile(self, writer, start, end, page_size):
+        counts = defaultdict(int)
+        gateway = get_gateway()
+
+        def report(kind, payment=None, gateway_order_id=None, order=None):
+            counts[kind] += 1
+            writer.writerow([
+                kind,
+                payment['id'] if payment else '',
+                gateway_order_id or '',
+                order['pk'] if order else '',
+                payment['status'] if payment else '',
+                payment['amount'] if payment else '',
+                _paise(order['total_price']) if order else '',
+            ])
+
+        for page in gateway.iter_payments(start, end, page_size=page_size):
+            orders, failed = self._orders_for(page)
+            for payment in page:
+                gateway_order_id = payment['order_id']
+                if not gateway_order_id:
+                    continue # Not a checkout payment
+                matched = orders.get(gateway_order_id, [])
+                order = next((o for o in matched if o['razorpay_payment_id'] == payment['id']), None)
+
+                if payment['status'] != 'captured':
+                    # Failed attempts before a successful retry are normal; only a
+                    # payment an order was created from must stay captured.
+                    if order is not None:
+                        report('payment_not_captured', payment, gateway_order_id, order)
+                elif not matched:
+                    # order_failed: verification kept the cart because the order could not be filled
+                    report('order_failed' if gateway_order_id in failed else 'missing_order', payment, gateway_order_id)
+                elif order is None:
+                    report('payment_id_mismatch', payment, gateway_order_id, matched[0])
+                elif payment['amount'] != _paise(order['total_price']):
+                    report('amount_mismatch', payment, gateway_order_id, order)
+
+        # Nothing is carried over from the payment pages: orders are read in created_at
+        # order, a page at a time, and matched against the payments of that page's stretch
+        # of time, so memory does not grow with the range.
+        for alias in shard_aliases():
+            orders = (
+                Order.objects.using(alias)
+                .filter(created_at__gte=start, created_at__lt=end, razorpay_order_id__isnull=False)
+                .order_by('created_at', 'pk')
+                .values('pk', 'razorpay_order_id', 'razorpay_payment_id', 'total_price', 'created_at')
+                .iterator(chunk_size=page_size)
+            )
+            while page := list(islice(orders, page_size)):
+                for order in self._unpaid(gateway, page, page_size):
+                    report('missing_payment', gateway_order_id=order['razorpay_order_id'], order=order)
+        return counts
+
+    def _unpaid(self, gateway, orders, page_size):
+        """
+        The orders of one page (in created_at order) without a gateway payment.
+
+        A payment is made before its order, usually within the payment window, so
+        the payments from a window before the page's first order up to its last are
+        fetched; an order verified later than that has its payment looked up by id.
+        """
+        window = timedelta(seconds=settings.STOCK_RESERVATION_TTL_SECONDS)
+        paid = {
+            payment['order_id']
+            for payments in gateway.iter_payments(
+                orders[0]['created_at'] - window, orders[-1]['created_at'] + timedelta(seconds=1), page_size=page_size,
+            )
+            for payment in payments
+        }
+        for order in orders:
+            if order['razorpay_order_id'] in paid:
+                continue
+            if order['razorpay_payment_id']:
+                try:
+                    payment = gateway.fetch_payment(order['razorpay_payment_id'])
+                except PaymentNotFound:
+                    payment = None
+                if payment and payment['order_id'] == order['razorpay_order_id']:
+                    continue
+            yield order
+
+    def _orders_for(self, page):
+        """
+        Orders of one page of payments, by gateway order id, and the ids of the page's
+        failed checkouts: one ``IN`` query per shard, and one more for unmatched ids.
+        """
+        gateway_order_ids = {payment['order_id'] for payment in page if payment['order_id']}
+        orders, failed = defaultdict(list), set()
+        if not gateway_order_ids:
+            return orders, failed
+        for alias in shard_aliases():
+            rows = Order.objects.using(alias).filter(razorpay_order_id__in=gateway_order_ids) \
+                .values('pk', 'razorpay_order_id', 'razorpay_payment_id', 'total_price')
+            for row in rows:
+                orders[row['razorpay_order_id']].append(row)
+        unmatched = gateway_order_ids - set(orders)
+        if unmatched:
+            for alias in shard_aliases():
+                failed.update(
+                    CheckoutCart.objects.using(alias).filter(razorpay_order_id__in=unmatched, status='FAILED')
+                    .values_list('razorpay_order_id', flat=True)
+                )
+        return orders, failed
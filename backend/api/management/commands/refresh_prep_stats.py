@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from api.eta import refresh_prep_stats
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-menu-item prep time table used for order ETAs."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help="Rolling window of READY orders to learn from (default: PREP_STATS_WINDOW_DAYS).")
+
+    def handle(self, *args, **options):
+        count = refresh_prep_stats(window_days=options['days'])
+        self.stdout.write(self.style.SUCCESS(f"Stored {count} prep time statistics."))
@@ -0,0 +1,32 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.inventory import release_expired_reservations
+from api.models import CheckoutCart
+from api.scheduling import release_expired_checkout_slots
+from api.sharding import shard_aliases, use_shard
+
+
+class Command(BaseCommand):
+    help = (
+        "Return stock and pickup slots held by checkouts whose payment window has expired "
+        "and drop carts too old to verify; carts of payments whose order failed are kept for refunds."
+    )
+
+    def handle(self, *args, **options):
+        total = purged = 0
+        cutoff = timezone.now() - timedelta(seconds=settings.CHECKOUT_CART_TTL_SECONDS)
+        for alias in shard_aliases():
+            with use_shard(alias):
+                while True:
+                    released = release_expired_reservations()
+                    if not released:
+                        break
+                    total += released
+                while release_expired_checkout_slots():
+                    pass
+                purged += CheckoutCart.objects.filter(created_at__lte=cutoff, status='OPEN').delete()[0]
+        self.stdout.write(self.style.SUCCESS(f"Released {total} expired reservations and {purged} checkout carts."))
@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from api.filters import start_of_day
+from api.models import Order, OrderItem
+from api.receipts import (
+    available_outputs, create_pool, receipt_path, receipt_snapshot, render_receipt, store_receipt,
+)
+from api.sharding import shard_aliases
+
+
+def _render(job):
+    _, snapshot, output = job
+    return render_receipt(snapshot, output)
+
+
+class Command(BaseCommand):
+    help = "Render the receipts of one day's orders for all canteens on a process pool."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', default=None, help="Day to render (YYYY-MM-DD, default: today).")
+        parser.add_argument('--output', nargs='+', default=['html'], help="Receipt types, e.g. html pdf.")
+        parser.add_argument('--workers', type=int, default=None,
+                            help="Worker processes (default: RECEIPT_RENDER_WORKERS; 0 renders in this process).")
+        parser.add_argument('--batch-size', type=int, default=500, help="Receipts rendered per batch.")
+
+    def handle(self, *args, **options):
+        day = timezone.localdate()
+        if options['date']:
+            try:
+                day = datetime.strptime(options['date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError("--date must be YYYY-MM-DD")
+        unsupported = set(options['output']) - set(available_outputs())
+        if unsupported:
+            raise CommandError(f"Cannot render {', '.join(sorted(unsupported))} receipts here (is weasyprint installed?)")
+        workers = settings.RECEIPT_RENDER_WORKERS if options['workers'] is None else options['workers']
+
+        rendered = skipped = 0
+        pool = create_pool(workers) if workers else None
+        try:
+            for batch in self._jobs(day, options['output'], options['batch_size']):
+                todo, queued = [], set()
+                for job in batch:
+                    if job[0] in queued or default_storage.exists(job[0]):
+                        skipped += 1
+                    else:
+                        queued.add(job[0])
+                        todo.append(job)
+                results = pool.map(_render, todo, chunksize=16) if pool else map(_render, todo)
+                for (path, _, _), content in zip(todo, results):
+                    store_receipt(path, content)
+                    rendered += 1
+        finally:
+            if pool:
+                pool.shutdown()
+        self.stdout.write(self.style.SUCCESS(f"Rendered {rendered} receipts for {day}, {skipped} already stored."))
+
+    def _jobs(self, day, outputs, batch_size):
+        """Batches of (path, snapshot, output), read shard by shard."""
+        batch = []
+        # A range on created_at, not created_at__date, so order_created_idx can serve it
+        start, end = start_of_day(day), start_of_day(day + timedelta(days=1))
+        for alias in shard_aliases():
+            orders = (
+                Order.objects.using(alias).filter(created_at__gte=start, created_at__lt=end).exclude(status='CANCELLED')
+                .select_related('canteen', 'customer')
+                .prefetch_related(Prefetch('items', queryset=OrderItem.objects.using(alias).select_related('menu_item')))
+                .order_by('pk')
+            )
+            for order in orders.iterator(chunk_size=batch_size):
+                snapshot = receipt_snapshot(order)
+                for output in outputs:
+                    batch.append((receipt_path(snapshot, output), snapshot, output))
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.inventory import roll_over_all_stock
+
+
+class Command(BaseCommand):
+    help = "Reset the stock of daily-stocked menu items for today (run just after midnight)."
+
+    def handle(self, *args, **options):
+        total = roll_over_all_stock()
+        self.stdout.write(self.style.SUCCESS(f"Reset the stock of {total} menu items."))
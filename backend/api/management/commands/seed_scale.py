@@ -0,0 +1,239 @@
+import csv
+from datetime import datetime, time, timedelta
+from io import StringIO
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.utils import timezone
+import numpy as np
+
+from api.models import Canteen, Category, MenuItem, Order, OrderItem
+from api.ordering import items_preview
+from api.pricing import cart_total
+from api.sharding import shard_for_canteen, sharding_enabled
+
+PREFIX = 'seed'
+PASSWORD = 'seed-password' # Every generated user can log in with this
+# Meal rushes as (hour of day, spread in hours, share of the day's orders)
+MEAL_PEAKS = [(8.5, 0.75, 0.20), (13.0, 1.0, 0.40), (16.5, 0.75, 0.15), (20.0, 1.0, 0.25)]
+WEEKDAY_WEIGHTS = [1.0, 1.0, 1.0, 1.0, 0.9, 0.5, 0.4] # Campus canteens are quiet at weekends
+PRICES = np.arange(10, 155, 5)
+
+ORDER_COLUMNS = [
+    'id', 'customer_id', 'canteen_id', 'created_at', 'updated_at', 'status', 'total_price', 'notes',
+    'table_number', 'slot_load', 'ready_at', 'item_count', 'items_preview',
+]
+ITEM_COLUMNS = ['order_id', 'menu_item_id', 'quantity', 'price']
+
+
+def _zipf_weights(n, exponent):
+    weights = 1 / np.arange(1, n + 1) ** exponent
+    return weights / weights.sum()
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate seed-* canteens, categories, menu items, users and a large order history with "
+        "meal-time peaks, loaded in batches with bulk_create (COPY on PostgreSQL)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--canteens', type=int, default=5)
+        parser.add_argument('--categories', type=int, default=8)
+        parser.add_argument('--items-per-canteen', type=int, default=60)
+        parser.add_argument('--users', type=int, default=20000)
+        parser.add_argument('--orders', type=int, default=1000000)
+        parser.add_argument('--days', type=int, default=120, help="Spread orders over this many days up to today.")
+        parser.add_argument('--batch-size', type=int, default=50000, help="Orders generated and written per batch.")
+        parser.add_argument('--method', choices=['auto', 'copy', 'bulk'], default='auto',
+                            help="auto uses COPY on PostgreSQL and bulk_create elsewhere.")
+        parser.add_argument('--seed', type=int, default=None, help="Random seed for reproducible data.")
+
+    def handle(self, *args, **options):
+        if options['days'] < 1 or options['batch_size'] < 1:
+            raise CommandError("--days and --batch-size must be positive")
+        self.rng = np.random.default_rng(options['seed'])
+
+        canteens = self._canteens(options['canteens'])
+        categories = self._categories(options['categories'])
+        user_ids = self._users(options['users'])
+        if sharding_enabled():
+            # bulk_create sends no post_save, so mirror before writing shard data
+            call_command('sync_shard_mirrors', stdout=StringIO())
+        menus = self._menus(canteens, categories, options['items_per_canteen'])
+
+        # Some canteens, customers and dishes are far busier than others
+        canteen_weights = _zipf_weights(len(canteens), 0.8)
+        customer_weights = self.rng.pareto(1.5, len(user_ids)) + 1
+        customer_weights /= customer_weights.sum()
+        today = timezone.localdate()
+        days = [today - timedelta(days=n) for n in range(options['days'])]
+        day_weights = np.array([WEEKDAY_WEIGHTS[day.weekday()] for day in days])
+        day_weights /= day_weights.sum()
+
+        written = 0
+        while written < options['orders']:
+            size = min(options['batch_size'], options['orders'] - written)
+            canteen_index = self.rng.choice(len(canteens), size=size, p=canteen_weights)
+            customer_index = self.rng.choice(len(user_ids), size=size, p=customer_weights)
+            created = self._timestamps(days, day_weights, size)
+            for c, canteen in enumerate(canteens):
+                mask = canteen_index == c
+                if not mask.any():
+                    continue
+                rows, lines = self._orders(canteen, menus[canteen.pk], user_ids[customer_index[mask]], created[mask], today)
+                self._write(shard_for_canteen(canteen), rows, lines, options['method'])
+            written += size
+            self.stdout.write(f"{written}/{options['orders']} orders")
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(canteens)} canteens, {len(user_ids)} users and {written} orders."
+        ))
+
+    # --- Reference data ---
+
+    def _canteens(self, count):
+        names = [f"{PREFIX}-canteen-{n}" for n in range(count)]
+        Canteen.objects.bulk_create([Canteen(name=name) for name in names], ignore_conflicts=True)
+        return list(Canteen.objects.filter(name__in=names).order_by('pk'))
+
+    def _categories(self, count):
+        names = [f"{PREFIX}-category-{n}" for n in range(count)]
+        Category.objects.bulk_create([Category(name=name) for name in names], ignore_conflicts=True)
+        return list(Category.objects.filter(name__in=names).order_by('pk'))
+
+    def _menus(self, canteens, categories, count):
+        menus = {}
+        for canteen in canteens:
+            with transaction.atomic(using=shard_for_canteen(canteen)):
+                items = MenuItem.objects.using(shard_for_canteen(canteen)).filter(canteen=canteen)
+                if not items.exists():
+                    MenuItem.objects.using(shard_for_canteen(canteen)).bulk_create([
+                        MenuItem(
+                            canteen=canteen, name=f"{PREFIX}-item-{canteen.pk}-{n}",
+                            category_id=categories[n % len(categories)].pk if categories else None,
+                            price=int(self.rng.choice(PRICES)),
+                        )
+                        for n in range(count)
+                    ])
+                menus[canteen.pk] = list(items.only('id', 'name', 'price', 'canteen_id').order_by('pk'))
+        return menus
+
+    def _users(self, count):
+        password = make_password(PASSWORD) # Hashed once; hashing per user would dominate the run
+        existing = User.objects.filter(username__startswith=f"{PREFIX}-user-").count()
+        users = (
+            User(username=f"{PREFIX}-user-{n}", email=f"{PREFIX}-user-{n}@example.com", password=password)
+            for n in range(existing, count)
+        )
+        while True:
+            batch = [user for _, user in zip(range(5000), users)]
+            if not batch:
+                break
+            User.objects.bulk_create(batch)
+        return np.array(User.objects.filter(username__startswith=f"{PREFIX}-user-").values_list('pk', flat=True))
+
+    # --- Orders ---
+
+    def _timestamps(self, days, day_weights, size):
+        """Aware datetimes: a weighted day, then a time of day drawn around one of the meal peaks."""
+        day_index = self.rng.choice(len(days), size=size, p=day_weights)
+        peak = self.rng.choice(len(MEAL_PEAKS), size=size, p=[share for _, _, share in MEAL_PEAKS])
+        hours = self.rng.normal(
+            [MEAL_PEAKS[p][0] for p in peak], [MEAL_PEAKS[p][1] for p in peak]
+        ).clip(7, 22.5)
+        midnights = [timezone.make_aware(datetime.combine(day, time.min)) for day in days]
+        return np.array([midnights[d] + timedelta(hours=h) for d, h in zip(day_index, hours)], dtype=object)
+
+    def _orders(self, canteen, menu, customer_ids, created, today):
+        """Order rows as dicts keyed by ``ORDER_COLUMNS`` (minus ``id``) and, per order, its ``{menu_item: quantity}``."""
+        size = len(customer_ids)
+        line_counts = 1 + self.rng.poisson(0.8, size).clip(0, 4)
+        # Draw every cart line of the batch at once; a dish drawn twice just adds up
+        cdf = np.cumsum(_zipf_weights(len(menu), 1.0))
+        picks = np.searchsorted(cdf, self.rng.random(line_counts.sum()) * cdf[-1])
+        quantities = 1 + self.rng.poisson(0.3, len(picks))
+        bounds = np.concatenate([[0], np.cumsum(line_counts)])
+        prep_minutes = self.rng.lognormal(2.1, 0.4, size)
+        outcome = self.rng.random(size)
+        tables = self.rng.integers(1, 31, size)
+
+        rows, all_lines = [], []
+        for n in range(size):
+            lines = {}
+            for i, quantity in zip(picks[bounds[n]:bounds[n + 1]], quantities[bounds[n]:bounds[n + 1]]):
+                lines[menu[i]] = lines.get(menu[i], 0) + int(quantity)
+            created_at = created[n]
+            if created_at.date() < today or outcome[n] < 0.6:
+                status = 'CANCELLED' if outcome[n] > 0.97 else 'COMPLETED'
+            else:
+                status = 'PENDING' if outcome[n] < 0.8 else 'PROCESSING'
+            ready_at = created_at + timedelta(minutes=float(prep_minutes[n])) if status == 'COMPLETED' else None
+            rows.append({
+                'customer_id': int(customer_ids[n]), 'canteen_id': canteen.pk, 'created_at': created_at,
+                'updated_at': ready_at or created_at, 'status': status, 'total_price': cart_total(lines),
+                'notes': None, 'table_number': str(tables[n]) if outcome[n] < 0.4 else None, 'slot_load': 0,
+                'ready_at': ready_at, 'item_count': sum(lines.values()), 'items_preview': items_preview(lines),
+            })
+            all_lines.append(lines)
+        return rows, all_lines
+
+    def _write(self, alias, rows, lines, method):
+        connection = connections[alias]
+        use_copy = method == 'copy' or (method == 'auto' and connection.vendor == 'postgresql')
+        if use_copy and connection.vendor != 'postgresql':
+            raise CommandError("--method copy needs PostgreSQL")
+        with transaction.atomic(using=alias):
+            if use_copy:
+                self._copy(connection, rows, lines)
+            else:
+                self._bulk_create(alias, rows, lines)
+
+    def _bulk_create(self, alias, rows, lines):
+        orders = [Order(**row) for row in rows]
+        # created_at/updated_at are auto_now(_add), which would overwrite the generated history
+        fields = [Order._meta.get_field('created_at'), Order._meta.get_field('updated_at')]
+        flags = [(field.auto_now, field.auto_now_add) for field in fields]
+        try:
+            for field in fields:
+                field.auto_now = field.auto_now_add = False
+            Order.objects.using(alias).bulk_create(orders, batch_size=2000)
+        finally:
+            for field, (auto_now, auto_now_add) in zip(fields, flags):
+                field.auto_now, field.auto_now_add = auto_now, auto_now_add
+        OrderItem.objects.using(alias).bulk_create([
+            OrderItem(order_id=order.pk, menu_item_id=menu_item.pk, quantity=quantity, price=menu_item.price)
+            for order, order_lines in zip(orders, lines)
+            for menu_item, quantity in order_lines.items()
+        ], batch_size=5000)
+
+    def _copy(self, connection, rows, lines):
+        """COPY the batch as CSV, with order ids taken from the sequence up front."""
+        with connection.cursor() as cursor:
+            # A seed run can be redone; skipping the WAL flush per batch is a large win
+            cursor.execute("SET LOCAL synchronous_commit TO OFF")
+            cursor.execute(
+                "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+                [Order._meta.db_table, len(rows)],
+            )
+            order_ids = [pk for pk, in cursor.fetchall()]
+
+            def copy(table, columns, values):
+                buffer = StringIO()
+                csv.writer(buffer).writerows(values)
+                buffer.seek(0)
+                cursor.copy_expert(
+                    f"COPY {connection.ops.quote_name(table)} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+                    buffer,
+                )
+
+            copy(Order._meta.db_table, ORDER_COLUMNS, (
+                [pk] + [row[column] for column in ORDER_COLUMNS[1:]] for pk, row in zip(order_ids, rows)
+            ))
+            copy(OrderItem._meta.db_table, ITEM_COLUMNS, (
+                [pk, menu_item.pk, quantity, menu_item.price]
+                for pk, order_lines in zip(order_ids, lines)
+                for menu_item, quantity in order_lines.items()
+            ))
@@ -0,0 +1,75 @@
+from collections import defaultdict
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Runs in a fresh interpreter so nothing is imported or cached yet
+PROBE = """
+import time
+started = time.perf_counter()
+import json, os, sys
+import django
+django.setup()
+from api.warmup import probe
+print(json.dumps(probe(sys.argv[2:], sys.argv[1] == 'warm', started)))
+"""
+
+DEFAULT_PATHS = ['/api/canteens/', '/api/categories/', '/api/menu-items/']
+
+
+def import_times(stderr):
+    """Self time in ms per top-level package from ``python -X importtime`` output."""
+    totals = defaultdict(float)
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = (part.strip() for part in line[len('import time:'):].split('|'))
+        totals[name.split('.')[0]] += int(self_us) / 1000
+    return totals
+
+
+class Command(BaseCommand):
+    help = (
+        "Start fresh processes with and without api.warmup and report where startup time goes: "
+        "imports by package, setup phases and first-request latency."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', action='append', dest='paths',
+                            help=f"GET this path twice per process (repeatable; default: {', '.join(DEFAULT_PATHS)}).")
+        parser.add_argument('--top', type=int, default=15, help="Packages listed by import time.")
+
+    def run_probe(self, mode, paths):
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': settings.SETTINGS_MODULE}
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', PROBE, mode, *paths],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        if result.returncode:
+            raise CommandError(f"The {mode} probe failed:\n{result.stderr[-2000:]}")
+        return json.loads(result.stdout.strip().splitlines()[-1]), import_times(result.stderr)
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or DEFAULT_PATHS
+        cold, cold_imports = self.run_probe('cold', paths)
+        warm, _ = self.run_probe('warm', paths)
+
+        self.stdout.write(f"Import time by package, cold process ({sum(cold_imports.values()):.0f} ms in total):")
+        for package, ms in sorted(cold_imports.items(), key=lambda item: -item[1])[:options['top']]:
+            self.stdout.write(f"  {package:<32} {ms:8.1f} ms")
+
+        self.stdout.write("\nStartup phases (ms):")
+        self.stdout.write(f"  {'':<32} {'cold':>8} {'warm':>8}")
+        for phase in dict.fromkeys([*cold['phases'], *warm['phases']]):
+            row = [run['phases'].get(phase) for run in (cold, warm)]
+            self.stdout.write(f"  {phase:<32} " + ' '.join(f"{ms:8.1f}" if ms is not None else f"{'-':>8}" for ms in row))
+
+        self.stdout.write("\nRequests, first / second (ms):")
+        self.stdout.write(f"  {'':<32} {'cold':>17} {'warm':>17}")
+        for cold_request, warm_request in zip(cold['requests'], warm['requests']):
+            cells = [f"{r['first']:7.1f} / {r['second']:7.1f}" for r in (cold_request, warm_request)]
+            self.stdout.write(f"  {cold_request['path'] + ' ' + str(cold_request['status']):<32} {cells[0]:>17} {cells[1]:>17}")
@@ -0,0 +1,24 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from api.models import Canteen, Category
+from api.sharding import shard_aliases
+
+
+class Command(BaseCommand):
+    help = "Copy canteens, categories and users from the default database to every other shard."
+
+    def handle(self, *args, **options):
+        for alias in shard_aliases():
+            if alias == DEFAULT_DB_ALIAS:
+                continue
+            with transaction.atomic(using=alias):
+                for model in (User, Canteen, Category):
+                    rows = list(model._base_manager.using(DEFAULT_DB_ALIAS).all())
+                    fields = [f.attname for f in model._meta.concrete_fields if not f.primary_key]
+                    existing = set(model._base_manager.using(alias).values_list('pk', flat=True))
+                    model._base_manager.using(alias).bulk_update([r for r in rows if r.pk in existing], fields, batch_size=500)
+                    model._base_manager.using(alias).bulk_create([r for r in rows if r.pk not in existing], batch_size=500)
+                    self.stdout.write(f"{alias}: {model._meta.label} {len(rows)} rows")
+        self.stdout.write(self.style.SUCCESS("Shard mirrors are in sync."))
@@ -0,0 +1,281 @@
+"""
+Bulk menu import and export.
+
+Rows are flat dicts (CSV columns or JSON objects) with ``EXPORT_FIELDS``;
+entries in the ``manage.py dumpdata`` shape (``{"model": "api.menuitem",
+"fields": {...}}``, as in ``data_dump.json``) are accepted too. Canteens and
+categories may be given by id or name and are resolved against separate id
+and name maps loaded once per import; a value that is both an id and another
+row's name means the id, as exports write ids. A menu item is identified by
+its canteen and name (case-insensitive).
+
+``plan_import`` diffs the rows against the stored items and ``apply_import``
+writes only the differences with ``bulk_create``/``bulk_update``, all shards
+inside one set of nested transactions, so an import applies completely or not
+at all.
+"""
+from collections import defaultdict
+from contextlib import ExitStack
+import csv
+from decimal import Decimal, InvalidOperation
+import io
+import json
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Canteen, Category, MenuItem
+from .pricing import invalidate_prices
+from .sharding import shard_for_canteen
+
+EXPORT_FIELDS = [
+    'canteen', 'category', 'name', 'description', 'price', 'image', 'is_available', 'daily_stock', 'prep_units',
+]
+# Fields an import may change on an existing item
+UPDATE_FIELDS = ['category_id', 'description', 'price', 'image', 'is_available', 'daily_stock', 'prep_units']
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 't', ''} # A blank cell keeps the default
+FALSE_VALUES = {'0', 'false', 'no', 'n', 'f'}
+
+
+class MenuImportError(Exception):
+    """Raised with ``errors``, a list of ``{"row": n, "errors": {field: message}}``, when rows are invalid."""
+
+    def __init__(self, errors):
+        super().__init__(f"{len(errors)} invalid menu rows")
+        self.errors = errors
+
+
+def parse_rows(content, fmt):
+    """Rows from CSV or JSON text (a list, ``{"items": [...]}`` or a dumpdata fixture)."""
+    if fmt == 'csv':
+        return list(csv.DictReader(io.StringIO(content.lstrip('\ufeff'))))
+    try:
+        data = json.loads(content.lstrip('\ufeff'))
+    except ValueError as e:
+        raise MenuImportError([{'row': None, 'errors': {'file': f"Invalid JSON: {e}"}}])
+    return rows_from_data(data)
+
+
+def rows_from_data(data):
+    if isinstance(data, dict):
+        data = data.get('items', [])
+    if not isinstance(data, list):
+        raise MenuImportError([{'row': None, 'errors': {'file': "Expected a list of menu items"}}])
+    rows = []
+    for entry in data:
+        if isinstance(entry, dict) and 'model' in entry:
+            if entry['model'] == 'api.menuitem':
+                rows.append(entry.get('fields', {}))
+        else:
+            rows.append(entry)
+    return rows
+
+
+def _lookup(model, key_field='name'):
+    """``(ids, {lowercased name: pk})`` for resolving references with ``_resolve``."""
+    ids, names = set(), {}
+    for pk, name in model._base_manager.values_list('pk', key_field):
+        ids.add(pk)
+        names[name.strip().lower()] = pk
+    return ids, names
+
+
+def _resolve(refs, value):
+    """The pk ``value`` refers to: an id if it is one (JSON numbers only ever are), else a name."""
+    ids, names = refs
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value if value in ids else None
+    text = _text(value)
+    if text.isdigit() and int(text) in ids:
+        return int(text)
+    return names.get(text.lower())
+
+
+def _text(value):
+    return '' if value is None else str(value).strip()
+
+
+def _optional_int(value, minimum=0):
+    value = _text(value)
+    if value == '':
+        return None
+    number = int(value)
+    if number < minimum:
+        raise ValueError(value)
+    return number
+
+
+def _stored(item, field):
+    """``item``'s value of ``field`` as ``validate_rows`` would clean it."""
+    if field == 'image':
+        return item.image.name or None
+    return getattr(item, field)
+
+
+def validate_rows(rows):
+    """Clean rows into ``MenuItem`` field dicts or raise ``MenuImportError`` listing every problem."""
+    canteens, categories = _lookup(Canteen), _lookup(Category)
+    price_field = MenuItem._meta.get_field('price')
+    max_price = Decimal(10) ** (price_field.max_digits - price_field.decimal_places)
+    cleaned, errors, seen = [], [], set()
+
+    for number, row in enumerate(rows, start=1):
+        if not isinstance(row, dict):
+            errors.append({'row': number, 'errors': {'row': "Expected an object"}})
+            continue
+        row_errors, values = {}, {}
+
+        canteen = _text(row.get('canteen'))
+        values['canteen_id'] = _resolve(canteens, row.get('canteen'))
+        if values['canteen_id'] is None:
+            row_errors['canteen'] = f"Unknown canteen '{canteen}'" if canteen else "This field is required."
+
+        category = _text(row.get('category'))
+        values['category_id'] = _resolve(categories, row.get('category')) if category else None
+        if category and values['category_id'] is None:
+            row_errors['category'] = f"Unknown category '{category}'"
+
+        values['name'] = _text(row.get('name'))
+        if not values['name']:
+            row_errors['name'] = "This field is required."
+        elif len(values['name']) > MenuItem._meta.get_field('name').max_length:
+            row_errors['name'] = "Too long."
+        key = (values['canteen_id'], values['name'].lower())
+        if values['canteen_id'] is not None and values['name']:
+            if key in seen:
+                row_errors['name'] = "Duplicate item for this canteen in the import."
+            seen.add(key)
+
+        try:
+            values['price'] = Decimal(_text(row.get('price'))).quantize(Decimal('0.01'))
+            if not 0 <= values['price'] < max_price:
+                row_errors['price'] = f"Must be between 0 and {max_price}."
+        except InvalidOperation:
+            row_errors['price'] = "A valid number is required."
+
+        available = _text(row.get('is_available')).lower()
+        if available in TRUE_VALUES:
+            values['is_available'] = True
+        elif available in FALSE_VALUES:
+            values['is_available'] = False
+        else:
+            row_errors['is_available'] = "Must be true or false."
+
+        for field, minimum in (('daily_stock', 0), ('prep_units', 1)):
+            try:
+                values[field] = _optional_int(row.get(field), minimum)
+            except ValueError:
+                row_errors[field] = f"A whole number of at least {minimum} is required."
+        if values.get('prep_units') is None:
+            values['prep_units'] = 1
+
+        values['description'] = _text(row.get('description'))
+        values['image'] = _text(row.get('image')) or None
+
+        if row_errors:
+            errors.append({'row': number, 'errors': row_errors})
+        else:
+            cleaned.append(values)
+    if errors:
+        raise MenuImportError(errors)
+    return cleaned
+
+
+def plan_import(rows, prune=False):
+    """
+    ``{alias: {'create': [...], 'update': [(item, fields)], 'disable': [...]}}``
+    plus counts. With ``prune``, stored items of the imported canteens that the
+    rows no longer list are marked unavailable (never deleted: orders reference them).
+    """
+    by_shard = defaultdict(list)
+    for values in validate_rows(rows):
+        by_shard[shard_for_canteen(values['canteen_id'])].append(values)
+
+    plan, counts = {}, defaultdict(int)
+    for alias, shard_rows in by_shard.items():
+        existing = {
+            (item.canteen_id, item.name.strip().lower()): item
+            for item in MenuItem.objects.using(alias).filter(canteen_id__in={v['canteen_id'] for v in shard_rows})
+        }
+        create, update, listed = [], [], set()
+        for values in shard_rows:
+            key = (values['canteen_id'], values['name'].lower())
+            listed.add(key)
+            item = existing.get(key)
+            if item is None:
+                create.append(MenuItem(**values))
+                continue
+            changed = [field for field in UPDATE_FIELDS if _stored(item, field) != values[field]]
+            if changed:
+                for field in changed:
+                    setattr(item, field, values[field])
+                update.append((item, changed))
+            else:
+                counts['unchanged'] += 1
+        disable = [
+            item for key, item in existing.items()
+            if prune and key not in listed and item.is_available
+        ]
+        plan[alias] = {'create': create, 'update': update, 'disable': disable}
+        counts['created'] += len(create)
+        counts['updated'] += len(update)
+        counts['disabled'] += len(disable)
+    return plan, {kind: counts[kind] for kind in ('created', 'updated', 'unchanged', 'disabled')}
+
+
+def apply_import(plan):
+    now = timezone.now()
+    with ExitStack() as stack:
+        for alias in plan:
+            stack.enter_context(transaction.atomic(using=alias))
+        for alias, changes in plan.items():
+            MenuItem.objects.using(alias).bulk_create(changes['create'], batch_size=500)
+            for item in changes['disable']:
+                item.is_available = False
+                changes['update'].append((item, ['is_available']))
+            fields = {field for _, changed in changes['update'] for field in changed}
+            items = [item for item, _ in changes['update']]
+            for item in items:
+                item.updated_at = now # bulk_update skips auto_now
+            if items:
+                MenuItem.objects.using(alias).bulk_update(items, sorted(fields) + ['updated_at'], batch_size=500)
+    invalidate_prices() # bulk_create/bulk_update send no signals
+
+
+def import_menu(rows, prune=False, dry_run=False):
+    """Validate, diff and (unless ``dry_run``) apply ``rows``; returns the change counts."""
+    plan, counts = plan_import(rows, prune=prune)
+    if not dry_run:
+        apply_import(plan)
+    return counts
+
+
+def export_rows(canteen_ids=None):
+    """Flat rows of every menu item (optionally of some canteens), in ``EXPORT_FIELDS`` order."""
+    categories = dict(Category._base_manager.values_list('pk', 'name'))
+    canteens = Canteen._base_manager.order_by('pk')
+    if canteen_ids:
+        canteens = canteens.filter(pk__in=canteen_ids)
+    for canteen_id in canteens.values_list('pk', flat=True):
+        items = MenuItem.objects.using(shard_for_canteen(canteen_id)).filter(canteen_id=canteen_id).order_by('pk')
+        for item in items.iterator(chunk_size=1000):
+            yield {
+                'canteen': canteen_id,
+                'category': categories.get(item.category_id, ''),
+                'name': item.name,
+                'description': item.description,
+                'price': str(item.price),
+                'image': item.image.name or '',
+                'is_available': item.is_available,
+                'daily_stock': item.daily_stock,
+                'prep_units': item.prep_units,
+            }
+
+
+def write_rows(rows, stream, fmt):
+    if fmt == 'csv':
+        writer = csv.DictWriter(stream, fieldnames=EXPORT_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    else:
+        json.dump(list(rows), stream, indent=2)
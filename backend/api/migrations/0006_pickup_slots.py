@@ -0,0 +1,63 @@
+# Generated by Django 5.2 on 2026-10-19 05:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_menuitem_stock_stockreservation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='menuitem',
+            name='prep_units',
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='pickup_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='slot_load',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='PickupSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_time', models.TimeField()),
+                ('end_time', models.TimeField()),
+                ('capacity', models.PositiveIntegerField()),
+                ('capacity_unit', models.CharField(choices=[('ORDERS', 'Orders'), ('PREP_UNITS', 'Prep units')], default='ORDERS', max_length=20)),
+                ('is_active', models.BooleanField(default=True)),
+                ('canteen', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pickup_slots', to='api.canteen')),
+            ],
+            options={
+                'ordering': ['start_time'],
+                'unique_together': {('canteen', 'start_time')},
+            },
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='pickup_slot',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='orders', to='api.pickupslot'),
+        ),
+        migrations.CreateModel(
+            name='PickupSlotUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('capacity', models.PositiveIntegerField()),
+                ('booked', models.PositiveIntegerField(default=0)),
+                ('slot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='usage', to='api.pickupslot')),
+            ],
+            options={
+                'unique_together': {('slot', 'date')},
+            },
+        ),
+    ]
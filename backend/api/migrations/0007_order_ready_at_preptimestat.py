@@ -0,0 +1,45 @@
+# Generated by Django 5.2 on 2026-10-19 05:47
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_pickup_slots'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrepTimeStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sample_count', models.PositiveIntegerField()),
+                ('median_seconds', models.FloatField()),
+                ('p90_seconds', models.FloatField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='ready_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['canteen', 'status', 'created_at'], name='order_queue_idx'),
+        ),
+        migrations.AddField(
+            model_name='preptimestat',
+            name='canteen',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='prep_stats', to='api.canteen'),
+        ),
+        migrations.AddField(
+            model_name='preptimestat',
+            name='menu_item',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='prep_stats', to='api.menuitem'),
+        ),
+    ]
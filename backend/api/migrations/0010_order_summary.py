@@ -0,0 +1,48 @@
+# Generated by Django 5.2 on 2026-10-19 05:58
+
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_summaries(apps, schema_editor):
+    Order = apps.get_model('api', 'Order')
+    OrderItem = apps.get_model('api', 'OrderItem')
+    alias = schema_editor.connection.alias
+    lines = defaultdict(list)
+    for order_id, quantity, name in OrderItem.objects.using(alias).order_by('id') \
+            .values_list('order_id', 'quantity', 'menu_item__name'):
+        lines[order_id].append((quantity, name))
+    orders = list(Order.objects.using(alias).filter(pk__in=lines).only('pk'))
+    for order in orders:
+        order.item_count = sum(quantity for quantity, _ in lines[order.pk])
+        preview = ', '.join(f"{quantity}x {name}" for quantity, name in lines[order.pk])
+        order.items_preview = preview if len(preview) <= 120 else preview[:119].rstrip(', ') + '…'
+    Order.objects.using(alias).bulk_update(orders, ['item_count', 'items_preview'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_catalog_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='items_preview',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['customer', '-created_at'], name='order_history_idx'),
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2 on 2026-10-19 06:00
+
+from django.conf import settings
+from django.db import DatabaseError, migrations, models, transaction
+
+
+def create_username_trigram_index(apps, schema_editor):
+    # username__icontains compiles to UPPER("username"::text) LIKE UPPER(%s) on
+    # PostgreSQL; a trigram GIN index on that expression serves it. Other
+    # databases keep scanning, which is fine at their scale.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    # pg_trgm is a trusted extension from PostgreSQL 13, so the database owner can
+    # create it; older servers need a superuser. Without it the search still works,
+    # unindexed, until the extension and index are created by hand (see README).
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        installed = cursor.fetchone() is not None
+    if not installed:
+        try:
+            with transaction.atomic(using=schema_editor.connection.alias):
+                schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        except DatabaseError as e:
+            print(f"\n  Skipping the username trigram index, pg_trgm could not be created: {str(e).strip()}")
+            return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS auth_user_username_upper_trgm '
+        'ON auth_user USING gin (UPPER("username"::text) gin_trgm_ops)'
+    )
+
+
+def drop_username_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS auth_user_username_upper_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_order_summary'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['-created_at'], name='order_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', '-created_at'], name='order_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['canteen', 'table_number'], name='order_table_idx'),
+        ),
+        migrations.RunPython(create_username_trigram_index, drop_username_trigram_index),
+    ]
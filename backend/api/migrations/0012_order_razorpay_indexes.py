@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-19 06:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_admin_order_search'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='razorpay_order_id',
+            field=models.CharField(blank=True, db_index=True, max_length=100, null=True),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='razorpay_payment_id',
+            field=models.CharField(blank=True, db_index=True, max_length=100, null=True),
+        ),
+    ]
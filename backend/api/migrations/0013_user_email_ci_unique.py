@@ -0,0 +1,44 @@
+# Generated by Django 5.2 on 2026-10-19 07:10
+
+from django.db import migrations
+from django.db.models import Count
+from django.db.models.functions import Upper
+
+
+def create_email_unique_index(apps, schema_editor):
+    # email__iexact compiles to UPPER("email"::text) = UPPER(%s) on PostgreSQL,
+    # so a unique index on that expression both serves the signup check and
+    # closes the race between two signups with the same address. Blank emails
+    # (e.g. createsuperuser without one) are left out.
+    User = apps.get_model('auth', 'User')
+    alias = schema_editor.connection.alias
+    duplicates = list(
+        User.objects.using(alias).exclude(email='').annotate(key=Upper('email'))
+        .values('key').annotate(n=Count('id')).filter(n__gt=1).values_list('key', flat=True)[:20]
+    )
+    if duplicates:
+        raise RuntimeError(
+            "Cannot add the case-insensitive unique index on auth_user.email; these addresses "
+            f"belong to several users: {', '.join(duplicates)}. Merge or change them and migrate again."
+        )
+    expression = 'UPPER("email"::text)' if schema_editor.connection.vendor == 'postgresql' else 'UPPER("email")'
+    schema_editor.execute(
+        f'CREATE UNIQUE INDEX IF NOT EXISTS auth_user_email_upper_uniq ON auth_user ({expression}) '
+        "WHERE email <> ''"
+    )
+
+
+def drop_email_unique_index(apps, schema_editor):
+    schema_editor.execute("DROP INDEX IF EXISTS auth_user_email_upper_uniq")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_order_razorpay_indexes'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_email_unique_index, drop_email_unique_index),
+    ]
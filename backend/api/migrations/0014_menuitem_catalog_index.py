@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-19 06:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_user_email_ci_unique'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='menuitem',
+            index=models.Index(fields=['canteen', 'is_available', 'category'], name='menuitem_catalog_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2 on 2026-10-19 06:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_menuitem_catalog_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PairingMatrix',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_order_id', models.BigIntegerField(default=0)),
+                ('order_count', models.PositiveIntegerField(default=0)),
+                ('matrix', models.BinaryField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('canteen', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='pairing_matrix', to='api.canteen')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ItemPairing',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order_count', models.PositiveIntegerField()),
+                ('confidence', models.FloatField()),
+                ('canteen', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='item_pairings', to='api.canteen')),
+                ('menu_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pairings', to='api.menuitem')),
+                ('paired_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.menuitem')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['menu_item', '-confidence'], name='pairing_neighbours_idx')],
+                'unique_together': {('menu_item', 'paired_item')},
+            },
+        ),
+    ]
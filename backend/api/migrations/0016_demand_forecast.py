@@ -0,0 +1,30 @@
+# Generated by Django 5.2 on 2026-10-19 06:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_item_pairings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DemandForecast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('hour', models.PositiveSmallIntegerField()),
+                ('quantity', models.FloatField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('canteen', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='demand_forecasts', to='api.canteen')),
+                ('menu_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='demand_forecasts', to='api.menuitem')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['canteen', 'date'], name='forecast_canteen_date_idx')],
+                'unique_together': {('menu_item', 'date', 'hour')},
+            },
+        ),
+    ]
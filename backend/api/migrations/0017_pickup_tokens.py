@@ -0,0 +1,47 @@
+# Generated by Django 5.2 on 2026-10-19 06:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_demand_forecast'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PickupTokenCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('last_token', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='pickup_token',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='token_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(fields=('canteen', 'token_date', 'pickup_token'), name='order_pickup_token_uniq'),
+        ),
+        migrations.AddField(
+            model_name='pickuptokencounter',
+            name='canteen',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pickup_token_counters', to='api.canteen'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='pickuptokencounter',
+            unique_together={('canteen', 'date')},
+        ),
+    ]
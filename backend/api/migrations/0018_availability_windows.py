@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-19 06:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_pickup_tokens'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AvailabilityWindow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekdays', models.PositiveSmallIntegerField(default=127)),
+                ('start_time', models.TimeField()),
+                ('end_time', models.TimeField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('menu_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='availability_windows', to='api.menuitem')),
+            ],
+            options={
+                'ordering': ['start_time'],
+            },
+        ),
+    ]
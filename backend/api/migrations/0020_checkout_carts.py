@@ -0,0 +1,29 @@
+# Generated by Django 5.2 on 2026-10-19 06:59
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_notifications'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CheckoutCart',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('razorpay_order_id', models.CharField(max_length=100, unique=True)),
+                ('lines', models.JSONField()),
+                ('amount', models.PositiveIntegerField()),
+                ('currency', models.CharField(default='INR', max_length=3)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('canteen', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.canteen')),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2 on 2026-10-19 07:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_checkout_carts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='checkoutcart',
+            name='pickup_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='checkoutcart',
+            name='pickup_slot',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='api.pickupslot'),
+        ),
+        migrations.AddField(
+            model_name='checkoutcart',
+            name='slot_held',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='checkoutcart',
+            name='slot_load',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-19 07:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0021_checkout_pickup_slots'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='checkoutcart',
+            name='last_error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='checkoutcart',
+            name='razorpay_payment_id',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='checkoutcart',
+            name='status',
+            field=models.CharField(choices=[('OPEN', 'Awaiting payment'), ('FAILED', 'Paid, order failed')], default='OPEN', max_length=10),
+        ),
+    ]
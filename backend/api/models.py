@@ -4,6 +4,8 @@ from decimal import Decimal # Import Decimal
 from django.contrib.auth import get_user_model
 from django.conf import settings
 
+from .sharding import ShardedManager
+
 User = get_user_model()
 
 # Create your models here.
@@ -11,6 +13,7 @@ User = get_user_model()
 class Canteen(models.Model):
     name = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True) # Drives Last-Modified/ETag of catalog responses
     # Add location, opening hours, etc. later if needed
     # Maybe a link to the staff managing it (ForeignKey to User?)
 
@@ -19,6 +22,7 @@ class Canteen(models.Model):
 
 class Category(models.Model):
     name = models.CharField(max_length=50, unique=True)
+    updated_at = models.DateTimeField(auto_now=True)
     # Could add description or image later
 
     class Meta:
@@ -35,11 +39,91 @@ class MenuItem(models.Model):
     price = models.DecimalField(max_digits=6, decimal_places=2)
     image = models.ImageField(upload_to='menu_items/', blank=True, null=True) # Needs Pillow installed
     is_available = models.BooleanField(default=True)
+    # Inventory: leave daily_stock empty for items that are not stock-tracked.
+    # stock_remaining is reset to daily_stock on the first sale of each day
+    # (see api.inventory) and only ever changed with conditional F() updates.
+    daily_stock = models.PositiveIntegerField(null=True, blank=True)
+    stock_remaining = models.PositiveIntegerField(null=True, blank=True)
+    stock_date = models.DateField(null=True, blank=True)
+    # Kitchen effort for one portion, used by pickup slots measured in prep units
+    prep_units = models.PositiveSmallIntegerField(default=1)
+    # Bulk stock updates in api.inventory bump this explicitly, as .update() skips auto_now
+    updated_at = models.DateTimeField(auto_now=True)
     # Add allergens, nutritional info later if needed
 
+    objects = ShardedManager()
+
+    class Meta:
+        indexes = [
+            # A canteen's available menu grouped by category (api.catalog)
+            models.Index(fields=['canteen', 'is_available', 'category'], name='menuitem_catalog_idx'),
+        ]
+
+    @property
+    def is_stock_tracked(self):
+        return self.daily_stock is not None or self.stock_remaining is not None
+
     def __str__(self):
         return f"{self.name} ({self.canteen.name})"
 
+class AvailabilityWindow(models.Model):
+    """
+    Local times on some weekdays when a menu item can be ordered (e.g. breakfast
+    items 07:00-11:00 on weekdays). An item without windows is always orderable
+    while ``is_available``; see api.availability.
+    """
+    menu_item = models.ForeignKey(MenuItem, on_delete=models.CASCADE, related_name='availability_windows')
+    weekdays = models.PositiveSmallIntegerField(default=0b1111111) # Bit 0 is Monday
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ShardedManager()
+
+    class Meta:
+        ordering = ['start_time']
+
+    def __str__(self):
+        return f"{self.menu_item_id}: {self.start_time:%H:%M}-{self.end_time:%H:%M} ({self.weekdays:07b})"
+
+class PickupSlot(models.Model):
+    """A daily pickup window with a fixed kitchen capacity."""
+    CAPACITY_UNIT_CHOICES = (
+        ('ORDERS', 'Orders'),
+        ('PREP_UNITS', 'Prep units'),
+    )
+
+    canteen = models.ForeignKey(Canteen, on_delete=models.CASCADE, related_name='pickup_slots')
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+    capacity = models.PositiveIntegerField()
+    capacity_unit = models.CharField(max_length=20, choices=CAPACITY_UNIT_CHOICES, default='ORDERS')
+    is_active = models.BooleanField(default=True)
+
+    objects = ShardedManager()
+
+    class Meta:
+        ordering = ['start_time']
+        unique_together = ('canteen', 'start_time')
+
+    def __str__(self):
+        return f"{self.canteen.name} {self.start_time:%H:%M}-{self.end_time:%H:%M}"
+
+class PickupSlotUsage(models.Model):
+    """Booked capacity of a slot on one day; only changed with conditional F() updates."""
+    slot = models.ForeignKey(PickupSlot, on_delete=models.CASCADE, related_name='usage')
+    date = models.DateField()
+    capacity = models.PositiveIntegerField() # Copied from the slot so bookings need no join
+    booked = models.PositiveIntegerField(default=0)
+
+    objects = ShardedManager()
+
+    class Meta:
+        unique_together = ('slot', 'date')
+
+    def __str__(self):
+        return f"{self.slot} on {self.date}: {self.booked}/{self.capacity}"
+
 class Order(models.Model):
     STATUS_CHOICES = (
         ('PENDING', 'Pending'),
@@ -57,8 +141,36 @@ class Order(models.Model):
     total_price = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
     notes = models.TextField(blank=True, null=True)
     table_number = models.CharField(max_length=10, blank=True, null=True) # Add table number field
-    razorpay_order_id = models.CharField(max_length=100, null=True, blank=True)
-    razorpay_payment_id = models.CharField(max_length=100, null=True, blank=True)
+    razorpay_order_id = models.CharField(max_length=100, null=True, blank=True, db_index=True)
+    razorpay_payment_id = models.CharField(max_length=100, null=True, blank=True, db_index=True)
+    pickup_slot = models.ForeignKey('PickupSlot', on_delete=models.SET_NULL, null=True, blank=True, related_name='orders')
+    pickup_date = models.DateField(null=True, blank=True)
+    # Capacity this order takes from its slot, kept so cancellation can give it back
+    slot_load = models.PositiveIntegerField(default=0)
+    ready_at = models.DateTimeField(null=True, blank=True) # Set when the kitchen marks the order READY
+    # Denormalized from the order's items when it is placed, so history lists need no JOIN
+    item_count = models.PositiveIntegerField(default=0)
+    items_preview = models.CharField(max_length=255, blank=True, default='')
+    # Short number the counter calls out, counting from 1 per canteen and day (see api.tokens)
+    pickup_token = models.PositiveIntegerField(null=True, blank=True)
+    token_date = models.DateField(null=True, blank=True)
+
+    objects = ShardedManager()
+
+    class Meta:
+        indexes = [
+            # Queue depth lookups for ETA: active orders of one canteen by age
+            models.Index(fields=['canteen', 'status', 'created_at'], name='order_queue_idx'),
+            # A customer's order history, newest first
+            models.Index(fields=['customer', '-created_at'], name='order_history_idx'),
+            # Admin order search (api.filters.AdminOrderFilter)
+            models.Index(fields=['-created_at'], name='order_created_idx'),
+            models.Index(fields=['status', '-created_at'], name='order_status_created_idx'),
+            models.Index(fields=['canteen', 'table_number'], name='order_table_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['canteen', 'token_date', 'pickup_token'], name='order_pickup_token_uniq'),
+        ]
 
     def __str__(self):
         return f"Order {self.id} by {self.customer.username} at {self.canteen.name}"
@@ -71,9 +183,218 @@ class OrderItem(models.Model):
     quantity = models.PositiveIntegerField(default=1)
     price = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
 
+    objects = ShardedManager()
+
     def __str__(self):
         return f"{self.quantity} x {self.menu_item.name} (Order {self.order.id})"
         
     @property
     def total_item_price(self):
         return self.quantity * self.price
+
+class StockReservation(models.Model):
+    """Stock held for a customer while they complete a Razorpay payment."""
+    menu_item = models.ForeignKey(MenuItem, related_name='reservations', on_delete=models.CASCADE)
+    customer = models.ForeignKey(User, on_delete=models.CASCADE)
+    razorpay_order_id = models.CharField(max_length=100, db_index=True)
+    quantity = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    objects = ShardedManager()
+
+    def __str__(self):
+        return f"{self.quantity} x {self.menu_item_id} held for {self.razorpay_order_id}"
+
+
+class CheckoutCart(models.Model):
+    """
+    The cart a Razorpay order was created for, as priced by the server. Payment
+    verification builds the order from it and checks the captured amount against it.
+    The pickup slot is booked at checkout too and held while ``slot_held`` is set.
+    A cart whose captured payment could not become an order is kept as ``FAILED``
+    for refunds and the reconciliation report instead of being deleted.
+    """
+    STATUS_CHOICES = (
+        ('OPEN', 'Awaiting payment'),
+        ('FAILED', 'Paid, order failed'),
+    )
+
+    razorpay_order_id = models.CharField(max_length=100, unique=True)
+    customer = models.ForeignKey(User, on_delete=models.CASCADE)
+    canteen = models.ForeignKey(Canteen, on_delete=models.CASCADE)
+    lines = models.JSONField() # {menu_item_id: quantity}, keys as strings
+    amount = models.PositiveIntegerField() # Charged, in paise
+    currency = models.CharField(max_length=3, default='INR')
+    pickup_slot = models.ForeignKey(PickupSlot, on_delete=models.SET_NULL, null=True, blank=True)
+    pickup_date = models.DateField(null=True, blank=True)
+    slot_load = models.PositiveIntegerField(default=0)
+    slot_held = models.BooleanField(default=False) # Cleared when an unpaid checkout's booking is released
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='OPEN')
+    razorpay_payment_id = models.CharField(max_length=100, blank=True) # The captured payment of a FAILED cart
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    objects = ShardedManager()
+
+    def __str__(self):
+        return f"Cart of {self.razorpay_order_id} ({self.amount} {self.currency})"
+
+
+class PickupTokenCounter(models.Model):
+    """Last pickup token handed out by a canteen on a day; only ever changed with F() increments."""
+    canteen = models.ForeignKey(Canteen, on_delete=models.CASCADE, related_name='pickup_token_counters')
+    date = models.DateField()
+    last_token = models.PositiveIntegerField(default=0)
+
+    objects = ShardedManager()
+
+    class Meta:
+        unique_together = ('canteen', 'date')
+
+    def __str__(self):
+        return f"{self.canteen.name} on {self.date}: {self.last_token}"
+
+
+class PrepTimeStat(models.Model):
+    """
+    Rolling PENDING->READY statistics, rebuilt by ``manage.py refresh_prep_stats``.
+    Rows without a menu item hold the canteen-wide per-order figures.
+    """
+    canteen = models.ForeignKey(Canteen, on_delete=models.CASCADE, related_name='prep_stats')
+    menu_item = models.ForeignKey(MenuItem, on_delete=models.CASCADE, null=True, blank=True, related_name='prep_stats')
+    sample_count = models.PositiveIntegerField()
+    median_seconds = models.FloatField()
+    p90_seconds = models.FloatField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ShardedManager()
+
+    def __str__(self):
+        subject = self.menu_item.name if self.menu_item_id else self.canteen.name
+        return f"{subject}: {self.median_seconds:.0f}s median over {self.sample_count} orders"
+
+class ItemPairing(models.Model):
+    """
+    A menu item often ordered together with ``menu_item``; its top neighbours
+    are rebuilt by ``manage.py build_pairings`` (see api.recommendations).
+    """
+    canteen = models.ForeignKey(Canteen, on_delete=models.CASCADE, related_name='item_pairings')
+    menu_item = models.ForeignKey(MenuItem, on_delete=models.CASCADE, related_name='pairings')
+    paired_item = models.ForeignKey(MenuItem, on_delete=models.CASCADE, related_name='+')
+    order_count = models.PositiveIntegerField() # Orders containing both items
+    confidence = models.FloatField() # Share of menu_item's orders that also contain paired_item
+
+    objects = ShardedManager()
+
+    class Meta:
+        unique_together = ('menu_item', 'paired_item')
+        indexes = [
+            # A menu item's neighbours, best first
+            models.Index(fields=['menu_item', '-confidence'], name='pairing_neighbours_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.menu_item_id} -> {self.paired_item_id} ({self.confidence:.0%})"
+
+class PairingMatrix(models.Model):
+    """
+    A canteen's item x item co-occurrence counts as of ``last_order_id``, kept
+    so ``build_pairings`` only has to add the orders placed since.
+    """
+    canteen = models.OneToOneField(Canteen, on_delete=models.CASCADE, related_name='pairing_matrix')
+    last_order_id = models.BigIntegerField(default=0)
+    order_count = models.PositiveIntegerField(default=0)
+    matrix = models.BinaryField() # .npz of the item ids, per-item order counts and the sparse matrix
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ShardedManager()
+
+    def __str__(self):
+        return f"Pairings of {self.canteen.name} up to order {self.last_order_id}"
+
+class DemandForecast(models.Model):
+    """Expected portions of a menu item in one hour of a day, written by ``manage.py forecast_demand``."""
+    canteen = models.ForeignKey(Canteen, on_delete=models.CASCADE, related_name='demand_forecasts')
+    menu_item = models.ForeignKey(MenuItem, on_delete=models.CASCADE, related_name='demand_forecasts')
+    date = models.DateField()
+    hour = models.PositiveSmallIntegerField() # Local hour of day, 0-23
+    quantity = models.FloatField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ShardedManager()
+
+    class Meta:
+        unique_together = ('menu_item', 'date', 'hour')
+        indexes = [
+            models.Index(fields=['canteen', 'date'], name='forecast_canteen_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.menu_item_id} on {self.date} {self.hour:02d}:00: {self.quantity:.1f}"
+
+class Notification(models.Model):
+    """
+    Outbox row for one order event on one channel, written in the transaction
+    that changed the order and delivered by ``manage.py dispatch_notifications``.
+    """
+    STATUS_CHOICES = (
+        ('PENDING', 'Pending'),
+        ('SENT', 'Sent'),
+        ('FAILED', 'Failed'),
+    )
+
+    canteen = models.ForeignKey(Canteen, on_delete=models.CASCADE, related_name='notifications')
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='notifications')
+    channel = models.CharField(max_length=20) # Key of settings.NOTIFICATION_CHANNELS
+    event = models.CharField(max_length=30)
+    payload = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField()
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    objects = ShardedManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'channel', 'next_attempt_at'], name='notification_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.event} for order {self.order_id} via {self.channel} ({self.status})"
+
+class PushSubscription(models.Model):
+    """A browser's Web Push subscription (from ``PushManager.subscribe()``) for order notifications."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='push_subscriptions')
+    endpoint = models.URLField(max_length=500, unique=True)
+    p256dh = models.CharField(max_length=200)
+    auth = models.CharField(max_length=100)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.user.username}: {self.endpoint[:60]}"
+
+class IdempotencyRecord(models.Model):
+    """
+    First response to a request sent with an ``Idempotency-Key`` header, replayed
+    for retries with the same key. ``status_code`` stays empty while the first
+    request is still being processed.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_records')
+    key = models.CharField(max_length=255)
+    endpoint = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    content_type = models.CharField(max_length=100, blank=True)
+    response_body = models.BinaryField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        unique_together = ('user', 'key')
+
+    def __str__(self):
+        return f"{self.key} ({self.endpoint})"
@@ -0,0 +1,274 @@
+"""
+Customer notifications for order status changes.
+
+``enqueue_status_change`` writes one ``Notification`` per configured channel in
+the transaction that changes the order (a transactional outbox): the rows
+commit or roll back with the status, and the request never waits for email
+servers or push services.
+
+``Dispatcher`` delivers them. Per channel it claims batches of due rows
+(``select_for_update(skip_locked=True)`` plus a lease, so several dispatchers can
+run), sends up to ``CONCURRENCY`` batches at once on the channel's own thread
+pool and records the outcome: sent, retried after an exponential backoff, or
+failed after ``NOTIFICATION_MAX_ATTEMPTS``. Only the sends run on the pools;
+all database work stays on the dispatcher thread.
+"""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+import hashlib
+import hmac
+import json
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+import requests
+
+from .models import Notification, PushSubscription
+from .sharding import shard_aliases
+
+logger = logging.getLogger(__name__)
+
+MESSAGES = {
+    'READY': ("Order {number} is ready", "Your order {number} is ready for pickup at {canteen}."),
+    'CANCELLED': ("Order {number} was cancelled", "Your order {number} at {canteen} was cancelled."),
+}
+
+
+def order_payload(order):
+    return {
+        'order_id': order.pk,
+        'status': order.status,
+        'pickup_token': order.pickup_token,
+        'number': f"#{order.pickup_token or order.pk}", # Orders from before pickup tokens have none
+        'canteen_id': order.canteen_id,
+        'canteen': order.canteen.name,
+        'customer_id': order.customer_id,
+        'email': order.customer.email,
+        'changed_at': timezone.now().isoformat(),
+    }
+
+
+def enqueue_status_change(order, using=None):
+    """Queue notifications for ``order``'s new status; call inside the transaction that saved it."""
+    if order.status not in settings.NOTIFICATION_STATUSES or not settings.NOTIFICATION_CHANNELS:
+        return []
+    payload, now = order_payload(order), timezone.now()
+    return Notification.objects.using(using).bulk_create([
+        Notification(canteen_id=order.canteen_id, order=order, channel=channel, event=f"order.{order.status.lower()}",
+                     payload=payload, next_attempt_at=now)
+        for channel in settings.NOTIFICATION_CHANNELS
+    ])
+
+
+def retry_delay(attempts):
+    """Backoff before retry number ``attempts``: doubling from the base, capped, with jitter."""
+    delay = min(settings.NOTIFICATION_RETRY_MAX_SECONDS, settings.NOTIFICATION_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+    return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+
+class Channel:
+    """
+    Delivery channel configured by an entry of ``NOTIFICATION_CHANNELS``.
+
+    ``prepare`` runs on the dispatcher thread and may read the database;
+    ``send`` runs on the channel's pool and returns ``{notification id: error}``
+    for the notifications that failed (raising fails the whole batch).
+    """
+
+    def __init__(self, name, BATCH_SIZE=50, CONCURRENCY=1, **options):
+        self.name = name
+        self.batch_size = BATCH_SIZE
+        self.concurrency = CONCURRENCY
+        self.options = options
+
+    def prepare(self, notifications):
+        return notifications
+
+    def send(self, batch):
+        raise NotImplementedError
+
+
+class EmailChannel(Channel):
+    """Mails the customer through ``EMAIL_BACKEND``, one connection per batch."""
+
+    def send(self, batch):
+        errors = {}
+        with get_connection() as connection:
+            for notification in batch:
+                payload = notification.payload
+                if not payload.get('email'):
+                    continue # Nothing to send to
+                subject, body = (text.format(**payload) for text in MESSAGES[payload['status']])
+                try:
+                    EmailMessage(subject, body, to=[payload['email']], connection=connection).send()
+                except Exception as e:
+                    errors[notification.pk] = str(e)
+        return errors
+
+
+class _HttpChannel(Channel):
+    def __init__(self, name, **options):
+        super().__init__(name, **options)
+        self._local = threading.local()
+
+    @property
+    def session(self):
+        # requests sessions are not safe to share between the pool's threads
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+        return self._local.session
+
+
+class WebhookChannel(_HttpChannel):
+    """
+    POSTs each batch as ``{"notifications": [...]}`` to every URL in ``URLS``,
+    signed with an HMAC-SHA256 of the body in ``X-Canteen-Signature``.
+    """
+
+    def send(self, batch):
+        body = json.dumps({'notifications': [{'id': n.pk, 'event': n.event, **n.payload} for n in batch]}).encode()
+        signature = hmac.new(self.options.get('SECRET', '').encode(), body, hashlib.sha256).hexdigest()
+        for url in self.options['URLS']:
+            response = self.session.post(
+                url, data=body, timeout=settings.NOTIFICATION_TIMEOUT_SECONDS,
+                headers={'Content-Type': 'application/json', 'X-Canteen-Signature': signature},
+            )
+            response.raise_for_status()
+        return {}
+
+
+class WebPushChannel(_HttpChannel):
+    """Web Push to the customer's ``PushSubscription``s, VAPID-signed with ``pywebpush``."""
+
+    def prepare(self, notifications):
+        subscriptions = {}
+        for subscription in PushSubscription.objects.filter(
+            user_id__in={n.payload['customer_id'] for n in notifications}
+        ):
+            subscriptions.setdefault(subscription.user_id, []).append(subscription)
+        return [(n, subscriptions.get(n.payload['customer_id'], [])) for n in notifications]
+
+    def send(self, batch):
+        from pywebpush import WebPushException, webpush # Optional dependency, only needed with VAPID keys
+        errors = {}
+        for notification, subscriptions in batch:
+            title, body = (text.format(**notification.payload) for text in MESSAGES[notification.payload['status']])
+            data = json.dumps({'title': title, 'body': body, **notification.payload})
+            for subscription in subscriptions:
+                try:
+                    webpush(
+                        {'endpoint': subscription.endpoint, 'keys': {'p256dh': subscription.p256dh, 'auth': subscription.auth}},
+                        data, vapid_private_key=self.options['VAPID_PRIVATE_KEY'],
+                        vapid_claims={'sub': self.options['VAPID_SUBJECT']},
+                        timeout=settings.NOTIFICATION_TIMEOUT_SECONDS, requests_session=self.session,
+                    )
+                except WebPushException as e:
+                    if e.response is not None and e.response.status_code in (404, 410):
+                        logger.info(f"Push subscription {subscription.pk} has expired")
+                        continue # The browser unsubscribed; other subscriptions still count
+                    errors[notification.pk] = str(e)
+        return errors
+
+
+def load_channels(config=None):
+    config = settings.NOTIFICATION_CHANNELS if config is None else config
+    return {name: import_string(options['BACKEND'])(name, **{k: v for k, v in options.items() if k != 'BACKEND'})
+            for name, options in config.items()}
+
+
+class Dispatcher:
+    """Delivers due notifications on every shard; see the module docstring."""
+
+    def __init__(self, channels=None):
+        self.channels = load_channels() if channels is None else channels
+        self.pools = {
+            name: ThreadPoolExecutor(max_workers=channel.concurrency, thread_name_prefix=f"notify-{name}")
+            for name, channel in self.channels.items()
+        }
+
+    def claim(self, alias, channel, now):
+        """Lease the next batch of ``channel``'s due notifications on ``alias``."""
+        with transaction.atomic(using=alias):
+            batch = list(
+                Notification.objects.using(alias).select_for_update(skip_locked=True)
+                .filter(channel=channel.name, status='PENDING', next_attempt_at__lte=now)
+                .order_by('next_attempt_at', 'pk')[:channel.batch_size]
+            )
+            if batch:
+                Notification.objects.using(alias).filter(pk__in=[n.pk for n in batch]).update(
+                    next_attempt_at=now + timedelta(seconds=settings.NOTIFICATION_LEASE_SECONDS),
+                )
+        return batch
+
+    def record(self, alias, channel, batch, errors):
+        now = timezone.now()
+        delivered = [n.pk for n in batch if n.pk not in errors]
+        Notification.objects.using(alias).filter(pk__in=delivered).update(
+            status='SENT', sent_at=now, attempts=F('attempts') + 1, last_error='',
+        )
+        failed = [n for n in batch if n.pk in errors]
+        for notification in failed:
+            notification.attempts += 1
+            notification.last_error = errors[notification.pk][:2000]
+            if notification.attempts >= settings.NOTIFICATION_MAX_ATTEMPTS:
+                notification.status = 'FAILED'
+                logger.warning(f"Giving up on notification {notification.pk} via {channel.name}: {notification.last_error}")
+            else:
+                notification.next_attempt_at = now + retry_delay(notification.attempts)
+        Notification.objects.using(alias).bulk_update(failed, ['attempts', 'last_error', 'status', 'next_attempt_at'])
+        return len(delivered), len(failed)
+
+    def run_once(self, now=None):
+        """Deliver everything due at ``now``; returns ``(sent, failed attempts)``."""
+        now = now or timezone.now()
+        queues = [(alias, channel) for alias in shard_aliases() for channel in self.channels.values()]
+        in_flight, busy = {}, dict.fromkeys(self.channels, 0)
+        sent = failed = 0
+        while queues or in_flight:
+            for alias, channel in list(queues):
+                while busy[channel.name] < channel.concurrency:
+                    batch = self.claim(alias, channel, now)
+                    if not batch:
+                        queues.remove((alias, channel))
+                        break
+                    future = self.pools[channel.name].submit(channel.send, channel.prepare(batch))
+                    in_flight[future] = (alias, channel, batch)
+                    busy[channel.name] += 1
+            if not in_flight:
+                break
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                alias, channel, batch = in_flight.pop(future)
+                busy[channel.name] -= 1
+                try:
+                    errors = future.result()
+                except Exception as e:
+                    logger.warning(f"Sending {len(batch)} notifications via {channel.name} failed: {e}")
+                    errors = {n.pk: str(e) or type(e).__name__ for n in batch}
+                delivered, retried = self.record(alias, channel, batch, errors)
+                sent += delivered
+                failed += retried
+        return sent, failed
+
+    def run(self, poll_seconds=None, stop=None):
+        """``run_once`` every ``poll_seconds`` until ``stop`` (a ``threading.Event``) is set."""
+        poll_seconds = settings.NOTIFICATION_POLL_SECONDS if poll_seconds is None else poll_seconds
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            started = time.monotonic()
+            sent, failed = self.run_once()
+            if sent or failed:
+                logger.info(f"Sent {sent} notifications, {failed} failed attempts")
+            stop.wait(max(0, poll_seconds - (time.monotonic() - started)))
+
+    def close(self):
+        for pool in self.pools.values():
+            pool.shutdown(wait=True)
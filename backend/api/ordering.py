@@ -0,0 +1,82 @@
+"""
+Order placement shared by ``OrderWriteSerializer``, the bulk group-order
+endpoint and ``VerifyPaymentView``.
+
+``place_orders`` takes stock, books pickup slots, prices the lines with
+``api.pricing``, numbers the orders with the day's pickup tokens and inserts
+any number of orders with two ``bulk_create`` calls inside a single
+transaction. It raises ``OutOfStock`` or ``SlotUnavailable`` and leaves it to
+the caller to turn those into a response.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from .inventory import aggregate_quantities, decrement_stock
+from .models import Order, OrderItem
+from .pricing import cart_total, check_prices
+from .scheduling import assign_slot
+from .sharding import use_canteen_shard
+from .tokens import next_pickup_tokens
+
+PREVIEW_MAX_LENGTH = 120
+
+
+def items_preview(lines, max_length=PREVIEW_MAX_LENGTH):
+    """Short "2x Tea, 1x Samosa" text for history lists, cut at ``max_length``."""
+    preview = ', '.join(f"{quantity}x {menu_item.name}" for menu_item, quantity in lines.items())
+    if len(preview) > max_length:
+        preview = preview[:max_length - 1].rstrip(', ') + '…'
+    return preview
+
+
+def place_orders(customer, canteen, specs, take_stock=True):
+    """
+    Create one order per spec and return them in the same order.
+
+    Each spec is a dict with ``lines`` (``{menu_item: quantity}``) and optional
+    ``table_number``, ``notes``, ``pickup_slot`` and extra ``Order`` fields under
+    ``fields``; ``booked_slot`` (``(slot, date, load)`` from ``assign_slot``)
+    skips the booking for a slot taken earlier. Pass ``take_stock=False`` when
+    stock was already settled, e.g. by a payment reservation. Everything runs
+    on the canteen's shard.
+    """
+    with use_canteen_shard(canteen) as alias, transaction.atomic(using=alias):
+        if take_stock:
+            decrement_stock(aggregate_quantities(
+                (menu_item, quantity) for spec in specs for menu_item, quantity in spec['lines'].items()
+            ))
+
+        orders = []
+        for spec in specs:
+            check_prices(spec['lines'])
+            if 'booked_slot' in spec:
+                slot, pickup_date, slot_load = spec['booked_slot'] # Booked at checkout
+            else:
+                slot, pickup_date, slot_load = assign_slot(canteen, spec['lines'], slot=spec.get('pickup_slot'))
+            values = dict(
+                customer=customer,
+                canteen=canteen,
+                table_number=spec.get('table_number'),
+                notes=spec.get('notes'),
+                total_price=cart_total(spec['lines']),
+                pickup_slot=slot,
+                pickup_date=pickup_date,
+                slot_load=slot_load,
+                item_count=sum(spec['lines'].values()),
+                items_preview=items_preview(spec['lines']),
+            )
+            values.update(spec.get('fields', {}))
+            orders.append(Order(**values))
+
+        # Last before the INSERTs: the day's counter row stays locked until commit
+        token_date = timezone.localdate()
+        for order, token in zip(orders, next_pickup_tokens(canteen, token_date, len(orders))):
+            order.pickup_token, order.token_date = token, token_date
+        Order.objects.bulk_create(orders)
+
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, menu_item=menu_item, quantity=quantity, price=menu_item.price)
+            for order, spec in zip(orders, specs)
+            for menu_item, quantity in spec['lines'].items()
+        ])
+    return orders
@@ -0,0 +1,103 @@
+import json
+
+from django.conf import settings
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.db import connections
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+
+
+class OrderHistoryPagination(PageNumberPagination):
+    """Pages of a customer's order summaries, newest first."""
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+def planner_estimate(queryset):
+    """Row estimate from PostgreSQL's EXPLAIN, or None where no planner estimate is available."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator whose total comes from the query planner once it is at least
+    ``ESTIMATED_COUNT_THRESHOLD`` rows; smaller totals are counted exactly.
+    Pages past the estimated end are still served, they may just be empty.
+    """
+
+    def __init__(self, object_list, per_page, exact=False, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.exact = exact
+        self.is_estimate = False
+
+    def _estimate(self):
+        # Sharded results expose their per-shard querysets
+        querysets = getattr(self.object_list, 'querysets', [self.object_list])
+        if not all(isinstance(qs, QuerySet) for qs in querysets):
+            return None
+        estimates = [planner_estimate(qs) for qs in querysets]
+        return None if None in estimates else sum(estimates)
+
+    @cached_property
+    def count(self):
+        if not self.exact:
+            estimate = self._estimate()
+            if estimate is not None and estimate >= settings.ESTIMATED_COUNT_THRESHOLD:
+                self.is_estimate = True
+                return estimate
+        return super().count
+
+    def validate_number(self, number):
+        self.count # Decides whether the total is an estimate
+        if not self.is_estimate:
+            return super().validate_number(number)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger("That page number is not an integer")
+        if number < 1:
+            raise EmptyPage("That page number is less than 1")
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if not self.is_estimate:
+            return super().page(number)
+        bottom = (number - 1) * self.per_page
+        return self._get_page(self.object_list[bottom:bottom + self.per_page], number, self)
+
+
+class EstimatedCountPagination(PageNumberPagination):
+    """Page numbers with planner-estimated totals; ``?exact_count=1`` asks for a real COUNT(*)."""
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    exact_count_query_param = 'exact_count'
+
+    def django_paginator_class(self, object_list, per_page):
+        return EstimatedCountPaginator(object_list, per_page, exact=self.exact_count)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.exact_count = request.query_params.get(self.exact_count_query_param) in ('1', 'true')
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': self.page.paginator.count,
+            'count_is_estimate': self.page.paginator.is_estimate,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
@@ -0,0 +1,198 @@
+"""
+Payment gateway access.
+
+Views and jobs talk to ``get_gateway()`` instead of a Razorpay client so the
+gateway can be swapped with ``settings.PAYMENT_GATEWAY``: ``RazorpayGateway``
+in production, ``FakeGateway`` (an in-process stand-in that signs payments the
+way Razorpay does) in tests and load tests. Payments are returned as plain
+dicts with ``id``, ``order_id``, ``status``, ``amount`` (paise), ``currency``
+and ``created_at``.
+"""
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone as dt_timezone
+import hashlib
+import hmac
+import itertools
+import logging
+import threading
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class GatewayNotConfigured(Exception):
+    """Raised when the gateway has no credentials."""
+
+
+class SignatureMismatch(Exception):
+    """Raised when a payment signature does not match the order and payment ids."""
+
+
+class PaymentNotFound(Exception):
+    """Raised when the gateway has no payment with the requested id."""
+
+
+def payment_signature(secret, order_id, payment_id):
+    """Razorpay checkout signature: HMAC-SHA256 of ``order_id|payment_id``."""
+    return hmac.new(secret.encode(), f"{order_id}|{payment_id}".encode(), hashlib.sha256).hexdigest()
+
+
+class PaymentGateway(ABC):
+    @abstractmethod
+    def create_order(self, amount, currency, receipt, notes):
+        """Create a gateway order for ``amount`` paise; returns a dict with its ``id``."""
+
+    @abstractmethod
+    def verify_payment_signature(self, order_id, payment_id, signature):
+        """Raise ``SignatureMismatch`` unless the checkout signature is genuine."""
+
+    @abstractmethod
+    def fetch_payment(self, payment_id):
+        """The payment ``payment_id`` as a payment dict; raise ``PaymentNotFound`` if there is none."""
+
+    @abstractmethod
+    def iter_payments(self, start, end, page_size=100):
+        """Yield pages (lists) of payments created in ``[start, end)``."""
+
+
+class RazorpayGateway(PaymentGateway):
+    page_size_limit = 100 # Razorpay's maximum for list endpoints
+
+    def __init__(self):
+        self._client = None
+        if not settings.RAZORPAY_KEY_ID or not settings.RAZORPAY_KEY_SECRET:
+            logger.warning("Razorpay gateway has no keys; payment endpoints will fail.")
+
+    @property
+    def client(self):
+        # Built on first use so importing views does not pay for the SDK and its HTTP session
+        if self._client is None:
+            if not settings.RAZORPAY_KEY_ID or not settings.RAZORPAY_KEY_SECRET:
+                raise GatewayNotConfigured("Razorpay client not initialized")
+            import razorpay
+            self._client = razorpay.Client(auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET))
+        return self._client
+
+    def create_order(self, amount, currency, receipt, notes):
+        return self.client.order.create(dict(
+            amount=amount,
+            currency=currency,
+            receipt=receipt,
+            notes=notes,
+            payment_capture='1' # Auto capture payment
+        ))
+
+    def verify_payment_signature(self, order_id, payment_id, signature):
+        import razorpay
+        try:
+            self.client.utility.verify_payment_signature({
+                'razorpay_order_id': order_id,
+                'razorpay_payment_id': payment_id,
+                'razorpay_signature': signature,
+            })
+        except razorpay.errors.SignatureVerificationError as e:
+            raise SignatureMismatch(str(e))
+
+    def fetch_payment(self, payment_id):
+        import razorpay
+        try:
+            return self._payment(self.client.payment.fetch(payment_id))
+        except razorpay.errors.BadRequestError as e: # Razorpay's answer to an unknown id
+            raise PaymentNotFound(str(e))
+
+    def iter_payments(self, start, end, page_size=100):
+        page_size = min(page_size, self.page_size_limit)
+        for skip in itertools.count(0, page_size):
+            page = self.client.payment.all({
+                'from': int(start.timestamp()), 'to': int(end.timestamp()) - 1, 'count': page_size, 'skip': skip,
+            })
+            items = page.get('items', [])
+            if items:
+                yield [self._payment(item) for item in items]
+            if len(items) < page_size:
+                return
+
+    @staticmethod
+    def _payment(item):
+        return {
+            'id': item['id'],
+            'order_id': item.get('order_id'),
+            'status': item['status'],
+            'amount': item['amount'],
+            'currency': item.get('currency', 'INR'),
+            'created_at': datetime.fromtimestamp(item['created_at'], tz=dt_timezone.utc),
+        }
+
+
+class FakeGateway(PaymentGateway):
+    """
+    In-process gateway for tests and load tests. State is shared by all
+    instances of the process; ``capture()`` plays the customer paying.
+    """
+    secret = 'fake-gateway-secret'
+    _lock = threading.Lock()
+    _ids = itertools.count(1)
+    _orders = {}
+    _payments = {}
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls._orders.clear()
+            cls._payments.clear()
+
+    def create_order(self, amount, currency, receipt, notes):
+        with self._lock:
+            order = {'id': f"order_fake{next(self._ids):010d}", 'amount': amount, 'currency': currency,
+                     'receipt': receipt, 'notes': notes, 'status': 'created'}
+            self._orders[order['id']] = order
+        return dict(order)
+
+    def capture(self, order_id, amount=None, status='captured', created_at=None):
+        """Record a payment for ``order_id``; returns ``(payment, signature)`` like checkout does."""
+        with self._lock:
+            order = self._orders.get(order_id, {'amount': amount, 'currency': 'INR'})
+            payment = {
+                'id': f"pay_fake{next(self._ids):010d}",
+                'order_id': order_id,
+                'status': status,
+                'amount': order['amount'] if amount is None else amount,
+                'currency': order['currency'],
+                'created_at': created_at or timezone.now(),
+            }
+            self._payments[payment['id']] = payment
+        return dict(payment), payment_signature(self.secret, order_id, payment['id'])
+
+    def verify_payment_signature(self, order_id, payment_id, signature):
+        expected = payment_signature(self.secret, order_id, payment_id)
+        if not hmac.compare_digest(expected, signature or ''):
+            raise SignatureMismatch("Razorpay Signature Verification Failed")
+
+    def fetch_payment(self, payment_id):
+        with self._lock:
+            if payment_id not in self._payments:
+                raise PaymentNotFound(payment_id)
+            return dict(self._payments[payment_id])
+
+    def iter_payments(self, start, end, page_size=100):
+        with self._lock:
+            payments = sorted(
+                (p for p in self._payments.values() if start <= p['created_at'] < end),
+                key=lambda p: (p['created_at'], p['id']),
+            )
+        for offset in range(0, len(payments), page_size):
+            yield [dict(p) for p in payments[offset:offset + page_size]]
+
+
+_gateways = {}
+
+
+def get_gateway():
+    """The configured gateway, one instance per ``PAYMENT_GATEWAY`` path and process."""
+    path = settings.PAYMENT_GATEWAY
+    if path not in _gateways:
+        _gateways[path] = import_string(path)()
+    return _gateways[path]
@@ -0,0 +1,128 @@
+"""
+Cart pricing shared by quotes, checkout and order placement.
+
+Prices are only ever computed here, from the menu, never taken from the
+client. ``quote`` answers from a per-canteen ``{menu_item_id: (name, price)}``
+table kept in process memory, so a cart is priced without touching the
+database. A table is rebuilt after ``PRICE_TABLE_SECONDS`` or as soon as a menu
+item of its canteen is saved or deleted in this process (menu imports drop
+all tables).
+
+Checkout prices the rows it has just loaded with the same arithmetic
+(``cart_total``) and calls ``check_prices`` to drop a table that disagrees
+with them, so the next quote shows what is actually charged.
+"""
+from decimal import Decimal
+import threading
+import time
+
+from django.conf import settings
+
+from .models import MenuItem
+from .sharding import shard_for_canteen
+
+CURRENCY = 'INR'
+CENTS = Decimal('0.01')
+
+
+class UnknownMenuItem(ValueError):
+    """Raised when a cart line is not on the canteen's menu."""
+
+
+def line_total(unit_price, quantity):
+    return (Decimal(unit_price) * quantity).quantize(CENTS)
+
+
+def cart_total(lines):
+    """Total of ``{menu_item: quantity}`` at the items' current prices."""
+    return sum((line_total(menu_item.price, quantity) for menu_item, quantity in lines.items()), Decimal('0.00'))
+
+
+def to_paise(amount):
+    return int((Decimal(amount) * 100).to_integral_value())
+
+
+def parse_cart(items_data):
+    """``[{menu_item_id, quantity}]`` from a request as ``{menu_item_id: quantity}``, or ``ValueError``."""
+    if not isinstance(items_data, list) or not items_data:
+        raise ValueError("Cart items must be a non-empty list.")
+    cart = {}
+    for item_data in items_data:
+        menu_item_id = item_data.get('menu_item_id') if isinstance(item_data, dict) else None
+        quantity = item_data.get('quantity') if isinstance(item_data, dict) else None
+        if not isinstance(menu_item_id, int) or isinstance(menu_item_id, bool):
+            raise ValueError(f"Missing menu_item_id in item data: {item_data}")
+        if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity <= 0:
+            raise ValueError(f"Invalid quantity in item data: {item_data}")
+        cart[menu_item_id] = cart.get(menu_item_id, 0) + quantity
+    return cart
+
+
+class PriceTable:
+    """Names and prices of one canteen's menu items."""
+
+    def __init__(self, canteen_id, rows):
+        self.canteen_id = canteen_id
+        self.items = {pk: (name, price) for pk, name, price in rows}
+
+    def quote(self, cart):
+        """Priced ``{menu_item_id: quantity}``; raises ``UnknownMenuItem`` for items of other canteens."""
+        lines = []
+        for menu_item_id, quantity in cart.items():
+            if menu_item_id not in self.items:
+                raise UnknownMenuItem(f"Menu item {menu_item_id} is not on the menu of canteen {self.canteen_id}")
+            name, price = self.items[menu_item_id]
+            lines.append({
+                'menu_item_id': menu_item_id, 'name': name, 'quantity': quantity,
+                'unit_price': price, 'line_total': line_total(price, quantity),
+            })
+        total = sum((line['line_total'] for line in lines), Decimal('0.00'))
+        return {
+            'canteen': self.canteen_id, 'items': lines, 'total_price': total,
+            'amount': to_paise(total), 'currency': CURRENCY,
+        }
+
+
+_tables = {}
+_lock = threading.Lock()
+
+
+def load_price_table(canteen_id):
+    rows = MenuItem.objects.using(shard_for_canteen(canteen_id)).filter(canteen_id=canteen_id) \
+        .values_list('pk', 'name', 'price')
+    return PriceTable(canteen_id, rows)
+
+
+def get_price_table(canteen_id):
+    """This process's ``PriceTable`` for the canteen, rebuilt when older than ``PRICE_TABLE_SECONDS``."""
+    with _lock:
+        entry = _tables.get(canteen_id)
+    if entry is not None and time.monotonic() - entry[1] <= settings.PRICE_TABLE_SECONDS:
+        return entry[0]
+    table = load_price_table(canteen_id)
+    with _lock:
+        _tables[canteen_id] = (table, time.monotonic())
+    return table
+
+
+def invalidate_prices(sender=None, instance=None, **kwargs):
+    """post_save/post_delete handler for ``MenuItem``; without an instance every table is dropped."""
+    with _lock:
+        if instance is None:
+            _tables.clear()
+        else:
+            _tables.pop(instance.canteen_id, None)
+
+
+def quote(canteen_id, cart):
+    """Price ``{menu_item_id: quantity}`` for the canteen from the cached table."""
+    return get_price_table(canteen_id).quote(cart)
+
+
+def check_prices(lines):
+    """Drop cached tables whose prices differ from the loaded ``{menu_item: quantity}`` rows."""
+    with _lock:
+        for menu_item in lines:
+            entry = _tables.get(menu_item.canteen_id)
+            if entry is not None and entry[0].items.get(menu_item.pk, (None, None))[1] != menu_item.price:
+                _tables.pop(menu_item.canteen_id, None)
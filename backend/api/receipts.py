@@ -0,0 +1,143 @@
+"""
+Order receipts.
+
+A receipt is rendered from a small snapshot of the order and stored under the
+SHA-256 of that snapshot (plus layout version and output type), so the same
+order data always maps to the same file and is never rendered twice.
+
+Rendering happens in a process pool, never in the request: ``request_receipt``
+serves what is stored and queues whatever is missing, and the
+``render_receipts`` command renders a whole day up front.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import json
+import logging
+import multiprocessing
+import threading
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.template.loader import render_to_string
+
+try:
+    from weasyprint import HTML
+except ImportError: # PDF receipts are optional
+    HTML = None
+
+logger = logging.getLogger(__name__)
+
+LAYOUT_VERSION = 1 # Bump whenever templates/api/receipt.html changes
+CONTENT_TYPES = {'html': 'text/html; charset=utf-8', 'pdf': 'application/pdf'}
+
+
+class ReceiptUnavailable(Exception):
+    """Raised for an output type this installation cannot render."""
+
+
+def available_outputs():
+    return [output for output in CONTENT_TYPES if output != 'pdf' or HTML is not None]
+
+
+def receipt_snapshot(order):
+    """Everything printed on the receipt, as plain JSON-safe values."""
+    lines = [
+        {
+            'name': item.menu_item.name,
+            'quantity': item.quantity,
+            'price': f"{item.price:.2f}",
+            'amount': f"{item.price * item.quantity:.2f}",
+        }
+        for item in sorted(order.items.all(), key=lambda item: item.pk)
+    ]
+    return {
+        'order_id': order.pk,
+        'canteen': order.canteen.name,
+        'customer': order.customer.get_username(),
+        'created_at': order.created_at.strftime('%d %b %Y, %H:%M'),
+        'table_number': order.table_number or '',
+        'lines': lines,
+        'total': f"{order.total_price:.2f}",
+        'payment_id': order.razorpay_payment_id or '',
+    }
+
+
+def receipt_path(snapshot, output):
+    """Content address of a receipt: ``<prefix>/ab/abcdef....<output>``."""
+    payload = json.dumps({'layout': LAYOUT_VERSION, 'output': output, 'receipt': snapshot}, sort_keys=True)
+    digest = hashlib.sha256(payload.encode()).hexdigest()
+    return f"{settings.RECEIPT_STORAGE_PREFIX}/{digest[:2]}/{digest}.{output}"
+
+
+def render_receipt(snapshot, output):
+    """Render one receipt to bytes. Runs inside pool workers, so it must not touch the database."""
+    html = render_to_string('api/receipt.html', snapshot)
+    if output == 'pdf':
+        return HTML(string=html).write_pdf()
+    return html.encode()
+
+
+def store_receipt(path, content):
+    if not default_storage.exists(path):
+        default_storage.save(path, ContentFile(content))
+    return path
+
+
+def _setup_worker():
+    import django
+    django.setup()
+
+
+def create_pool(workers):
+    # Spawned workers do not inherit the parent's threads, locks or DB connections
+    return ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context('spawn'), initializer=_setup_worker
+    )
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_pending = {} # path -> Future of receipts being rendered for requests
+_pending_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = create_pool(settings.RECEIPT_RENDER_WORKERS)
+        return _pool
+
+
+def _finish(path, future):
+    try:
+        store_receipt(path, future.result())
+    except Exception:
+        logger.exception(f"Rendering receipt {path} failed")
+    finally:
+        with _pending_lock:
+            _pending.pop(path, None)
+
+
+def request_receipt(order, output):
+    """
+    Storage path of the order's receipt, or None while it is being rendered in
+    the background. With ``RECEIPT_RENDER_WORKERS = 0`` it is rendered inline.
+    """
+    if output not in available_outputs():
+        raise ReceiptUnavailable(f"'{output}' receipts are not available on this server.")
+    snapshot = receipt_snapshot(order)
+    path = receipt_path(snapshot, output)
+    if default_storage.exists(path):
+        return path
+    if not settings.RECEIPT_RENDER_WORKERS:
+        return store_receipt(path, render_receipt(snapshot, output))
+
+    with _pending_lock:
+        future = None
+        if path not in _pending:
+            future = _pending[path] = _get_pool().submit(render_receipt, snapshot, output)
+    if future is not None:
+        future.add_done_callback(lambda done: _finish(path, done))
+    return None
@@ -0,0 +1,165 @@
+"""
+"Frequently ordered together" recommendations.
+
+``build_pairings`` streams a canteen's ``OrderItem`` rows as ``(order, item)``
+id pairs into an order x item incidence matrix ``B`` and adds ``B.T @ B``, the
+item x item co-occurrence counts, to the matrix kept in ``PairingMatrix``.
+Only orders after its ``last_order_id`` are read, so regular runs are
+incremental; ``rebuild=True`` starts over (e.g. nightly, to drop cancellations
+that happened after an order was counted). The diagonal holds how many orders
+contain each item, which turns counts into confidences. The ``top_k``
+neighbours of every item are then stored as ``ItemPairing`` rows.
+
+``recommend`` only reads those rows: at most ``top_k`` per item in the cart.
+"""
+from io import BytesIO
+from itertools import chain
+import logging
+
+from django.conf import settings
+from django.db import transaction
+import numpy as np
+from scipy import sparse
+
+from .availability import get_index
+from .models import ItemPairing, MenuItem, OrderItem, PairingMatrix
+from .sharding import shard_for_canteen, shard_for_id
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 20000
+
+
+def _load(state):
+    """``(item_ids, item_orders, counts)`` stored in ``state``, or empty ones."""
+    if state is None or not state.matrix:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), sparse.coo_matrix((0, 0), dtype=np.int64)
+    data = np.load(BytesIO(bytes(state.matrix)))
+    n = len(data['item_ids'])
+    counts = sparse.coo_matrix((data['data'], (data['row'], data['col'])), shape=(n, n))
+    return data['item_ids'], data['item_orders'], counts
+
+
+def _dump(item_ids, item_orders, counts):
+    buffer = BytesIO()
+    np.savez_compressed(
+        buffer, item_ids=item_ids, item_orders=item_orders, row=counts.row, col=counts.col, data=counts.data,
+    )
+    return buffer.getvalue()
+
+
+def _reindex(counts, positions, size):
+    """``counts`` with row/column ``i`` moved to ``positions[i]`` in a ``size`` x ``size`` matrix."""
+    return sparse.coo_matrix((counts.data, (positions[counts.row], positions[counts.col])), shape=(size, size))
+
+
+def order_item_pairs(canteen_id, alias, after_order_id=0):
+    """``(order_id, menu_item_id)`` rows of the canteen's uncancelled orders after ``after_order_id``, as an array."""
+    rows = (
+        OrderItem.objects.using(alias)
+        .filter(order__canteen_id=canteen_id, order_id__gt=after_order_id)
+        .exclude(order__status='CANCELLED')
+        .order_by()
+        .values_list('order_id', 'menu_item_id')
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+    return np.fromiter(chain.from_iterable(rows), dtype=np.int64).reshape(-1, 2)
+
+
+def add_orders(item_ids, item_orders, counts, pairs):
+    """Fold ``pairs`` (from ``order_item_pairs``) into the co-occurrence matrix."""
+    all_ids = np.union1d(item_ids, pairs[:, 1])
+    size = len(all_ids)
+    counts = _reindex(counts, np.searchsorted(all_ids, item_ids), size).tocsr()
+    totals = np.zeros(size, dtype=np.int64)
+    totals[np.searchsorted(all_ids, item_ids)] = item_orders
+
+    order_ids, order_index = np.unique(pairs[:, 0], return_inverse=True)
+    incidence = sparse.csr_matrix(
+        (np.ones(len(pairs), dtype=np.int64), (order_index, np.searchsorted(all_ids, pairs[:, 1]))),
+        shape=(len(order_ids), size),
+    )
+    incidence.data[:] = 1 # An item on two lines of one order still counts once
+    together = (incidence.T @ incidence).tocsr()
+    totals += together.diagonal()
+    together.setdiag(0)
+    counts = (counts + together).tocoo()
+    counts.eliminate_zeros()
+    return all_ids, totals, counts, len(order_ids)
+
+
+def top_neighbours(item_ids, item_orders, counts, top_k, min_orders):
+    """``(item, neighbour, orders together, confidence)`` arrays, best ``top_k`` per item."""
+    keep = counts.data >= min_orders
+    row, col, together = counts.row[keep], counts.col[keep], counts.data[keep]
+    confidence = together / item_orders[row]
+    order = np.lexsort((item_ids[col], -confidence, row))
+    row, col, together, confidence = row[order], col[order], together[order], confidence[order]
+    rank = np.arange(len(row)) - np.searchsorted(row, row)
+    keep = rank < top_k
+    return item_ids[row[keep]], item_ids[col[keep]], together[keep], confidence[keep]
+
+
+def build_pairings(canteen, rebuild=False, top_k=None, min_orders=None):
+    """Update the canteen's co-occurrence matrix with new orders and store its top pairings; returns their number."""
+    canteen_id = getattr(canteen, 'pk', canteen)
+    top_k = top_k or settings.PAIRING_TOP_K
+    min_orders = min_orders or settings.PAIRING_MIN_ORDERS
+    alias = shard_for_canteen(canteen_id)
+
+    with transaction.atomic(using=alias):
+        state = PairingMatrix.objects.using(alias).select_for_update().filter(canteen_id=canteen_id).first()
+        if state is None:
+            state = PairingMatrix(canteen_id=canteen_id)
+        if rebuild:
+            state.last_order_id = state.order_count = 0
+            state.matrix = b''
+        item_ids, item_orders, counts = _load(state)
+
+        pairs = order_item_pairs(canteen_id, alias, state.last_order_id)
+        if len(pairs):
+            item_ids, item_orders, counts, new_orders = add_orders(item_ids, item_orders, counts, pairs)
+            state.last_order_id = int(pairs[:, 0].max())
+            state.order_count += new_orders
+        state.matrix = _dump(item_ids, item_orders, counts)
+        state.save(using=alias)
+
+        # Deleted menu items stay in the matrix but get no pairings
+        live = np.isin(item_ids, list(MenuItem.objects.using(alias).filter(canteen_id=canteen_id).values_list('pk', flat=True)))
+        items, neighbours, together, confidence = top_neighbours(item_ids, item_orders, counts, top_k, min_orders)
+        valid = live[np.searchsorted(item_ids, items)] & live[np.searchsorted(item_ids, neighbours)]
+        ItemPairing.objects.using(alias).filter(canteen_id=canteen_id).delete()
+        ItemPairing.objects.using(alias).bulk_create([
+            ItemPairing(canteen_id=canteen_id, menu_item_id=int(item), paired_item_id=int(neighbour),
+                        order_count=int(count), confidence=float(score))
+            for item, neighbour, count, score in zip(
+                items[valid], neighbours[valid], together[valid], confidence[valid]
+            )
+        ], batch_size=5000)
+    stored = int(valid.sum())
+    logger.info(f"Stored {stored} pairings for canteen {canteen_id} from {len(pairs)} new order lines")
+    return stored
+
+
+def recommend(item_ids, limit=None):
+    """
+    ``[(menu item, ItemPairing)]`` of items orderable now that are often ordered
+    with ``item_ids`` (one canteen's), best first, leaving out the items themselves.
+    """
+    limit = limit or settings.PAIRING_TOP_K
+    if not item_ids:
+        return []
+    pairings = (
+        ItemPairing.objects.using(shard_for_id(item_ids[0]))
+        .filter(menu_item_id__in=item_ids, paired_item__is_available=True)
+        .exclude(paired_item_id__in=item_ids)
+        .select_related('paired_item__canteen', 'paired_item__category')
+        .order_by('-confidence', '-order_count', 'paired_item_id')
+    )
+    closed = get_index().closed_items()
+    if closed:
+        pairings = pairings.exclude(paired_item_id__in=closed)
+    best = {}
+    for pairing in pairings:
+        best.setdefault(pairing.paired_item_id, pairing)
+    return [(pairing.paired_item, pairing) for pairing in list(best.values())[:limit]]
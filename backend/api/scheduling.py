@@ -0,0 +1,143 @@
+"""
+Pickup slot booking.
+
+Each slot keeps one ``PickupSlotUsage`` row per day whose ``booked`` counter is
+raised with a conditional ``F()`` update (``booked + load <= capacity``), so
+concurrent checkouts cannot overfill a slot and availability never needs a
+COUNT over orders.
+
+Paid orders book their slot at checkout, before the customer pays, and keep
+the booking on their ``CheckoutCart``; ``release_expired_checkout_slots`` frees
+the bookings of checkouts that were never paid.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import CheckoutCart, PickupSlot, PickupSlotUsage
+from .sharding import current_shard
+
+
+class SlotUnavailable(Exception):
+    """Raised when an order does not fit into the requested (or any) pickup slot."""
+
+
+def order_load(slot, quantities):
+    """Capacity an order of ``{menu_item: quantity}`` takes from ``slot``."""
+    if slot.capacity_unit == 'PREP_UNITS':
+        return sum(menu_item.prep_units * quantity for menu_item, quantity in quantities.items())
+    return 1
+
+
+def _usage_for(slot, date):
+    usage, _ = PickupSlotUsage.objects.get_or_create(
+        slot=slot, date=date, defaults={'capacity': slot.capacity}
+    )
+    return usage
+
+
+def _try_book(slot, date, load):
+    usage = _usage_for(slot, date)
+    return PickupSlotUsage.objects.filter(pk=usage.pk, booked__lte=F('capacity') - load) \
+        .update(booked=F('booked') + load) == 1
+
+
+def assign_slot(canteen, quantities, slot=None, date=None):
+    """
+    Book capacity for an order and return ``(slot, date, load)``.
+
+    With ``slot`` given it is validated and booked; otherwise the earliest slot
+    of the day that still has room is picked. Canteens without slots return
+    ``(None, None, 0)``. Must run inside the order's transaction.
+    """
+    now = timezone.localtime()
+    date = date or now.date()
+    if slot is not None:
+        if slot.canteen_id != canteen.id or not slot.is_active:
+            raise SlotUnavailable("The selected pickup slot is not offered by this canteen.")
+        if date == now.date() and slot.end_time <= now.time():
+            raise SlotUnavailable("The selected pickup slot has already ended.")
+        load = order_load(slot, quantities)
+        if not _try_book(slot, date, load):
+            raise SlotUnavailable("The selected pickup slot is full.")
+        return slot, date, load
+
+    candidates = list(PickupSlot.objects.filter(canteen=canteen, is_active=True).order_by('start_time'))
+    if not candidates:
+        return None, None, 0
+    open_slots = [slot for slot in candidates if date != now.date() or slot.end_time > now.time()]
+    if not open_slots:
+        raise SlotUnavailable("No pickup slots are left today.")
+    for candidate in open_slots:
+        load = order_load(candidate, quantities)
+        if _try_book(candidate, date, load):
+            return candidate, date, load
+    raise SlotUnavailable("All remaining pickup slots for today are full.")
+
+
+def _unbook(slot_id, date, load):
+    PickupSlotUsage.objects.filter(slot_id=slot_id, date=date, booked__gte=load).update(booked=F('booked') - load)
+
+
+def release_slot(order):
+    """Give a cancelled order's capacity back to its slot."""
+    if not order.pickup_slot_id or not order.slot_load:
+        return
+    _unbook(order.pickup_slot_id, order.pickup_date, order.slot_load)
+
+
+def release_expired_checkout_slots(now=None, batch_size=500):
+    """Free slots booked by checkouts still unpaid after the payment window, on the pinned shard."""
+    cutoff = (now or timezone.now()) - timedelta(seconds=settings.STOCK_RESERVATION_TTL_SECONDS)
+    with transaction.atomic(using=current_shard()):
+        expired = list(
+            CheckoutCart.objects.select_for_update(skip_locked=True)
+            .filter(slot_held=True, created_at__lte=cutoff)
+            .values_list('pk', 'pickup_slot_id', 'pickup_date', 'slot_load')[:batch_size]
+        )
+        if not expired:
+            return 0
+        loads = defaultdict(int)
+        for _, slot_id, date, load in expired:
+            if slot_id is not None:
+                loads[slot_id, date] += load
+        for (slot_id, date), load in loads.items():
+            _unbook(slot_id, date, load)
+        # A payment verified later books again (see VerifyPaymentView)
+        CheckoutCart.objects.filter(pk__in=[pk for pk, _, _, _ in expired]).update(slot_held=False)
+    return len(expired)
+
+
+def slot_availability(canteen, date):
+    """Remaining capacity per active slot, read from the maintained counters."""
+    usage = {
+        slot_id: (capacity, booked)
+        for slot_id, capacity, booked in PickupSlotUsage.objects
+        .filter(slot__canteen=canteen, date=date)
+        .values_list('slot_id', 'capacity', 'booked')
+    }
+    now = timezone.localtime()
+    availability = []
+    for slot in PickupSlot.objects.filter(canteen=canteen, is_active=True).order_by('start_time'):
+        capacity, booked = usage.get(slot.id, (slot.capacity, 0))
+        remaining = max(capacity - booked, 0)
+        ended = (date, slot.end_time) <= (now.date(), now.time())
+        availability.append({
+            'id': slot.id,
+            'start_time': slot.start_time,
+            'end_time': slot.end_time,
+            'capacity': capacity,
+            'capacity_unit': slot.capacity_unit,
+            'remaining': remaining,
+            'is_open': remaining > 0 and not ended,
+        })
+    return availability
+
+
+def sync_slot_capacity(slot):
+    """Apply an edited slot capacity to today's and future counters."""
+    PickupSlotUsage.objects.filter(slot=slot, date__gte=timezone.localdate()).update(capacity=slot.capacity)
@@ -1,10 +1,18 @@
 from rest_framework import serializers
-from .models import Canteen, Category, MenuItem, Order, OrderItem
+from .models import AvailabilityWindow, Canteen, Category, MenuItem, Order, OrderItem, PickupSlot, PushSubscription
+from .inventory import OutOfStock, aggregate_quantities
+from .scheduling import SlotUnavailable
+from .ordering import place_orders
+from .eta import ACTIVE_STATUSES, estimate_ready_at, queue_depth, queue_depths
+from .hashing import hash_password
+from .availability import is_orderable
 from django.contrib.auth.models import User
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
+from django.db import IntegrityError, models, transaction
 from decimal import Decimal
 import logging
+from django.conf import settings
 
 logger = logging.getLogger(__name__)
 
@@ -33,7 +41,7 @@ class MenuItemSerializer(serializers.ModelSerializer):
             'id', 'canteen', 'category', 'name', 'description', 
             'price', 
             'image', # Only include the model's field name ('image')
-            'is_available'
+            'is_available', 'stock_remaining'
         ]
 
 # Add a separate serializer for Write operations
@@ -48,9 +56,49 @@ class MenuItemWriteSerializer(serializers.ModelSerializer):
         model = MenuItem
         fields = [
             'id', 'canteen', 'category', 'name', 'description', 
-            'price', 'image', 'is_available'
+            'price', 'image', 'is_available', 'daily_stock', 'stock_remaining', 'prep_units'
         ]
 
+class PickupSlotSerializer(serializers.ModelSerializer):
+    canteen = serializers.PrimaryKeyRelatedField(queryset=Canteen.objects.all())
+
+    class Meta:
+        model = PickupSlot
+        fields = ['id', 'canteen', 'start_time', 'end_time', 'capacity', 'capacity_unit', 'is_active']
+
+    def validate(self, attrs):
+        start_time = attrs.get('start_time', getattr(self.instance, 'start_time', None))
+        end_time = attrs.get('end_time', getattr(self.instance, 'end_time', None))
+        if start_time and end_time and end_time <= start_time:
+            raise serializers.ValidationError({"end_time": "End time must be after start time."})
+        return attrs
+
+class WeekdaysField(serializers.Field):
+    """Weekday numbers (0 = Monday) stored as the bitmask of ``AvailabilityWindow.weekdays``."""
+
+    def to_representation(self, value):
+        return [day for day in range(7) if value & (1 << day)]
+
+    def to_internal_value(self, data):
+        if not isinstance(data, list) or not data or not all(isinstance(day, int) and 0 <= day <= 6 for day in data):
+            raise serializers.ValidationError("Expected a non-empty list of weekdays from 0 (Monday) to 6.")
+        return sum(1 << day for day in set(data))
+
+class AvailabilityWindowSerializer(serializers.ModelSerializer):
+    menu_item = serializers.PrimaryKeyRelatedField(queryset=MenuItem.objects.all())
+    weekdays = WeekdaysField(required=False)
+
+    class Meta:
+        model = AvailabilityWindow
+        fields = ['id', 'menu_item', 'weekdays', 'start_time', 'end_time']
+
+    def validate(self, attrs):
+        start_time = attrs.get('start_time', getattr(self.instance, 'start_time', None))
+        end_time = attrs.get('end_time', getattr(self.instance, 'end_time', None))
+        if start_time and end_time and end_time <= start_time:
+            raise serializers.ValidationError({"end_time": "End time must be after start time."})
+        return attrs
+
 # --- User Serializer (define before usage in OrderSerializer) ---
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -58,6 +106,25 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ['id', 'username', 'first_name', 'last_name', 'email', 'is_staff', 'is_superuser']
         # Add other fields as needed, but be careful about exposing sensitive info
 
+class PushKeysSerializer(serializers.Serializer):
+    p256dh = serializers.CharField(max_length=200)
+    auth = serializers.CharField(max_length=100)
+
+class PushSubscriptionSerializer(serializers.ModelSerializer):
+    """The browser's ``PushSubscription.toJSON()``: ``endpoint`` and ``keys``."""
+    keys = PushKeysSerializer(source='*')
+
+    class Meta:
+        model = PushSubscription
+        fields = ['id', 'endpoint', 'keys', 'created_at']
+        read_only_fields = ['created_at']
+        extra_kwargs = {'endpoint': {'validators': []}} # Re-subscribing moves the endpoint to the current user
+
+    def create(self, validated_data):
+        endpoint = validated_data.pop('endpoint')
+        subscription, _ = PushSubscription.objects.update_or_create(endpoint=endpoint, defaults=validated_data)
+        return subscription
+
 # --- Read/List Serializers continued ---
 
 class OrderItemSerializer(serializers.ModelSerializer):
@@ -69,15 +136,39 @@ class OrderItemSerializer(serializers.ModelSerializer):
         # Correct the field name here
         fields = ['id', 'menu_item', 'quantity', 'price'] # Changed 'price_at_time_of_order' to 'price'
 
+class OrderListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        orders = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        # One queue query per canteen for the whole list, not one per order
+        self.context['queue_depths'] = queue_depths(orders)
+        return super().to_representation(orders)
+
 class OrderSerializer(serializers.ModelSerializer):
     items = OrderItemSerializer(many=True, read_only=True)
     customer = UserSerializer(read_only=True)
     canteen = CanteenSerializer(read_only=True)
+    estimated_ready_at = serializers.SerializerMethodField()
     
     class Meta:
         model = Order
-        fields = ('id', 'customer', 'canteen', 'created_at', 'updated_at', 'status', 'total_price', 'notes', 'table_number', 'items')
-        read_only_fields = ['total_price', 'created_at', 'updated_at'] # Usually calculated/set by backend
+        fields = ('id', 'customer', 'canteen', 'created_at', 'updated_at', 'status', 'total_price', 'notes', 'table_number', 'pickup_slot', 'pickup_date', 'pickup_token', 'ready_at', 'estimated_ready_at', 'item_count', 'items_preview', 'items')
+        read_only_fields = ['total_price', 'created_at', 'updated_at', 'pickup_slot', 'pickup_date', 'pickup_token', 'ready_at', 'item_count', 'items_preview']
+        list_serializer_class = OrderListSerializer
+
+    def get_estimated_ready_at(self, obj):
+        # Only active orders need the queue depth; finished ones report ready_at
+        queue_ahead = 0
+        if obj.status in ACTIVE_STATUSES:
+            depths = self.context.get('queue_depths', {})
+            queue_ahead = depths[obj.pk] if obj.pk in depths else queue_depth(obj)
+        return estimate_ready_at(obj, [item.menu_item_id for item in obj.items.all()], queue_ahead)
+
+class OrderSummarySerializer(serializers.ModelSerializer):
+    """Order history row built from the order's own columns only (no items, no JOINs)."""
+    class Meta:
+        model = Order
+        fields = ('id', 'canteen', 'created_at', 'status', 'total_price', 'notes', 'table_number', 'pickup_slot', 'pickup_date', 'pickup_token', 'item_count', 'items_preview')
+        read_only_fields = fields
 
 # --- Write/Create Serializers (Simpler, often using IDs for relationships) ---
 
@@ -94,10 +185,12 @@ class OrderItemWriteSerializer(serializers.ModelSerializer):
 class OrderWriteSerializer(serializers.ModelSerializer):
     items = OrderItemWriteSerializer(many=True)
     canteen = serializers.PrimaryKeyRelatedField(queryset=Canteen.objects.all())
+    # Optional; when omitted the earliest pickup slot with room is assigned
+    pickup_slot = serializers.PrimaryKeyRelatedField(queryset=PickupSlot.objects.all(), required=False, allow_null=True)
 
     class Meta:
         model = Order
-        fields = ('id', 'canteen', 'notes', 'table_number', 'items') 
+        fields = ('id', 'canteen', 'notes', 'table_number', 'pickup_slot', 'items') 
         read_only_fields = ('id',)
 
     def validate(self, attrs):
@@ -125,8 +218,7 @@ class OrderWriteSerializer(serializers.ModelSerializer):
             
         # No need to fetch menu_items again, they are already objects in items_data
         
-        # Calculate total price
-        total_price = Decimal('0.00')
+        # Check every line before anything is written
         for item_data in items_data:
             try:
                 # Access the MenuItem object directly from the validated data
@@ -141,53 +233,114 @@ class OrderWriteSerializer(serializers.ModelSerializer):
                  raise serializers.ValidationError(f"Invalid menu item data encountered.")
                  
             # Check if item belongs to the specified canteen
-            if menu_item.canteen != canteen:
-                 logger.error(f"Menu item {menu_item.id} canteen ({menu_item.canteen}) mismatch with order canteen ({canteen})")
+            if menu_item.canteen_id != canteen.id:
+                 logger.error(f"Menu item {menu_item.id} canteen ({menu_item.canteen_id}) mismatch with order canteen ({canteen.id})")
                  raise serializers.ValidationError(f"Menu item '{menu_item.name}' (ID: {menu_item.id}) does not belong to canteen '{canteen.name}'.")
-            
-            total_price += Decimal(menu_item.price) * Decimal(quantity)
+            # Switched off, or outside its availability windows
+            if not is_orderable(menu_item):
+                raise serializers.ValidationError({'items': [f"'{menu_item.name}' is currently unavailable."]})
 
-        validated_data['total_price'] = total_price
         # Customer is added in perform_create by the view (using self.request.user)
-        
-        logger.debug(f"Creating Order object with data: {validated_data}")
-        try:
-            order = Order.objects.create(**validated_data)
-        except Exception as e:
-            logger.error(f"Error during Order.objects.create: {e} with data: {validated_data}", exc_info=True)
-            raise
-        
-        # Create OrderItem instances using the already validated data
-        order_items_to_create = []
-        for item_data in items_data:
-            try:
-                menu_item = item_data['menu_item'] # Get object directly
-                quantity = item_data['quantity']
-            except KeyError as e:
-                # This shouldn't happen if the first loop succeeded, but log just in case
-                logger.error(f"KeyError accessing item_data keys ('{e}') in item during OrderItem creation: {item_data}")
-                raise
-                
-            order_items_to_create.append(
-                OrderItem(
-                    order=order, 
-                    menu_item=menu_item, 
-                    quantity=quantity, 
-                    price=menu_item.price # Use current price from the validated MenuItem object
-                )
-            )
-            
-        logger.debug(f"Bulk creating {len(order_items_to_create)} OrderItems")
+        spec = {
+            'lines': aggregate_quantities((item_data['menu_item'], item_data['quantity']) for item_data in items_data),
+            'table_number': validated_data.get('table_number'),
+            'notes': validated_data.get('notes'),
+            'pickup_slot': validated_data.get('pickup_slot'),
+        }
+        logger.debug(f"Placing order for {validated_data.get('customer')} with lines: {spec['lines']}")
         try:
-            OrderItem.objects.bulk_create(order_items_to_create)
-        except Exception as e:
-            logger.error(f"Error during OrderItem.objects.bulk_create: {e}", exc_info=True)
-            # Consider rolling back the Order creation or handling cleanup
-            raise
-            
+            order, = place_orders(validated_data['customer'], canteen, [spec])
+        except OutOfStock as e:
+            raise serializers.ValidationError({'items': [str(e)]})
+        except SlotUnavailable as e:
+            raise serializers.ValidationError({'pickup_slot': [str(e)]})
+
         logger.debug(f"Order {order.id} created successfully.")
         return order
 
+# --- Bulk (group) order serializers ---
+
+class BulkOrderLineSerializer(serializers.Serializer):
+    # Plain IDs: all lines of a batch are resolved with one menu query in validate()
+    menu_item_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
+
+class BulkOrderEntrySerializer(serializers.Serializer):
+    items = BulkOrderLineSerializer(many=True, allow_empty=False)
+    table_number = serializers.CharField(max_length=10, required=False, allow_blank=True, allow_null=True)
+    notes = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+    pickup_slot = serializers.PrimaryKeyRelatedField(queryset=PickupSlot.objects.all(), required=False, allow_null=True)
+
+class BulkOrderSerializer(serializers.Serializer):
+    """Several orders for one canteen (typically one table) placed in a single transaction."""
+    canteen = serializers.PrimaryKeyRelatedField(queryset=Canteen.objects.all())
+    table_number = serializers.CharField(max_length=10, required=False, allow_blank=True, allow_null=True)
+    orders = BulkOrderEntrySerializer(many=True, allow_empty=False)
+
+    def validate_orders(self, orders):
+        if len(orders) > settings.BULK_ORDER_MAX_ORDERS:
+            raise serializers.ValidationError(f"At most {settings.BULK_ORDER_MAX_ORDERS} orders per request.")
+        return orders
+
+    def validate(self, attrs):
+        canteen = attrs['canteen']
+        menu_item_ids = {line['menu_item_id'] for entry in attrs['orders'] for line in entry['items']}
+        menu = MenuItem.objects.in_bulk(menu_item_ids)
+
+        errors, has_errors = [], False
+        for entry in attrs['orders']:
+            entry_errors = []
+            for line in entry['items']:
+                menu_item = menu.get(line['menu_item_id'])
+                if menu_item is None or menu_item.canteen_id != canteen.id:
+                    entry_errors.append(f"Menu item {line['menu_item_id']} is not on the menu of '{canteen.name}'.")
+                elif not is_orderable(menu_item):
+                    entry_errors.append(f"'{menu_item.name}' is currently unavailable.")
+            slot = entry.get('pickup_slot')
+            if slot is not None and slot.canteen_id != canteen.id:
+                entry_errors.append("The selected pickup slot is not offered by this canteen.")
+            errors.append({'items': entry_errors} if entry_errors else {})
+            has_errors = has_errors or bool(entry_errors)
+        if has_errors:
+            raise serializers.ValidationError({'orders': errors})
+
+        attrs['menu'] = menu
+        return attrs
+
+    def create(self, validated_data):
+        menu = validated_data['menu']
+        specs = [
+            {
+                'lines': aggregate_quantities((menu[line['menu_item_id']], line['quantity']) for line in entry['items']),
+                'table_number': entry.get('table_number') or validated_data.get('table_number'),
+                'notes': entry.get('notes'),
+                'pickup_slot': entry.get('pickup_slot'),
+            }
+            for entry in validated_data['orders']
+        ]
+        try:
+            return place_orders(validated_data['customer'], validated_data['canteen'], specs)
+        except OutOfStock as e:
+            raise serializers.ValidationError({'items': [str(e)]})
+        except SlotUnavailable as e:
+            raise serializers.ValidationError({'pickup_slot': [str(e)]})
+
+    def to_representation(self, orders):
+        return {
+            'orders': [
+                {
+                    'index': index,
+                    'id': order.id,
+                    'status': order.status,
+                    'total_price': str(order.total_price),
+                    'table_number': order.table_number,
+                    'pickup_slot': order.pickup_slot_id,
+                    'pickup_date': order.pickup_date,
+                }
+                for index, order in enumerate(orders)
+            ]
+        }
+
 # --- Custom User Registration Serializer ---
 class UserRegistrationSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=True, validators=[validate_password])
@@ -205,21 +358,28 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
     def validate(self, attrs):
         if attrs['password'] != attrs['password2']:
             raise serializers.ValidationError({"password2": "Password fields didn't match."}) 
-        # Check if email already exists
-        if User.objects.filter(email=attrs['email']).exists():
+        attrs['email'] = User.objects.normalize_email(attrs['email'])
+        # Served by the case-insensitive unique index on email (migration 0013)
+        if User.objects.filter(email__iexact=attrs['email']).exists():
             raise serializers.ValidationError({"email": "Email already exists."})       
         return attrs
 
     def create(self, validated_data):
-        user = User.objects.create(
-            username=validated_data['username'],
-            email=validated_data['email'],
-            first_name=validated_data.get('first_name', ''),
-            last_name=validated_data.get('last_name', '')
-        )
-        user.set_password(validated_data['password']) # Hash the password
-        user.save()
-        return user
+        # One INSERT with the password already hashed (on the hashing pool)
+        try:
+            with transaction.atomic():
+                return User.objects.create(
+                    username=validated_data['username'],
+                    email=validated_data['email'],
+                    first_name=validated_data.get('first_name', ''),
+                    last_name=validated_data.get('last_name', ''),
+                    password=hash_password(validated_data['password']),
+                )
+        except IntegrityError:
+            # Lost a race with a concurrent signup for the same username or email
+            if User.objects.filter(username=validated_data['username']).exists():
+                raise serializers.ValidationError({"username": "A user with that username already exists."})
+            raise serializers.ValidationError({"email": "Email already exists."})
 
 # We might need more specific serializers later, e.g., for Admin Menu Management
 # For now, Admins can potentially use the same MenuItemSerializer but with write permissions handled by the view.
\ No newline at end of file
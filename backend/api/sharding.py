@@ -0,0 +1,353 @@
+"""
+Canteen-based database sharding.
+
+Menu and order data of a canteen (``SHARDED_MODELS``) lives on the database
+alias given by ``settings.CANTEEN_SHARDS`` (``default`` when unlisted). The small
+reference tables in ``MIRRORED_MODELS`` are written to ``default`` and copied
+to every other shard so foreign keys hold on each database.
+
+Each shard hands out primary keys from its own block of ``SHARD_ID_BLOCK`` ids
+(set up after ``migrate``), so the shard of an order, menu item or slot can be
+derived from its id alone. Code that works on one canteen pins its shard with
+``use_shard()``; the router then sends queries there without ``.using()`` calls.
+With a single database everything resolves to ``default``.
+"""
+from collections.abc import Mapping
+from contextlib import contextmanager
+from contextvars import ContextVar
+import heapq
+import logging
+from operator import attrgetter
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, models
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+SHARDED_MODELS = {
+    'api.menuitem', 'api.order', 'api.orderitem', 'api.stockreservation', 'api.checkoutcart',
+    'api.pickupslot', 'api.pickupslotusage', 'api.preptimestat', 'api.itempairing', 'api.pairingmatrix',
+    'api.demandforecast', 'api.pickuptokencounter', 'api.availabilitywindow', 'api.notification',
+}
+MIRRORED_MODELS = {'api.canteen', 'api.category', 'auth.user'}
+
+_pinned_shard = ContextVar('pinned_shard', default=None)
+
+
+def shard_aliases():
+    return list(settings.SHARD_DATABASES)
+
+
+def sharding_enabled():
+    return len(settings.SHARD_DATABASES) > 1
+
+
+def shard_for_canteen(canteen):
+    """Alias holding the menu and orders of ``canteen`` (instance or id)."""
+    canteen_id = getattr(canteen, 'pk', canteen)
+    try:
+        canteen_id = int(canteen_id)
+    except (TypeError, ValueError):
+        return DEFAULT_DB_ALIAS
+    return settings.CANTEEN_SHARDS.get(canteen_id, DEFAULT_DB_ALIAS)
+
+
+def shard_for_id(pk):
+    """Alias that allocated ``pk`` for any model in ``SHARDED_MODELS``."""
+    try:
+        index = int(pk) // settings.SHARD_ID_BLOCK
+    except (TypeError, ValueError):
+        return DEFAULT_DB_ALIAS
+    aliases = settings.SHARD_DATABASES
+    return aliases[index] if 0 <= index < len(aliases) else DEFAULT_DB_ALIAS
+
+
+def current_shard():
+    """The pinned alias, or ``default`` when nothing is pinned."""
+    return _pinned_shard.get() or DEFAULT_DB_ALIAS
+
+
+def is_pinned():
+    return _pinned_shard.get() is not None
+
+
+@contextmanager
+def use_shard(alias):
+    token = _pinned_shard.set(alias)
+    try:
+        yield alias
+    finally:
+        _pinned_shard.reset(token)
+
+
+def use_canteen_shard(canteen):
+    return use_shard(shard_for_canteen(canteen))
+
+
+def _label(model):
+    return model._meta.label_lower
+
+
+def _shard_for_instance(instance):
+    label = _label(instance)
+    if label == 'api.canteen':
+        return shard_for_canteen(instance.pk)
+    if label not in SHARDED_MODELS:
+        return None
+    canteen_id = getattr(instance, 'canteen_id', None)
+    if canteen_id is not None:
+        return shard_for_canteen(canteen_id)
+    for attname in ('order_id', 'menu_item_id', 'slot_id'):
+        value = getattr(instance, attname, None)
+        if value is not None:
+            return shard_for_id(value)
+    if instance.pk is not None:
+        return shard_for_id(instance.pk)
+    return None
+
+
+class CanteenShardRouter:
+    """Routes sharded models by canteen, reads mirrored models next to the data using them."""
+
+    def db_for_read(self, model, **hints):
+        label = _label(model)
+        instance = hints.get('instance')
+        if label in SHARDED_MODELS:
+            return (instance is not None and _shard_for_instance(instance)) or current_shard()
+        if label in MIRRORED_MODELS:
+            if instance is not None and instance._state.db:
+                return instance._state.db
+            return current_shard()
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        if _label(model) in SHARDED_MODELS:
+            instance = hints.get('instance')
+            return (instance is not None and _shard_for_instance(instance)) or current_shard()
+        # Mirrored models are written to default and copied by mirror_to_shards
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        routed = SHARDED_MODELS | MIRRORED_MODELS
+        if _label(obj1) in routed and _label(obj2) in routed:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None # Every shard carries the full schema
+
+
+class ShardedQuerySet(models.QuerySet):
+    """
+    Queryset of the ``SHARDED_MODELS``. The router only sees an instance when
+    one is saved directly; ``create``, ``get_or_create``, ``update_or_create``
+    and ``bulk_create`` build their rows here, so they route them the same way
+    (by canteen, order, menu item or slot) unless ``using()`` chose a database.
+    Filtered ``update()``/``delete()`` still run on the pinned shard.
+    """
+
+    def _shard_for_values(self, values):
+        if self._db is not None:
+            return None
+        fields = {key: value for key, value in values.items() if '__' not in key}
+        return _shard_for_instance(self.model(**fields))
+
+    def create(self, **kwargs):
+        alias = self._shard_for_values(kwargs)
+        if alias is not None:
+            return self.using(alias).create(**kwargs)
+        return super().create(**kwargs)
+
+    def get_or_create(self, defaults=None, **kwargs):
+        alias = self._shard_for_values(kwargs)
+        if alias is not None:
+            return self.using(alias).get_or_create(defaults, **kwargs)
+        return super().get_or_create(defaults, **kwargs)
+
+    def update_or_create(self, defaults=None, create_defaults=None, **kwargs):
+        alias = self._shard_for_values(kwargs)
+        if alias is not None:
+            return self.using(alias).update_or_create(defaults, create_defaults, **kwargs)
+        return super().update_or_create(defaults, create_defaults, **kwargs)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        if self._db is not None:
+            return super().bulk_create(objs, *args, **kwargs)
+        by_shard = {}
+        for obj in objs:
+            by_shard.setdefault(_shard_for_instance(obj) or current_shard(), []).append(obj)
+        for alias, group in by_shard.items():
+            self.using(alias).bulk_create(group, *args, **kwargs)
+        return objs
+
+
+ShardedManager = models.Manager.from_queryset(ShardedQuerySet)
+
+
+# --- Fan-out helpers for cross-shard reads ---
+
+def fan_out(queryset):
+    """The same queryset evaluated on every shard."""
+    if is_pinned() or not sharding_enabled():
+        return [queryset]
+    return [queryset.using(alias) for alias in shard_aliases()]
+
+
+def merge_sorted(querysets, key, reverse=False, limit=None):
+    """Merge per-shard querysets that are already ordered by ``key``."""
+    if len(querysets) == 1:
+        return list(querysets[0][:limit] if limit is not None else querysets[0])
+    streams = [qs[:limit] if limit is not None else qs for qs in querysets]
+    merged = heapq.merge(*streams, key=key, reverse=reverse)
+    return [obj for _, obj in zip(range(limit), merged)] if limit is not None else list(merged)
+
+
+def aggregate_across(queryset, **aggregates):
+    """Run ``aggregate()`` on every shard; returns the per-shard result dicts."""
+    return [qs.aggregate(**aggregates) for qs in fan_out(queryset)]
+
+
+def _ordering_key(queryset):
+    ordering = queryset.query.order_by or queryset.model._meta.ordering
+    if not ordering or not isinstance(ordering[0], str):
+        return None, False
+    field = ordering[0]
+    return attrgetter(field.lstrip('-').replace('__', '.')), field.startswith('-')
+
+
+class ShardedResults:
+    """
+    One queryset evaluated over several shards, exposed as a lazy sequence:
+    ``count()`` sums the shards and slicing fetches only ``stop`` rows from each
+    before merging, so paginating it never loads whole tables.
+    """
+
+    def __init__(self, queryset):
+        self.querysets = fan_out(queryset)
+        self.key, self.reverse = _ordering_key(queryset)
+
+    def count(self):
+        return sum(qs.count() for qs in self.querysets)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop = index.start or 0, index.stop
+        if self.key is not None:
+            rows = merge_sorted(self.querysets, self.key, self.reverse, limit=stop)
+        else:
+            rows = [obj for qs in self.querysets for obj in (qs[:stop] if stop is not None else qs)]
+        return rows[start:stop]
+
+    def __iter__(self):
+        return iter(self[0:None])
+
+
+class CanteenShardMixin:
+    """
+    Pins a view's queries to the shard the request belongs to.
+
+    Detail routes are routed by the sharded object's ``pk``; otherwise a
+    ``canteen`` query parameter or body field decides. Requests that name no canteen stay
+    unpinned and ``list`` fans out over all shards via ``ShardedResults``.
+    """
+    def get_shard(self, request):
+        pk = self.kwargs.get('pk')
+        if pk is not None:
+            return shard_for_id(pk)
+        canteen = request.query_params.get('canteen')
+        if canteen is None and isinstance(request.data, Mapping):
+            canteen = request.data.get('canteen')
+        return shard_for_canteen(canteen) if canteen is not None else None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        alias = self.get_shard(request) if sharding_enabled() else None
+        self._shard_token = _pinned_shard.set(alias) if alias is not None else None
+
+    def _unpin(self):
+        token = getattr(self, '_shard_token', None)
+        if token is not None:
+            _pinned_shard.reset(token)
+            self._shard_token = None
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        self._unpin()
+        return super().finalize_response(request, response, *args, **kwargs)
+
+    def handle_exception(self, exc):
+        try:
+            return super().handle_exception(exc)
+        except Exception:
+            self._unpin() # finalize_response is skipped; don't leave the pin to the thread's next request
+            raise
+
+    def list(self, request, *args, **kwargs):
+        if is_pinned() or not sharding_enabled():
+            return super().list(request, *args, **kwargs)
+        objects = ShardedResults(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(objects)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return Response(self.get_serializer(list(objects), many=True).data)
+
+
+# --- Mirroring and id blocks ---
+
+def mirror_to_shards(sender, instance, using, **kwargs):
+    """post_save handler copying reference rows from default to the other shards."""
+    if using != DEFAULT_DB_ALIAS or not sharding_enabled():
+        return
+    values = {
+        field.attname: getattr(instance, field.attname)
+        for field in sender._meta.concrete_fields if not field.primary_key
+    }
+    for alias in shard_aliases():
+        if alias != DEFAULT_DB_ALIAS:
+            sender._base_manager.using(alias).update_or_create(pk=instance.pk, defaults=values)
+
+
+def delete_from_shards(sender, instance, using, **kwargs):
+    """post_delete handler removing mirrored rows (and their shard data) everywhere."""
+    if using != DEFAULT_DB_ALIAS or not sharding_enabled():
+        return
+    for alias in shard_aliases():
+        if alias != DEFAULT_DB_ALIAS:
+            sender._base_manager.using(alias).filter(pk=instance.pk).delete()
+
+
+def reserve_id_blocks(sender, using=DEFAULT_DB_ALIAS, apps=None, **kwargs):
+    """post_migrate handler starting each shard's sequences at its own id block."""
+    if using not in settings.SHARD_DATABASES:
+        return
+    floor = settings.SHARD_DATABASES.index(using) * settings.SHARD_ID_BLOCK
+    if floor == 0:
+        return
+    connection = connections[using]
+    tables = [
+        model._meta.db_table for model in (apps or sender.apps).get_models()
+        if _label(model) in SHARDED_MODELS
+    ]
+    with connection.cursor() as cursor:
+        for table in tables:
+            quoted = connection.ops.quote_name(table)
+            if connection.vendor == 'postgresql':
+                cursor.execute(
+                    f"SELECT setval(pg_get_serial_sequence(%s, 'id'), "
+                    f"GREATEST(%s, (SELECT COALESCE(MAX(id), 0) FROM {quoted})))",
+                    [table, floor],
+                )
+            elif connection.vendor == 'sqlite':
+                cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = %s", [table])
+                row = cursor.fetchone()
+                if row is None:
+                    cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)", [table, floor])
+                elif row[0] < floor:
+                    cursor.execute("UPDATE sqlite_sequence SET seq = %s WHERE name = %s", [floor, table])
+            else:
+                logger.warning(f"Cannot reserve id block on {connection.vendor} shard '{using}' for {table}")
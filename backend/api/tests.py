@@ -1,3 +1,1520 @@
-from django.test import TestCase
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import tempfile
+import threading
+from datetime import time, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core import mail
+from django.core.management import call_command
+from django.db import IntegrityError, connection, connections, transaction
+from django.test import AsyncClient, AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+import numpy as np
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from .async_views import CanteenDetailView, CategoryListView, MenuItemListView
+from .availability import AvailabilityIndex, get_index, invalidate_index
+from .eta import estimate_ready_at, get_prep_table, grouped_quantiles, queue_depth, queue_depths, refresh_prep_stats
+from .forecasting import forecast_demand
+from .hashers import TunedPBKDF2PasswordHasher
+from .hashing import HashingBusy
+from .inventory import (
+    OutOfStock, commit_paid_order, decrement_stock, ensure_stock_rolled_over, release_expired_reservations,
+    reserve_stock,
+)
+from .models import (
+    AvailabilityWindow, Canteen, Category, CheckoutCart, DemandForecast, IdempotencyRecord, ItemPairing, MenuItem,
+    Notification, Order, OrderItem, PairingMatrix, PickupSlot, PickupTokenCounter, PushSubscription, StockReservation,
+)
+from .notifications import Channel, Dispatcher
+from .ordering import place_orders
+from .payments import FakeGateway
+from .pricing import invalidate_prices, quote
+from .recommendations import build_pairings
+from .receipts import receipt_path, receipt_snapshot, render_receipt
+from .scheduling import SlotUnavailable, assign_slot, release_expired_checkout_slots, slot_availability
+from .sharding import fan_out, shard_aliases, shard_for_id, use_canteen_shard
+from .throttling import AdmissionController
+from .tokens import next_pickup_tokens
+from .warmup import WarmupLifespan, warm_up
 
 # Create your tests here.
+
+class AllShardsMixin:
+    # Saving a canteen, category or user mirrors it to every shard (api.sharding.mirror_to_shards)
+    databases = '__all__'
+
+
+# Unpinned queries only see default; canteens in CANTEEN_SHARDS keep their rows elsewhere
+def count_across(queryset):
+    return sum(qs.count() for qs in fan_out(queryset))
+
+
+def ids_across(queryset):
+    return {pk for qs in fan_out(queryset) for pk in qs.values_list('pk', flat=True)}
+
+
+class InventoryTests(AllShardsMixin, TestCase):
+    def setUp(self):
+        self.canteen = Canteen.objects.create(name="Main")
+        self.customer = User.objects.create_user("buyer", password="pw")
+        self.item = MenuItem.objects.create(
+            canteen=self.canteen, name="Samosa", price=Decimal('15.00'), daily_stock=5,
+        )
+
+    def test_first_sale_of_the_day_resets_stock(self):
+        self.item.stock_remaining = 0
+        self.item.stock_date = timezone.localdate() - timedelta(days=1)
+        self.item.is_available = False
+        self.item.save()
+
+        with transaction.atomic():
+            decrement_stock({self.item: 2})
+
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.stock_remaining, 3)
+        self.assertTrue(self.item.is_available)
+
+    def test_sold_out_item_returns_on_the_next_day_without_a_sale(self):
+        self.item.stock_remaining = 0
+        self.item.stock_date = timezone.localdate() - timedelta(days=1)
+        self.item.is_available = False
+        self.item.save()
+        hidden = MenuItem.objects.create(canteen=self.canteen, name="Vada", price=Decimal('12.00'), daily_stock=5,
+                                         stock_remaining=3, is_available=False) # Switched off by staff
+
+        with patch('api.inventory._rolled_over_on', None):
+            names = [row['name'] for row in APIClient().get(f'/api/menu-items/?canteen={self.canteen.id}').data]
+
+        self.assertEqual(names, ["Samosa"])
+        self.item.refresh_from_db()
+        self.assertEqual((self.item.stock_remaining, self.item.stock_date), (5, timezone.localdate()))
+        hidden.refresh_from_db()
+        self.assertFalse(hidden.is_available)
+
+    def test_item_flips_unavailable_at_zero(self):
+        with transaction.atomic():
+            decrement_stock({self.item: 5})
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.stock_remaining, 0)
+        self.assertFalse(self.item.is_available)
+
+        with self.assertRaises(OutOfStock):
+            with transaction.atomic():
+                decrement_stock({self.item: 1})
+
+    def test_reservation_is_consumed_by_payment(self):
+        reserve_stock(self.customer, "order_rzp_1", {self.item: 2})
+        commit_paid_order(self.customer, "order_rzp_1", {self.item: 2})
+
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.stock_remaining, 3)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_expired_reservation_returns_stock(self):
+        reserve_stock(self.customer, "order_rzp_2", {self.item: 5})
+        self.item.refresh_from_db()
+        self.assertFalse(self.item.is_available)
+
+        released = release_expired_reservations(now=timezone.now() + timedelta(hours=1))
+
+        self.assertEqual(released, 1)
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.stock_remaining, 5)
+        self.assertTrue(self.item.is_available)
+
+
+class InventoryConcurrencyTests(AllShardsMixin, TransactionTestCase):
+    buyers = 30
+    stock = 10
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest("needs a test database that accepts parallel connections")
+
+    def test_parallel_buyers_never_oversell(self):
+        canteen = Canteen.objects.create(name="Rush Hour")
+        item = MenuItem.objects.create(
+            canteen=canteen, name="Vada Pav", price=Decimal('20.00'), daily_stock=self.stock,
+        )
+        start = threading.Barrier(self.buyers)
+        outcomes = []
+
+        def buy():
+            menu_item = MenuItem.objects.get(pk=item.pk)
+            start.wait()
+            try:
+                with transaction.atomic():
+                    decrement_stock({menu_item: 1})
+                outcomes.append(True)
+            except OutOfStock:
+                outcomes.append(False)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=buy) for _ in range(self.buyers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        item.refresh_from_db()
+        self.assertEqual(outcomes.count(True), self.stock)
+        self.assertEqual(item.stock_remaining, 0)
+        self.assertFalse(item.is_available)
+
+
+class PickupTokenTests(AllShardsMixin, TestCase):
+    def setUp(self):
+        self.customer = User.objects.create_user("regular", password="pw")
+        self.main = Canteen.objects.create(name="Main")
+        self.annex = Canteen.objects.create(name="Annex")
+        self.tea = MenuItem.objects.create(canteen=self.main, name="Tea", price=Decimal('10.00'))
+        self.bun = MenuItem.objects.create(canteen=self.annex, name="Bun", price=Decimal('15.00'))
+
+    def test_tokens_count_per_canteen_and_day(self):
+        first, = place_orders(self.customer, self.main, [{'lines': {self.tea: 1}}])
+        group = place_orders(self.customer, self.main, [{'lines': {self.tea: 1}}] * 3)
+        annex, = place_orders(self.customer, self.annex, [{'lines': {self.bun: 1}}])
+        self.assertEqual([first.pickup_token] + [order.pickup_token for order in group], [1, 2, 3, 4])
+        self.assertEqual(annex.pickup_token, 1)
+        self.assertEqual(Order.objects.get(pk=first.pk).token_date, timezone.localdate())
+
+        with patch('api.ordering.timezone.localdate', return_value=timezone.localdate() + timedelta(days=1)):
+            tomorrow, = place_orders(self.customer, self.main, [{'lines': {self.tea: 1}}])
+        self.assertEqual(tomorrow.pickup_token, 1)
+
+
+class PickupTokenConcurrencyTests(AllShardsMixin, TransactionTestCase):
+    customers = 20
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest("needs a test database that accepts parallel connections")
+
+    def test_parallel_orders_get_distinct_consecutive_tokens(self):
+        canteen = Canteen.objects.create(name="Rush Hour")
+        customer = User.objects.create_user("crowd", password="pw")
+        start = threading.Barrier(self.customers)
+        errors = []
+
+        def order():
+            start.wait()
+            try:
+                # place_orders minus stock and slots, which would make sqlite upgrade a read lock
+                with transaction.atomic():
+                    token, = next_pickup_tokens(canteen, timezone.localdate())
+                    Order.objects.create(customer=customer, canteen=canteen, pickup_token=token,
+                                         token_date=timezone.localdate())
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=order) for _ in range(self.customers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        tokens = sorted(Order.objects.values_list('pickup_token', flat=True))
+        self.assertEqual(tokens, list(range(1, self.customers + 1)))
+
+
+class PickupSlotTests(AllShardsMixin, TestCase):
+    def setUp(self):
+        self.canteen = Canteen.objects.create(name="Main")
+        self.item = MenuItem.objects.create(canteen=self.canteen, name="Thali", price=Decimal('60.00'), prep_units=3)
+        self.tomorrow = timezone.localdate() + timedelta(days=1)
+
+    def test_orders_spill_into_the_next_slot_when_full(self):
+        first = PickupSlot.objects.create(canteen=self.canteen, start_time=time(12, 0), end_time=time(12, 15), capacity=2)
+        second = PickupSlot.objects.create(canteen=self.canteen, start_time=time(12, 15), end_time=time(12, 30), capacity=2)
+
+        booked = [assign_slot(self.canteen, {self.item: 1}, date=self.tomorrow)[0] for _ in range(4)]
+
+        self.assertEqual(booked, [first, first, second, second])
+        with self.assertRaises(SlotUnavailable):
+            assign_slot(self.canteen, {self.item: 1}, date=self.tomorrow)
+        self.assertEqual([slot['remaining'] for slot in slot_availability(self.canteen, self.tomorrow)], [0, 0])
+
+    def test_prep_unit_capacity(self):
+        slot = PickupSlot.objects.create(
+            canteen=self.canteen, start_time=time(13, 0), end_time=time(13, 30), capacity=10, capacity_unit='PREP_UNITS',
+        )
+        _, _, load = assign_slot(self.canteen, {self.item: 3}, slot=slot, date=self.tomorrow)
+        self.assertEqual(load, 9)
+        with self.assertRaises(SlotUnavailable):
+            assign_slot(self.canteen, {self.item: 1}, slot=slot, date=self.tomorrow)
+
+    def test_no_slots_left_is_not_reported_as_full(self):
+        PickupSlot.objects.create(canteen=self.canteen, start_time=time(12, 0), end_time=time(12, 15), capacity=2)
+        evening = timezone.localtime().replace(hour=20, minute=0)
+        with patch('api.scheduling.timezone.localtime', return_value=evening):
+            with self.assertRaisesMessage(SlotUnavailable, "No pickup slots are left today."):
+                assign_slot(self.canteen, {self.item: 1})
+
+    @override_settings(PAYMENT_GATEWAY='api.payments.FakeGateway')
+    def test_checkout_books_the_slot_before_payment(self):
+        FakeGateway.reset()
+        self.addCleanup(FakeGateway.reset)
+        gateway = FakeGateway()
+        slot = PickupSlot.objects.create(canteen=self.canteen, start_time=time(0, 0), end_time=time.max, capacity=1)
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user("payer", password="pw"))
+        details = {'canteen': self.canteen.id, 'items': [{'menu_item_id': self.item.id, 'quantity': 1}]}
+        created = client.post('/api/payment/create-razorpay-order/', {'amount': 6000, 'pickup_slot': slot.id, **details}, format='json')
+        self.assertEqual(created.status_code, 201)
+
+        # The slot fills up while the customer pays; their booking was already made
+        again = client.post('/api/payment/create-razorpay-order/', {'amount': 6000, 'pickup_slot': slot.id, **details}, format='json')
+        self.assertEqual(again.status_code, 409)
+        with self.assertRaises(SlotUnavailable), transaction.atomic():
+            assign_slot(self.canteen, {self.item: 1}, slot=slot)
+
+        payment, signature = gateway.capture(created.data['order_id'])
+        verified = client.post('/api/payment/verify-payment/', {
+            'razorpay_order_id': created.data['order_id'], 'razorpay_payment_id': payment['id'],
+            'razorpay_signature': signature, 'local_order_details': details,
+        }, format='json')
+        self.assertEqual(verified.status_code, 201)
+        self.assertEqual(Order.objects.get(pk=verified.data['orderId']).pickup_slot, slot)
+        self.assertEqual(slot_availability(self.canteen, timezone.localdate())[0]['remaining'], 0)
+
+    def test_unpaid_checkouts_give_their_slot_back(self):
+        slot = PickupSlot.objects.create(canteen=self.canteen, start_time=time(12, 0), end_time=time(12, 15), capacity=1)
+        booked, date, load = assign_slot(self.canteen, {self.item: 1}, slot=slot, date=self.tomorrow)
+        CheckoutCart.objects.create(
+            razorpay_order_id='order_abandoned', customer=User.objects.create_user("payer", password="pw"),
+            canteen=self.canteen, lines={str(self.item.id): 1}, amount=6000,
+            pickup_slot=booked, pickup_date=date, slot_load=load, slot_held=True,
+        )
+
+        later = timezone.now() + timedelta(seconds=settings.STOCK_RESERVATION_TTL_SECONDS + 1)
+        with use_canteen_shard(self.canteen):
+            self.assertEqual(release_expired_checkout_slots(), 0)
+            self.assertEqual(release_expired_checkout_slots(now=later), 1)
+            self.assertEqual(release_expired_checkout_slots(now=later), 0)
+        self.assertEqual(slot_availability(self.canteen, self.tomorrow)[0]['remaining'], 1)
+
+
+class EtaTests(AllShardsMixin, TestCase):
+    def setUp(self):
+        self.canteen = Canteen.objects.create(name="Main")
+        self.customer = User.objects.create_user("eater", password="pw")
+        self.dosa = MenuItem.objects.create(canteen=self.canteen, name="Dosa", price=Decimal('40.00'))
+        self.tea = MenuItem.objects.create(canteen=self.canteen, name="Tea", price=Decimal('10.00'))
+
+    def _ready_order(self, item, minutes):
+        order = Order.objects.create(customer=self.customer, canteen=self.canteen, status='COMPLETED')
+        OrderItem.objects.create(order=order, menu_item=item, quantity=1, price=item.price)
+        Order.objects.filter(pk=order.pk).update(ready_at=order.created_at + timedelta(minutes=minutes))
+
+    def test_grouped_quantiles_match_numpy(self):
+        keys = np.array([2, 1, 2, 1, 2])
+        values = np.array([5.0, 1.0, 1.0, 3.0, 3.0])
+        unique_keys, counts, result = grouped_quantiles(keys, values, [0.5, 0.9])
+        self.assertEqual(list(unique_keys), [1, 2])
+        self.assertEqual(list(counts), [2, 3])
+        np.testing.assert_allclose(result[0], np.quantile([1.0, 3.0], [0.5, 0.9]))
+        np.testing.assert_allclose(result[1], np.quantile([5.0, 1.0, 3.0], [0.5, 0.9]))
+
+    def test_eta_uses_slowest_item_and_queue(self):
+        for minutes in (10, 12, 14):
+            self._ready_order(self.dosa, minutes)
+        self._ready_order(self.tea, 2)
+        refresh_prep_stats()
+
+        earlier = Order.objects.create(customer=self.customer, canteen=self.canteen)
+        order = Order.objects.create(customer=self.customer, canteen=self.canteen)
+        now = timezone.now()
+        eta = estimate_ready_at(order, [self.dosa.id, self.tea.id], queue_depth(order), now=now)
+
+        self.assertEqual(queue_depth(order), 1)
+        table = get_prep_table()
+        expected = table['items'][self.dosa.id] + table['canteens'][self.canteen.id] / settings.KITCHEN_PARALLELISM
+        self.assertEqual(table['items'][self.dosa.id], 12 * 60)
+        self.assertAlmostEqual((eta - now).total_seconds(), expected, places=3)
+        self.assertIsNone(estimate_ready_at(Order(status='CANCELLED', canteen=self.canteen), [], 0))
+        self.assertEqual(queue_depth(earlier), 0)
+
+    def test_order_lists_count_the_queue_once_per_canteen(self):
+        other = Canteen.objects.create(name="Annex")
+        orders = [Order.objects.create(customer=self.customer, canteen=canteen)
+                  for canteen in (self.canteen, other, self.canteen, self.canteen, other)]
+        Order.objects.create(customer=self.customer, canteen=self.canteen, status='COMPLETED')
+        self.assertEqual(queue_depths(orders), {order.pk: queue_depth(order) for order in orders})
+
+        client = APIClient()
+        client.force_authenticate(User.objects.create_superuser("boss", "boss@example.com", "pw"))
+        get_prep_table()
+        captured = [self.enterContext(CaptureQueriesContext(connections[alias])) for alias in shard_aliases()]
+        rows = client.get('/api/admin/orders/').data['results']
+        self.assertEqual(len(rows), 6)
+        self.assertTrue(all(row['estimated_ready_at'] for row in rows if row['status'] == 'PENDING'))
+        queries = [q['sql'] for capture in captured for q in capture.captured_queries]
+        self.assertEqual(sum('COUNT(' not in sql and '"status" IN' in sql for sql in queries), 2)
+
+
+@override_settings(RATE_LIMITS={'orders': {'user': {'burst': 2, 'per_minute': 1}}})
+class RateLimitTests(AllShardsMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user("spammer", password="pw"))
+
+    def test_order_creation_is_throttled_per_user(self):
+        statuses = [self.client.post('/api/orders/', {}, format='json').status_code for _ in range(3)]
+        self.assertEqual(statuses[:2], [400, 400]) # Reaches validation
+        self.assertEqual(statuses[2], 429)
+
+    def test_reads_are_not_throttled(self):
+        for _ in range(5):
+            self.assertEqual(self.client.get('/api/orders/').status_code, 200)
+
+    def test_admission_control_sheds_load(self):
+        with patch('api.throttling.admission', AdmissionController(1)) as controller:
+            controller.acquire(timeout=0) # Another request holds the only slot
+            response = self.client.post('/api/orders/', {}, format='json')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], str(settings.ADMISSION_RETRY_AFTER_SECONDS))
+
+
+class IdempotencyTests(AllShardsMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.canteen = Canteen.objects.create(name="Main")
+        self.item = MenuItem.objects.create(canteen=self.canteen, name="Idli", price=Decimal('25.00'))
+        self.customer = User.objects.create_user("retrier", password="pw")
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+        self.payload = {'canteen': self.canteen.id, 'items': [{'menu_item_id': self.item.id, 'quantity': 2}]}
+
+    def test_retry_replays_the_first_response(self):
+        first = self.client.post('/api/orders/', self.payload, format='json', HTTP_IDEMPOTENCY_KEY='abc')
+        retry = self.client.post('/api/orders/', self.payload, format='json', HTTP_IDEMPOTENCY_KEY='abc')
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.content, first.content)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_key_reused_with_different_body_is_rejected(self):
+        self.client.post('/api/orders/', self.payload, format='json', HTTP_IDEMPOTENCY_KEY='abc')
+        self.payload['items'][0]['quantity'] = 3
+        response = self.client.post('/api/orders/', self.payload, format='json', HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual(response.status_code, 422)
+
+    def _in_flight(self):
+        return IdempotencyRecord.objects.create(
+            user=self.customer, key='abc', endpoint='/api/orders/',
+            request_hash='in-flight', expires_at=timezone.now() + timedelta(hours=1),
+        )
+
+    def test_concurrent_duplicate_waits_for_the_first(self):
+        record = self._in_flight()
+
+        def first_request_finishes(seconds):
+            IdempotencyRecord.objects.filter(pk=record.pk).update(
+                status_code=201, content_type='application/json', response_body=b'{"id": 7}',
+            )
+
+        with patch('api.idempotency._fingerprint', return_value='in-flight'), \
+                patch('api.idempotency.time.sleep', side_effect=first_request_finishes) as sleep:
+            response = self.client.post('/api/orders/', self.payload, format='json', HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual(sleep.call_count, 1)
+        self.assertEqual((response.status_code, response.content), (201, b'{"id": 7}'))
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+        self.assertFalse(Order.objects.exists())
+
+    @override_settings(IDEMPOTENCY_WAIT_SECONDS=0)
+    def test_concurrent_duplicate_gives_up_after_the_wait(self):
+        self._in_flight()
+        with patch('api.idempotency._fingerprint', return_value='in-flight'):
+            response = self.client.post('/api/orders/', self.payload, format='json', HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Order.objects.exists())
+
+    def test_unhandled_error_releases_the_key(self):
+        with patch('api.views.OrderViewSet.perform_create', side_effect=RuntimeError("boom")):
+            with self.assertRaises(RuntimeError):
+                self.client.post('/api/orders/', self.payload, format='json', HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertFalse(IdempotencyRecord.objects.exists())
+
+        retry = self.client.post('/api/orders/', self.payload, format='json', HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual(retry.status_code, 201)
+
+
+class BulkOrderTests(AllShardsMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.canteen = Canteen.objects.create(name="Main")
+        self.other = Canteen.objects.create(name="Annex")
+        self.tea = MenuItem.objects.create(canteen=self.canteen, name="Tea", price=Decimal('10.00'), daily_stock=3)
+        self.bun = MenuItem.objects.create(canteen=self.canteen, name="Bun", price=Decimal('15.00'))
+        self.elsewhere = MenuItem.objects.create(canteen=self.other, name="Juice", price=Decimal('30.00'))
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user("host", password="pw"))
+
+    def _post(self, orders):
+        payload = {'canteen': self.canteen.id, 'table_number': 'T4', 'orders': orders}
+        return self.client.post('/api/orders/bulk/', payload, format='json')
+
+    def test_table_orders_are_created_together(self):
+        response = self._post([
+            {'items': [{'menu_item_id': self.tea.id, 'quantity': 1}, {'menu_item_id': self.bun.id, 'quantity': 2}]},
+            {'items': [{'menu_item_id': self.tea.id, 'quantity': 2}], 'notes': 'less sugar'},
+        ])
+
+        self.assertEqual(response.status_code, 201)
+        results = response.data['orders']
+        self.assertEqual([r['total_price'] for r in results], ['40.00', '20.00'])
+        self.assertEqual(Order.objects.filter(table_number='T4').count(), 2)
+        self.assertEqual(OrderItem.objects.count(), 3)
+        self.tea.refresh_from_db()
+        self.assertEqual(self.tea.stock_remaining, 0)
+
+    def test_invalid_entries_are_reported_per_order(self):
+        response = self._post([
+            {'items': [{'menu_item_id': self.bun.id, 'quantity': 1}]},
+            {'items': [{'menu_item_id': self.elsewhere.id, 'quantity': 1}]},
+        ])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['orders'][0], {})
+        self.assertIn('items', response.data['orders'][1])
+        self.assertFalse(Order.objects.exists())
+
+    def test_stock_shortage_rolls_back_the_whole_batch(self):
+        response = self._post([
+            {'items': [{'menu_item_id': self.bun.id, 'quantity': 1}]},
+            {'items': [{'menu_item_id': self.tea.id, 'quantity': 4}]},
+        ])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+
+class ShardRoutingTests(TestCase):
+    # Runs when a second database is configured, e.g. SHARD_ALIASES=shard_1
+    databases = '__all__'
+
+    def setUp(self):
+        if len(settings.SHARD_DATABASES) < 2:
+            self.skipTest("needs a second database in SHARD_DATABASES")
+        self.shard = settings.SHARD_DATABASES[1]
+        self.home = Canteen.objects.create(name="Main")
+        self.remote = Canteen.objects.create(name="Annex")
+        self.enterContext(override_settings(CANTEEN_SHARDS={self.remote.id: self.shard}))
+        self.tea = MenuItem.objects.create(canteen=self.home, name="Tea", price=Decimal('10.00'))
+        with use_canteen_shard(self.remote):
+            self.juice = MenuItem.objects.create(canteen=self.remote, name="Juice", price=Decimal('30.00'))
+        self.customer = User.objects.create_user("diner", password="pw")
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def test_unpinned_writes_follow_the_canteen(self):
+        lassi = MenuItem.objects.create(canteen=self.remote, name="Lassi", price=Decimal('25.00'))
+        PickupSlot.objects.bulk_create([
+            PickupSlot(canteen=canteen, start_time=time(12), end_time=time(13), capacity=5)
+            for canteen in (self.home, self.remote)
+        ])
+        PickupSlot.objects.get_or_create(canteen=self.remote, start_time=time(13), defaults={'end_time': time(14), 'capacity': 5})
+        tokens = [next_pickup_tokens(self.remote, timezone.localdate(), 2) for _ in range(2)]
+
+        self.assertEqual(shard_for_id(lassi.pk), self.shard)
+        self.assertTrue(MenuItem.objects.using(self.shard).filter(pk=lassi.pk).exists())
+        self.assertEqual(PickupSlot.objects.using(self.shard).filter(canteen=self.remote).count(), 2)
+        self.assertEqual(count_across(PickupSlot.objects.all()), 3)
+        self.assertEqual(tokens, [[1, 2], [3, 4]])
+        self.assertFalse(PickupTokenCounter.objects.using('default').exists())
+
+    def test_reference_rows_are_mirrored_to_shards(self):
+        self.assertTrue(Canteen.objects.using(self.shard).filter(pk=self.remote.pk).exists())
+        self.assertTrue(User.objects.using(self.shard).filter(pk=self.customer.pk).exists())
+        self.assertEqual(shard_for_id(self.juice.pk), self.shard)
+        self.assertEqual(shard_for_id(self.tea.pk), 'default')
+
+    def test_orders_are_stored_on_their_canteen_shard(self):
+        response = self.client.post('/api/orders/', {
+            'canteen': self.remote.id, 'items': [{'menu_item_id': self.juice.id, 'quantity': 2}],
+        }, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        order_id = response.data['id']
+        self.assertTrue(Order.objects.using(self.shard).filter(pk=order_id, total_price=Decimal('60.00')).exists())
+        self.assertFalse(Order.objects.using('default').filter(pk=order_id).exists())
+        self.assertEqual(self.client.get(f'/api/orders/{order_id}/').data['canteen']['id'], self.remote.id)
+
+    def test_admin_views_merge_all_shards(self):
+        place_orders(self.customer, self.home, [{'lines': {self.tea: 1}}])
+        place_orders(self.customer, self.remote, [{'lines': {self.juice: 1}}])
+        self.client.force_authenticate(User.objects.create_superuser("boss", "boss@example.com", "pw"))
+
+        orders = self.client.get('/api/admin/orders/').data['results']
+        stats = self.client.get('/api/admin/dashboard-stats/').data
+
+        self.assertEqual({order['canteen']['id'] for order in orders}, {self.home.id, self.remote.id})
+        self.assertEqual(stats['total_orders_today'], 2)
+        self.assertEqual(stats['pending_orders'], 2)
+
+
+class ConditionalGetTests(AllShardsMixin, TestCase):
+    def setUp(self):
+        self.canteen = Canteen.objects.create(name="Main")
+        self.item = MenuItem.objects.create(canteen=self.canteen, name="Tea", price=Decimal('10.00'), daily_stock=5)
+        self.client = APIClient()
+
+    def test_unchanged_menu_is_not_modified(self):
+        first = self.client.get('/api/menu-items/')
+
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('Last-Modified', first)
+        again = self.client.get('/api/menu-items/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(again.status_code, 304)
+        since = self.client.get('/api/menu-items/', HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(since.status_code, 304)
+
+    def test_edits_and_stock_changes_invalidate_the_etag(self):
+        etag = self.client.get('/api/menu-items/')['ETag']
+
+        decrement_stock({self.item: 1})
+        after_sale = self.client.get('/api/menu-items/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(after_sale.status_code, 200)
+        self.assertEqual(after_sale.data[0]['stock_remaining'], 4)
+
+        self.canteen.name = "Main Hall"
+        self.canteen.save()
+        after_rename = self.client.get('/api/menu-items/', HTTP_IF_NONE_MATCH=after_sale['ETag'])
+        self.assertEqual(after_rename.status_code, 200)
+
+    def test_deleting_a_row_changes_the_etag(self):
+        other = MenuItem.objects.create(canteen=self.canteen, name="Bun", price=Decimal('15.00'))
+        etag = self.client.get('/api/menu-items/')['ETag']
+
+        other.delete()
+
+        self.assertEqual(self.client.get('/api/menu-items/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class AvailabilityTests(AllShardsMixin, TestCase):
+    MONDAY = timezone.make_aware(timezone.datetime(2026, 10, 19, 9, 30))
+
+    def setUp(self):
+        cache.clear()
+        invalidate_index()
+        self.addCleanup(invalidate_index)
+        self.canteen = Canteen.objects.create(name="Main")
+        self.tea = MenuItem.objects.create(canteen=self.canteen, name="Tea", price=Decimal('10.00'))
+        self.dosa = MenuItem.objects.create(canteen=self.canteen, name="Dosa", price=Decimal('40.00'))
+        AvailabilityWindow.objects.create(menu_item=self.dosa, weekdays=0b0011111, start_time=time(7), end_time=time(11))
+        self.client = APIClient()
+
+    def at(self, hours=0, days=0):
+        return patch('django.utils.timezone.now', return_value=self.MONDAY + timedelta(hours=hours, days=days))
+
+    def names(self):
+        return sorted(row['name'] for row in self.client.get('/api/menu-items/').data)
+
+    def test_index_segments(self):
+        index = AvailabilityIndex([(1, 0b1, time(7), time(11)), (2, 0b11, time(10), time(14))])
+        self.assertEqual(index.closed_items(self.MONDAY), {2})
+        self.assertEqual(index.closed_items(self.MONDAY + timedelta(hours=1)), set())
+        self.assertEqual(index.closed_items(self.MONDAY + timedelta(days=1, hours=1)), {1})
+        self.assertEqual(index.closed_items(self.MONDAY + timedelta(days=2)), {1, 2})
+        start, end = index.segment_bounds(self.MONDAY)
+        self.assertEqual((start.hour, end.hour), (7, 10))
+        self.assertEqual(AvailabilityIndex([]).segment_bounds(self.MONDAY)[1], None)
+
+    def test_menu_hides_items_outside_their_windows(self):
+        with self.at():
+            self.assertEqual(self.names(), ["Dosa", "Tea"])
+        with self.at(hours=2):
+            self.assertEqual(self.names(), ["Tea"])
+        with self.at(days=5): # Saturday
+            self.assertEqual(self.names(), ["Tea"])
+
+    @override_settings(CATALOG_CACHE_MAX_AGE=3600)
+    def test_validators_roll_over_at_window_boundaries(self):
+        with self.at(hours=1):
+            first = self.client.get('/api/menu-items/')
+            self.assertIn('max-age=1800', first['Cache-Control']) # Dosa closes at 11:00
+            self.assertEqual(self.client.get('/api/menu-items/', HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        with self.at(hours=1.6):
+            after = self.client.get('/api/menu-items/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(after.status_code, 200)
+        self.assertEqual([row['name'] for row in after.data], ["Tea"])
+
+    def test_closed_items_cannot_be_ordered(self):
+        self.client.force_authenticate(User.objects.create_user("early", password="pw"))
+        payload = {'canteen': self.canteen.id, 'items': [{'menu_item_id': self.dosa.id, 'quantity': 1}]}
+        with self.at(hours=2):
+            response = self.client.post('/api/orders/', payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        with self.at():
+            self.assertEqual(self.client.post('/api/orders/', payload, format='json').status_code, 201)
+
+    def test_admin_edits_take_effect_immediately(self):
+        admin = APIClient()
+        admin.force_authenticate(User.objects.create_superuser("boss", "boss@example.com", "pw"))
+        with self.at(hours=2):
+            self.assertEqual(self.names(), ["Tea"])
+            created = admin.post('/api/admin/availability-windows/', {
+                'menu_item': self.dosa.id, 'weekdays': [0], 'start_time': '11:00', 'end_time': '15:00',
+            }, format='json')
+            self.assertEqual(created.status_code, 201)
+            self.assertEqual(created.data['weekdays'], [0])
+            self.assertEqual(self.names(), ["Dosa", "Tea"])
+            self.assertEqual(len(admin.get(f'/api/admin/availability-windows/?menu_item={self.dosa.id}').data), 2)
+            bad = admin.post('/api/admin/availability-windows/', {
+                'menu_item': self.dosa.id, 'start_time': '15:00', 'end_time': '11:00',
+            }, format='json')
+            self.assertEqual(bad.status_code, 400)
+            admin.delete(f"/api/admin/availability-windows/{created.data['id']}/")
+            self.assertEqual(self.names(), ["Tea"])
+
+
+class CategoryCountsTests(AllShardsMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.canteen = Canteen.objects.create(name="Main")
+        other = Canteen.objects.create(name="Annex")
+        self.drinks, snacks, desserts = (Category.objects.create(name=name) for name in ("Drinks", "Snacks", "Desserts"))
+        MenuItem.objects.create(canteen=self.canteen, category=self.drinks, name="Tea", price=Decimal('10.00'))
+        MenuItem.objects.create(canteen=self.canteen, category=self.drinks, name="Coffee", price=Decimal('20.00'))
+        self.samosa = MenuItem.objects.create(canteen=self.canteen, category=snacks, name="Samosa", price=Decimal('15.00'))
+        MenuItem.objects.create(canteen=self.canteen, category=desserts, name="Kulfi", price=Decimal('25.00'),
+                                is_available=False)
+        MenuItem.objects.create(canteen=self.canteen, name="Special", price=Decimal('50.00')) # Uncategorized
+        MenuItem.objects.create(canteen=other, category=desserts, name="Halwa", price=Decimal('30.00'))
+        self.client = APIClient()
+        self.url = f'/api/categories/?canteen={self.canteen.id}'
+        invalidate_index()
+        self.addCleanup(invalidate_index)
+        ensure_stock_rolled_over() # Keep the daily stock reset out of the counted queries
+        get_index() # Keep the index load out of the counted queries
+
+    def test_lists_categories_with_available_items_of_the_canteen(self):
+        with self.assertNumQueries(2): # Menu version, then the grouped counts
+            response = self.client.get(self.url)
+        self.assertEqual(response.json(), [
+            {'id': self.drinks.id, 'name': "Drinks", 'item_count': 2},
+            {'id': self.samosa.category_id, 'name': "Snacks", 'item_count': 1},
+        ])
+        with self.assertNumQueries(1): # Counts come from the cache while the menu is unchanged
+            self.assertEqual(self.client.get(self.url).json(), response.json())
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(len(self.client.get('/api/categories/').data), 3) # Unfiltered list is unchanged
+        self.assertEqual(self.client.get('/api/categories/?canteen=main').status_code, 400)
+
+    def test_menu_changes_refresh_the_counts(self):
+        etag = self.client.get(self.url)['ETag']
+        self.samosa.is_available = False
+        self.samosa.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['name'] for row in response.json()], ["Drinks"])
+
+        self.drinks.name = "Beverages"
+        self.drinks.save()
+        self.assertEqual(self.client.get(self.url).json()[0]['name'], "Beverages")
+
+    async def test_async_view_serves_the_same_counts(self):
+        sync = await sync_to_async(self.client.get)(self.url)
+        response = await CategoryListView.as_view()(AsyncRequestFactory().get(self.url))
+        self.assertEqual(json.loads(response.content), sync.json())
+        self.assertEqual(response['ETag'], sync['ETag'])
+
+
+class RecommendationTests(AllShardsMixin, TestCase):
+    def setUp(self):
+        invalidate_index()
+        self.addCleanup(invalidate_index)
+        get_index() # Keep the index load and stock reset out of the counted queries
+        ensure_stock_rolled_over()
+        self.canteen = Canteen.objects.create(name="Main")
+        self.customer = User.objects.create_user("regular", password="pw")
+        self.tea, self.samosa, self.bun, self.kulfi = (
+            MenuItem.objects.create(canteen=self.canteen, name=name, price=Decimal('10.00'))
+            for name in ("Tea", "Samosa", "Bun", "Kulfi")
+        )
+        self.order([self.tea, self.samosa], [self.tea, self.samosa], [self.tea, self.samosa], [self.tea, self.bun],
+                   [self.samosa, self.bun], [self.samosa, self.bun])
+        for order in self.order([self.tea, self.kulfi], [self.tea, self.kulfi]):
+            order.status = 'CANCELLED'
+            order.save()
+
+    def order(self, *carts):
+        return place_orders(self.customer, self.canteen, [{'lines': {item: 1 for item in cart}} for cart in carts])
+
+    def pairings(self):
+        return {
+            (p.menu_item.name, p.paired_item.name): (p.order_count, round(p.confidence, 2))
+            for p in ItemPairing.objects.select_related('menu_item', 'paired_item')
+        }
+
+    def test_builds_top_pairings_incrementally(self):
+        call_command('build_pairings', stdout=StringIO())
+        self.assertEqual(self.pairings(), { # Tea+Bun is below PAIRING_MIN_ORDERS, cancelled orders don't count
+            ("Tea", "Samosa"): (3, 0.75), ("Samosa", "Tea"): (3, 0.6),
+            ("Samosa", "Bun"): (2, 0.4), ("Bun", "Samosa"): (2, 0.67),
+        })
+
+        self.order([self.tea, self.bun, self.bun])
+        build_pairings(self.canteen, top_k=1)
+        incremental = self.pairings()
+        self.assertEqual(incremental[("Tea", "Samosa")], (3, 0.6))
+        self.assertEqual(incremental[("Bun", "Tea")], (2, 0.5)) # Tied with Samosa; the lower id wins
+        self.assertEqual(len(incremental), 3)
+        self.assertEqual(PairingMatrix.objects.get().order_count, 7)
+        build_pairings(self.canteen, rebuild=True, top_k=1)
+        self.assertEqual(self.pairings(), incremental)
+
+    def test_recommendations_read_the_stored_pairings(self):
+        build_pairings(self.canteen)
+        client = APIClient()
+        with self.assertNumQueries(1):
+            response = client.get(f'/api/menu-items/recommendations/?items={self.tea.id}')
+        self.assertEqual([(row['name'], row['confidence'], row['order_count']) for row in response.data],
+                         [("Samosa", 0.75, 3)])
+
+        cart = client.get(f'/api/menu-items/recommendations/?items={self.tea.id},{self.samosa.id}')
+        self.assertEqual([row['name'] for row in cart.data], ["Bun"])
+        self.bun.is_available = False
+        self.bun.save()
+        self.assertEqual(client.get(f'/api/menu-items/recommendations/?items={self.samosa.id}').data[0]['name'], "Tea")
+        self.assertEqual(client.get('/api/menu-items/recommendations/?items=tea').status_code, 400)
+
+
+class DemandForecastTests(AllShardsMixin, TestCase):
+    def setUp(self):
+        self.canteen = Canteen.objects.create(name="Main")
+        self.customer = User.objects.create_user("regular", password="pw")
+        self.tea = MenuItem.objects.create(canteen=self.canteen, name="Tea", price=Decimal('10.00'))
+        self.bun = MenuItem.objects.create(canteen=self.canteen, name="Bun", price=Decimal('15.00'))
+        self.today = timezone.datetime(2026, 10, 18).date() # A Sunday
+        self.order({self.tea: 2}, day=-13, hour=13) # Monday two weeks ago
+        self.order({self.tea: 3}, day=-6, hour=13) # Last Monday
+        self.order({self.tea: 1}, day=-6, hour=13)
+        self.order({self.tea: 5, self.bun: 1}, day=-6, hour=9, status='CANCELLED')
+        self.order({self.bun: 2}, day=-4, hour=9) # Wednesday
+        self.order({self.tea: 9}, day=0, hour=8) # Today, not complete yet
+
+    def order(self, lines, day, hour, status='COMPLETED'):
+        order, = place_orders(self.customer, self.canteen, [{'lines': lines}])
+        created = timezone.make_aware(timezone.datetime.combine(self.today + timedelta(days=day), time(hour, 15)))
+        Order.objects.filter(pk=order.pk).update(created_at=created, status=status)
+
+    def test_recent_weeks_weigh_more_and_quiet_hours_are_skipped(self):
+        self.assertEqual(forecast_demand(self.canteen, days=3, today=self.today), 2)
+        decay = 0.5 ** (1 / settings.FORECAST_HALF_LIFE_WEEKS)
+        monday = DemandForecast.objects.get(date=self.today + timedelta(days=1))
+        self.assertEqual((monday.menu_item, monday.hour), (self.tea, 13))
+        self.assertAlmostEqual(monday.quantity, (4 + 2 * decay) / (1 + decay), places=2)
+        wednesday = DemandForecast.objects.get(date=self.today + timedelta(days=3))
+        self.assertEqual((wednesday.menu_item, wednesday.hour, wednesday.quantity), (self.bun, 9, 2.0))
+
+        forecast_demand(self.canteen, days=1, today=self.today) # Reruns replace the day's rows
+        self.assertEqual(DemandForecast.objects.count(), 2)
+
+    def test_admin_endpoint_serves_a_days_forecast(self):
+        forecast_demand(self.canteen, days=3, today=self.today)
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user("admin", password="pw", is_staff=True))
+        url = f'/api/admin/demand-forecast/?canteen={self.canteen.id}&date=2026-10-21'
+        response = client.get(url)
+        self.assertEqual(response.data['items'], [
+            {'menu_item': self.bun.id, 'name': "Bun", 'total': 2.0, 'hours': [{'hour': 9, 'quantity': 2.0}]},
+        ])
+        self.assertEqual(client.get('/api/admin/demand-forecast/').status_code, 400)
+        client.force_authenticate(self.customer)
+        self.assertEqual(client.get(url).status_code, 403)
+
+
+class SlowChannel(Channel):
+    """Records how many batches it is sending at once."""
+
+    def __init__(self, name, **options):
+        super().__init__(name, **options)
+        self.lock, self.active, self.peak, self.batches = threading.Lock(), 0, 0, []
+
+    def send(self, batch):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            self.batches.append([n.payload['order_id'] for n in batch])
+        threading.Event().wait(0.05)
+        with self.lock:
+            self.active -= 1
+        return {}
+
+
+class WebhookReceiver(BaseHTTPRequestHandler):
+    """Local webhook endpoint: answers with the next of ``statuses`` (then 200) and keeps the bodies."""
+    statuses, received = [], []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        status = self.statuses.pop(0) if self.statuses else 200
+        if status == 200:
+            self.received.append((json.loads(body), self.headers['X-Canteen-Signature']))
+        self.send_response(status)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@override_settings(
+    NOTIFICATION_CHANNELS={'email': {'BACKEND': 'api.notifications.EmailChannel'}},
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+)
+class NotificationTests(AllShardsMixin, TestCase):
+    def setUp(self):
+        self.canteen = Canteen.objects.create(name="Main")
+        tea = MenuItem.objects.create(canteen=self.canteen, name="Tea", price=Decimal('10.00'))
+        self.customer = User.objects.create_user("hungry", "hungry@example.com", "pw")
+        self.orders = place_orders(self.customer, self.canteen, [{'lines': {tea: 1}} for _ in range(3)])
+        self.admin = APIClient()
+        self.admin.force_authenticate(User.objects.create_superuser("boss", "boss@example.com", "pw"))
+
+    def mark(self, order, status):
+        return self.admin.patch(f'/api/admin/orders/{order.id}/', {'status': status}, format='json')
+
+    def test_status_changes_are_queued_with_the_order(self):
+        self.assertEqual(self.mark(self.orders[0], 'PROCESSING').status_code, 200)
+        self.assertFalse(Notification.objects.exists()) # Not a notified status
+        self.mark(self.orders[0], 'READY')
+        self.mark(self.orders[0], 'READY') # No change, no second notification
+        notification = Notification.objects.get()
+        self.assertEqual((notification.channel, notification.event, notification.status), ('email', 'order.ready', 'PENDING'))
+        self.assertEqual(notification.payload['email'], "hungry@example.com")
+        self.assertEqual(len(mail.outbox), 0) # Nothing is sent by the request itself
+
+        with patch('api.views.release_slot', side_effect=RuntimeError), self.assertRaises(RuntimeError):
+            self.mark(self.orders[1], 'CANCELLED')
+        self.assertEqual(Notification.objects.count(), 1) # Rolled back with the status
+
+    def test_dispatcher_sends_email(self):
+        self.mark(self.orders[0], 'READY')
+        dispatcher = Dispatcher()
+        self.addCleanup(dispatcher.close)
+        self.assertEqual(dispatcher.run_once(), (1, 0))
+        self.assertEqual(mail.outbox[0].to, ["hungry@example.com"])
+        self.assertIn(f"#{self.orders[0].pickup_token} is ready", mail.outbox[0].subject)
+        self.assertEqual(Notification.objects.get().status, 'SENT')
+        self.assertEqual(dispatcher.run_once(), (0, 0))
+
+    def test_webhook_batches_and_retries(self):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), WebhookReceiver)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        WebhookReceiver.statuses, WebhookReceiver.received = [503], []
+        url = f'http://127.0.0.1:{server.server_port}/hook'
+        channels = {'webhook': {'BACKEND': 'api.notifications.WebhookChannel', 'URLS': [url], 'SECRET': 's3cret'}}
+        with override_settings(NOTIFICATION_CHANNELS=channels):
+            for order in self.orders:
+                self.mark(order, 'READY')
+            dispatcher = Dispatcher()
+            self.addCleanup(dispatcher.close)
+            self.assertEqual(dispatcher.run_once(), (0, 3))
+
+        retry = Notification.objects.first()
+        self.assertEqual((retry.status, retry.attempts), ('PENDING', 1))
+        self.assertIn("503", retry.last_error)
+        self.assertGreater(retry.next_attempt_at, timezone.now() + timedelta(seconds=10))
+        self.assertEqual(dispatcher.run_once(), (0, 0)) # Backing off
+        self.assertEqual(dispatcher.run_once(now=timezone.now() + timedelta(minutes=1)), (3, 0))
+        (body, signature), = WebhookReceiver.received # One POST for the whole batch
+        self.assertEqual(sorted(n['order_id'] for n in body['notifications']), sorted(o.id for o in self.orders))
+        self.assertEqual(len(signature), 64)
+
+    @override_settings(NOTIFICATION_MAX_ATTEMPTS=2, NOTIFICATION_CHANNELS={'webhook': {
+        'BACKEND': 'api.notifications.WebhookChannel', 'URLS': ['http://127.0.0.1:9/unreachable'],
+    }})
+    def test_gives_up_after_max_attempts(self):
+        self.mark(self.orders[0], 'READY')
+        dispatcher = Dispatcher()
+        self.addCleanup(dispatcher.close)
+        later = timezone.now() + timedelta(days=1)
+        self.assertEqual(dispatcher.run_once(), (0, 1))
+        self.assertEqual(dispatcher.run_once(now=later), (0, 1))
+        self.assertEqual(Notification.objects.get().status, 'FAILED')
+        self.assertEqual(dispatcher.run_once(now=later + timedelta(days=1)), (0, 0))
+
+    @override_settings(NOTIFICATION_CHANNELS={'slow': {'BACKEND': 'api.tests.SlowChannel'}})
+    def test_limits_concurrent_batches_per_channel(self):
+        for order in self.orders:
+            self.mark(order, 'READY')
+        channel = SlowChannel('slow', BATCH_SIZE=1, CONCURRENCY=2)
+        dispatcher = Dispatcher({'slow': channel})
+        self.addCleanup(dispatcher.close)
+        self.assertEqual(dispatcher.run_once(), (3, 0))
+        self.assertEqual(len(channel.batches), 3)
+        self.assertEqual(channel.peak, 2)
+
+    def test_push_subscriptions(self):
+        client = APIClient()
+        client.force_authenticate(self.customer)
+        subscription = {'endpoint': 'https://push.example.com/abc', 'keys': {'p256dh': 'key', 'auth': 'secret'}}
+        self.assertEqual(client.post('/api/push-subscriptions/', subscription, format='json').status_code, 201)
+        self.assertEqual(client.post('/api/push-subscriptions/', subscription, format='json').status_code, 201)
+        self.assertEqual(PushSubscription.objects.get().user, self.customer)
+        self.assertEqual(client.get('/api/push-subscriptions/').data[0]['keys'], subscription['keys'])
+
+
+class OrderSummaryTests(AllShardsMixin, TestCase):
+    def setUp(self):
+        self.canteen = Canteen.objects.create(name="Main")
+        self.tea = MenuItem.objects.create(canteen=self.canteen, name="Tea", price=Decimal('10.00'))
+        self.bun = MenuItem.objects.create(canteen=self.canteen, name="Bun", price=Decimal('15.00'))
+        self.customer = User.objects.create_user("regular", password="pw")
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def test_summary_columns_are_filled_on_placement(self):
+        order, = place_orders(self.customer, self.canteen, [{'lines': {self.tea: 2, self.bun: 1}}])
+
+        order.refresh_from_db()
+        self.assertEqual(order.item_count, 3)
+        self.assertEqual(order.items_preview, "2x Tea, 1x Bun")
+
+    def test_history_is_a_paginated_summary_without_joins(self):
+        for _ in range(3):
+            place_orders(self.customer, self.canteen, [{'lines': {self.tea: 1}}])
+
+        with self.assertNumQueries(2): # page count + page rows
+            response = self.client.get('/api/orders/', {'page_size': 2})
+
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertNotIn('items', response.data['results'][0])
+        self.assertEqual(response.data['results'][0]['items_preview'], "1x Tea")
+        detail = self.client.get(f"/api/orders/{response.data['results'][0]['id']}/")
+        self.assertEqual(len(detail.data['items']), 1)
+
+
+class AdminOrderSearchTests(AllShardsMixin, TestCase):
+    def setUp(self):
+        self.main = Canteen.objects.create(name="Main")
+        self.annex = Canteen.objects.create(name="Annex")
+        tea = MenuItem.objects.create(canteen=self.main, name="Tea", price=Decimal('10.00'))
+        juice = MenuItem.objects.create(canteen=self.annex, name="Juice", price=Decimal('30.00'))
+        alice = User.objects.create_user("alice.k", password="pw")
+        bob = User.objects.create_user("bob", password="pw")
+        place_orders(alice, self.main, [{'lines': {tea: 1}, 'table_number': 'T1'}, {'lines': {tea: 2}}])
+        place_orders(bob, self.annex, [{'lines': {juice: 1}, 'table_number': 'T1'}])
+        for orders in fan_out(Order.objects.filter(customer=bob)):
+            orders.update(status='READY')
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser("boss", "boss@example.com", "pw"))
+
+    def _ids(self, **params):
+        return {order['id'] for order in self.client.get('/api/admin/orders/', params).data['results']}
+
+    def test_filters(self):
+        bob_orders = ids_across(Order.objects.filter(customer__username='bob'))
+        main_orders = ids_across(Order.objects.filter(canteen=self.main))
+
+        self.assertEqual(self._ids(status='READY'), bob_orders)
+        self.assertEqual(self._ids(canteen=self.main.id), main_orders)
+        self.assertEqual(self._ids(customer='ICE.'), main_orders)
+        self.assertEqual(self._ids(table_number='T1', canteen=self.annex.id), bob_orders)
+        today = timezone.localdate()
+        self.assertEqual(len(self._ids(date_from=today.isoformat(), date_to=today.isoformat())), 3)
+        self.assertEqual(self._ids(date_to=(today - timedelta(days=1)).isoformat()), set())
+        self.assertEqual(self._ids(date_from=(today + timedelta(days=1)).isoformat()), set())
+        self.assertEqual(self._ids(search='bo'), bob_orders)
+
+    def test_large_totals_are_estimated_unless_exact_is_requested(self):
+        with patch('api.pagination.planner_estimate', return_value=50000):
+            estimated = self.client.get('/api/admin/orders/', {'page_size': 2, 'page': 2}).data
+            exact = self.client.get('/api/admin/orders/', {'page_size': 2, 'exact_count': 1}).data
+
+        # One estimate per shard, summed
+        self.assertEqual((estimated['count'], estimated['count_is_estimate']), (50000 * len(shard_aliases()), True))
+        self.assertEqual(len(estimated['results']), 1)
+        self.assertEqual((exact['count'], exact['count_is_estimate']), (3, False))
+
+
+class ReceiptTests(AllShardsMixin, TestCase):
+    def setUp(self):
+        self.media = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(MEDIA_ROOT=self.media, RECEIPT_RENDER_WORKERS=0))
+        canteen = Canteen.objects.create(name="Main")
+        tea = MenuItem.objects.create(canteen=canteen, name="Masala Tea", price=Decimal('12.50'))
+        self.customer = User.objects.create_user("reader", password="pw")
+        self.order, = place_orders(self.customer, canteen, [{'lines': {tea: 2}}])
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def test_receipt_is_rendered_once_and_served_from_storage(self):
+        with patch('api.receipts.render_receipt', wraps=render_receipt) as render:
+            first = self.client.get(f'/api/orders/{self.order.id}/receipt/')
+            second = self.client.get(f'/api/orders/{self.order.id}/receipt/')
+
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(first.status_code, 200)
+        body = b''.join(second.streaming_content)
+        self.assertIn(b'Masala Tea', body)
+        self.assertIn(b'25.00', body)
+        not_modified = self.client.get(f'/api/orders/{self.order.id}/receipt/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_batch_command_renders_the_day_on_a_process_pool(self):
+        call_command('render_receipts', '--workers', '2', stdout=StringIO())
+        path = receipt_path(receipt_snapshot(self.order), 'html')
+        self.assertTrue(default_storage.exists(path))
+
+        out = StringIO()
+        call_command('render_receipts', '--workers', '0', stdout=out)
+        self.assertIn("Rendered 0 receipts", out.getvalue())
+
+
+@override_settings(PAYMENT_GATEWAY='api.payments.FakeGateway')
+class PricingTests(AllShardsMixin, TestCase):
+    def setUp(self):
+        FakeGateway.reset()
+        self.addCleanup(FakeGateway.reset)
+        invalidate_prices()
+        self.addCleanup(invalidate_prices)
+        invalidate_index()
+        self.addCleanup(invalidate_index)
+        get_index()
+        self.canteen = Canteen.objects.create(name="Main")
+        self.tea = MenuItem.objects.create(canteen=self.canteen, name="Tea", price=Decimal('10.50'))
+        self.samosa = MenuItem.objects.create(canteen=self.canteen, name="Samosa", price=Decimal('15.00'))
+        self.other = MenuItem.objects.create(canteen=Canteen.objects.create(name="Annex"), name="Juice", price=Decimal('30.00'))
+        self.client = APIClient()
+        self.cart = {'canteen': self.canteen.id, 'items': [
+            {'menu_item_id': self.tea.id, 'quantity': 2}, {'menu_item_id': self.samosa.id, 'quantity': 1},
+            {'menu_item_id': self.tea.id, 'quantity': 1},
+        ]}
+
+    def test_quote_is_served_from_memory(self):
+        first = self.client.post('/api/cart/quote/', self.cart, format='json')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual((first.data['total_price'], first.data['amount']), (Decimal('46.50'), 4650))
+        self.assertEqual([(line['name'], line['quantity']) for line in first.data['items']], [("Tea", 3), ("Samosa", 1)])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.post('/api/cart/quote/', self.cart, format='json').data, first.data)
+
+        self.tea.price = Decimal('12.00')
+        self.tea.save()
+        self.assertEqual(self.client.post('/api/cart/quote/', self.cart, format='json').data['amount'], 5100)
+
+        foreign = {'canteen': self.canteen.id, 'items': [{'menu_item_id': self.other.id, 'quantity': 1}]}
+        self.assertEqual(self.client.post('/api/cart/quote/', foreign, format='json').status_code, 400)
+        self.assertEqual(self.client.post('/api/cart/quote/', {'canteen': self.canteen.id, 'items': []}, format='json').status_code, 400)
+
+    def test_checkout_charges_the_server_price(self):
+        customer = User.objects.create_user("payer", password="pw")
+        self.client.force_authenticate(customer)
+        quoted = self.client.post('/api/cart/quote/', self.cart, format='json').data
+        MenuItem.objects.filter(pk=self.tea.pk).update(price=Decimal('11.00')) # Edited elsewhere, no signal here
+
+        stale = self.client.post('/api/payment/create-razorpay-order/', {**self.cart, 'amount': quoted['amount']}, format='json')
+        self.assertEqual(stale.status_code, 409)
+        self.assertEqual(stale.data['quote']['amount'], 4800) # The checkout refreshed the cached table
+        self.assertEqual(quote(self.canteen.id, {self.tea.id: 3, self.samosa.id: 1})['amount'], 4800)
+
+        created = self.client.post('/api/payment/create-razorpay-order/', {**self.cart, 'amount': 4800}, format='json')
+        self.assertEqual((created.status_code, created.data['amount']), (201, 4800))
+        self.assertEqual(FakeGateway._orders[created.data['order_id']]['amount'], 4800)
+        self.assertEqual(self.client.post('/api/payment/create-razorpay-order/', {'amount': 4800}, format='json').status_code, 400)
+
+    def test_orders_are_priced_like_quotes(self):
+        self.client.force_authenticate(User.objects.create_user("diner", password="pw"))
+        response = self.client.post('/api/orders/', self.cart, format='json')
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get()
+        self.assertEqual(order.total_price, quote(self.canteen.id, {self.tea.id: 3, self.samosa.id: 1})['total_price'])
+
+
+@override_settings(PAYMENT_GATEWAY='api.payments.FakeGateway')
+class ReconciliationTests(AllShardsMixin, TestCase):
+    def setUp(self):
+        FakeGateway.reset()
+        self.addCleanup(FakeGateway.reset)
+        self.gateway = FakeGateway()
+        self.canteen = Canteen.objects.create(name="Main")
+        self.tea = MenuItem.objects.create(canteen=self.canteen, name="Tea", price=Decimal('10.00'))
+        self.customer = User.objects.create_user("payer", password="pw")
+
+    def paid_order(self, amount, capture_amount=None, captured_at=None):
+        gateway_order = self.gateway.create_order(amount, 'INR', 'rcpt', {})
+        payment, signature = self.gateway.capture(gateway_order['id'], amount=capture_amount, created_at=captured_at)
+        order, = place_orders(self.customer, self.canteen, [{
+            'lines': {self.tea: amount // 1000},
+            'fields': {'razorpay_order_id': gateway_order['id'], 'razorpay_payment_id': payment['id']},
+        }])
+        return order, payment
+
+    def reconcile(self):
+        out, err = StringIO(), StringIO()
+        call_command('reconcile_payments', '--from', str(timezone.localdate()), '--page-size', '2', stdout=out, stderr=err)
+        rows = [line.split(',') for line in out.getvalue().splitlines()[1:]]
+        return {row[0]: row for row in rows}, err.getvalue()
+
+    def test_payment_views_use_the_configured_gateway(self):
+        client = APIClient()
+        client.force_authenticate(self.customer)
+        details = {'canteen': self.canteen.id, 'items': [{'menu_item_id': self.tea.id, 'quantity': 2}]}
+        created = client.post('/api/payment/create-razorpay-order/', {'amount': 2000, **details}, format='json')
+        self.assertEqual(created.status_code, 201)
+        payment, signature = self.gateway.capture(created.data['order_id'])
+
+        forged = client.post('/api/payment/verify-payment/', {
+            'razorpay_order_id': created.data['order_id'], 'razorpay_payment_id': payment['id'],
+            'razorpay_signature': 'forged', 'local_order_details': details,
+        }, format='json')
+        self.assertEqual(forged.status_code, 400)
+        verified = client.post('/api/payment/verify-payment/', {
+            'razorpay_order_id': created.data['order_id'], 'razorpay_payment_id': payment['id'],
+            'razorpay_signature': signature, 'local_order_details': {**details, 'total_price': '0.01'},
+        }, format='json')
+        self.assertEqual(verified.status_code, 201)
+        self.assertEqual(Order.objects.get(pk=verified.data['orderId']).total_price, Decimal('20.00')) # Not the client's
+
+    def test_verification_only_accepts_the_paid_cart_and_amount(self):
+        client = APIClient()
+        client.force_authenticate(self.customer)
+        details = {'canteen': self.canteen.id, 'items': [{'menu_item_id': self.tea.id, 'quantity': 2}]}
+
+        def checkout(capture_amount=None):
+            created = client.post('/api/payment/create-razorpay-order/', {'amount': 2000, **details}, format='json')
+            payment, signature = self.gateway.capture(created.data['order_id'], amount=capture_amount)
+            return {'razorpay_order_id': created.data['order_id'], 'razorpay_payment_id': payment['id'],
+                    'razorpay_signature': signature}
+
+        def verify(paid, items=details['items']):
+            return client.post('/api/payment/verify-payment/', {
+                **paid, 'local_order_details': {**details, 'items': items},
+            }, format='json')
+
+        paid = checkout()
+        self.assertEqual(verify(paid, [{'menu_item_id': self.tea.id, 'quantity': 5}]).status_code, 409)
+        self.assertEqual(verify(checkout(capture_amount=100)).status_code, 409) # Underpaid
+        self.assertFalse(Order.objects.exists())
+
+        self.assertEqual(verify(paid).status_code, 201)
+        self.assertEqual(verify(paid).status_code, 400) # The checkout was used up
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_report_lists_only_discrepancies(self):
+        self.paid_order(2000)
+        short, short_payment = self.paid_order(3000, capture_amount=2000)
+        stray = self.gateway.create_order(1500, 'INR', 'rcpt', {})
+        stray_payment, _ = self.gateway.capture(stray['id'])
+        self.gateway.capture(stray['id'], status='failed')
+        unpaid, = place_orders(self.customer, self.canteen, [{
+            'lines': {self.tea: 1}, 'fields': {'razorpay_order_id': 'order_never_paid'},
+        }])
+
+        with self.assertNumQueries(4): # two pages of payments, failed checkouts for the stray one, the unpaid scan
+            report, summary = self.reconcile()
+
+        self.assertEqual(set(report), {'amount_mismatch', 'missing_order', 'missing_payment'})
+        self.assertEqual(report['amount_mismatch'][1], short_payment['id'])
+        self.assertEqual(report['amount_mismatch'][5:], ['2000', '3000'])
+        self.assertEqual(report['missing_order'][1], stray_payment['id'])
+        self.assertEqual(report['missing_payment'][3], str(unpaid.id))
+        self.assertIn("1 amount_mismatch", summary)
+
+    def test_captured_payment_whose_order_failed_is_kept_for_the_refund(self):
+        client = APIClient()
+        client.force_authenticate(self.customer)
+        details = {'canteen': self.canteen.id, 'items': [{'menu_item_id': self.tea.id, 'quantity': 2}]}
+        created = client.post('/api/payment/create-razorpay-order/', {'amount': 2000, **details}, format='json')
+        payment, signature = self.gateway.capture(created.data['order_id'])
+        paid = {'razorpay_order_id': created.data['order_id'], 'razorpay_payment_id': payment['id'],
+                'razorpay_signature': signature, 'local_order_details': details}
+
+        with patch('api.views.commit_paid_order', side_effect=OutOfStock(self.tea)):
+            self.assertEqual(client.post('/api/payment/verify-payment/', paid, format='json').status_code, 409)
+        self.assertEqual(client.post('/api/payment/verify-payment/', paid, format='json').status_code, 409)
+        self.assertFalse(Order.objects.exists())
+
+        with use_canteen_shard(self.canteen):
+            checkout = CheckoutCart.objects.get(razorpay_order_id=created.data['order_id'])
+            self.assertEqual((checkout.status, checkout.razorpay_payment_id), ('FAILED', payment['id']))
+            CheckoutCart.objects.filter(pk=checkout.pk).update(created_at=timezone.now() - timedelta(days=2))
+        call_command('release_stock_reservations', stdout=StringIO())
+        with use_canteen_shard(self.canteen):
+            self.assertTrue(CheckoutCart.objects.filter(pk=checkout.pk).exists()) # Not purged with stale carts
+
+        report, _ = self.reconcile()
+        self.assertEqual(set(report), {'order_failed'})
+        self.assertEqual(report['order_failed'][1], payment['id'])
+
+    def test_payments_captured_before_the_range_are_found(self):
+        midnight = timezone.make_aware(timezone.datetime.combine(timezone.localdate(), time.min))
+        just_before, _ = self.paid_order(2000, captured_at=midnight - timedelta(minutes=1))
+        long_before, _ = self.paid_order(2000, captured_at=midnight - timedelta(hours=6)) # Verified hours later
+        for minutes, order in ((1, just_before), (2, long_before)):
+            for orders in fan_out(Order.objects.filter(pk=order.pk)):
+                orders.update(created_at=midnight + timedelta(minutes=minutes))
+
+        report, summary = self.reconcile()
+
+        self.assertEqual(report, {})
+        self.assertIn("no discrepancies", summary)
+
+
+class RegistrationTests(AllShardsMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def signup(self, username, email):
+        return self.client.post('/api/register/', {
+            'username': username, 'email': email, 'password': 'Kettle-Samosa-42', 'password2': 'Kettle-Samosa-42',
+        }, format='json')
+
+    def test_signup_inserts_the_hashed_user_once(self):
+        with self.assertNumQueries(5): # username and email checks, savepoint, INSERT, release
+            response = self.signup("asha", "Asha@Example.COM")
+        self.assertEqual(response.status_code, 201)
+        user = User.objects.get(username="asha")
+        self.assertEqual(user.email, "Asha@example.com")
+        self.assertTrue(user.password.startswith(f"pbkdf2_sha256${settings.PASSWORD_HASH_ITERATIONS}$"))
+        self.assertTrue(user.check_password('Kettle-Samosa-42'))
+
+    def test_email_is_unique_regardless_of_case(self):
+        self.signup("asha", "asha@example.com")
+        response = self.signup("asha2", "ASHA@example.com")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('email', response.data)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            User.objects.create(username="asha3", email="Asha@Example.com")
+        User.objects.create(username="no-email-1")
+        User.objects.create(username="no-email-2") # Blank emails are not covered by the index
+
+    @override_settings(PASSWORD_HASH_ITERATIONS=600_000)
+    def test_logins_never_weaken_stored_hashes(self):
+        hasher = TunedPBKDF2PasswordHasher()
+        self.assertEqual(hasher.iterations, PBKDF2PasswordHasher.iterations) # Raised to Django's default
+
+        def encoded(iterations):
+            return f"pbkdf2_sha256${iterations}${hasher.salt()}$unused"
+
+        self.assertFalse(hasher.must_update(encoded(PBKDF2PasswordHasher.iterations)))
+        self.assertFalse(hasher.must_update(encoded(PBKDF2PasswordHasher.iterations * 2)))
+        self.assertTrue(hasher.must_update(encoded(600_000)))
+
+    def test_full_hashing_pool_sheds_signups(self):
+        with patch('api.serializers.hash_password', side_effect=HashingBusy("busy")):
+            response = self.signup("asha", "asha@example.com")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], str(settings.ADMISSION_RETRY_AFTER_SECONDS))
+        self.assertFalse(User.objects.exists())
+
+
+class WarmupTests(AllShardsMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        invalidate_prices()
+        self.addCleanup(invalidate_prices)
+        self.addCleanup(invalidate_index)
+        self.canteen = Canteen.objects.create(name="Main")
+        self.tea = MenuItem.objects.create(canteen=self.canteen, category=Category.objects.create(name="Drinks"),
+                                           name="Tea", price=Decimal('10.00'))
+
+    def test_primes_menu_caches_once_per_process(self):
+        with patch('api.warmup._warmed', False), patch('api.warmup.connections') as connections:
+            timings = warm_up()
+            self.assertEqual(list(timings), ['imports', 'url resolver', 'serializer fields', 'payment gateway', 'menu caches'])
+            connections.close_all.assert_called_once()
+            self.assertEqual(warm_up(), {})
+        cart = {'canteen': self.canteen.id, 'items': [{'menu_item_id': self.tea.id, 'quantity': 2}]}
+        with self.assertNumQueries(0): # The warm-up loaded the price table...
+            self.assertEqual(APIClient().post('/api/cart/quote/', cart, format='json').data['amount'], 2000)
+        with self.assertNumQueries(1): # ...and the category counts; only the menu version is checked
+            self.assertEqual(APIClient().get(f'/api/categories/?canteen={self.canteen.id}').json()[0]['item_count'], 1)
+
+    async def test_lifespan_warms_up_before_startup_completes(self):
+        messages, sent = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}], []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        with patch('api.warmup.warm_up') as warm:
+            await WarmupLifespan(None)({'type': 'lifespan'}, receive, send)
+        warm.assert_called_once()
+        self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+
+
+class LoadTestHarnessTests(AllShardsMixin, TransactionTestCase):
+    def test_full_flow_through_wsgi_and_asgi(self):
+        for app in ('wsgi', 'asgi'):
+            out = StringIO()
+            call_command(
+                'loadtest', '--app', app, '--iterations', '2', '--concurrency', '1', '--polls', '1',
+                '--canteens', '1', '--items', '3', '--customers', '2', '--seed', '7', stdout=out,
+            )
+            self.assertIn("2 flows completed, 0 failed", out.getvalue())
+            self.assertIn("POST /api/payment/verify-payment/", out.getvalue())
+
+        self.assertEqual(count_across(Order.objects.filter(status='COMPLETED')), 4)
+        self.assertFalse(User.objects.filter(username='loadtest-admin').exists()) # No staff token left behind
+        call_command('loadtest', '--iterations', '0', '--cleanup', stdout=StringIO())
+        self.assertEqual(count_across(Order.objects.all()), 0)
+
+    def test_customers_are_throttled_by_their_own_address(self):
+        limits = {**settings.RATE_LIMITS, 'payments': {'user': {'burst': 5, 'per_minute': 10},
+                                                       'ip': {'burst': 2, 'per_minute': 1}}}
+        out = StringIO()
+        with override_settings(RATE_LIMITS=limits):
+            call_command(
+                'loadtest', '--iterations', '3', '--concurrency', '1', '--polls', '0', '--canteens', '1',
+                '--items', '3', '--customers', '50', '--seed', '7', '--cleanup', stdout=out,
+            )
+        self.assertIn("3 flows completed, 0 failed", out.getvalue())
+
+    def test_signup_flow(self):
+        out = StringIO()
+        call_command('loadtest', '--flow', 'signup', '--iterations', '3', '--concurrency', '1', '--cleanup', stdout=out)
+        self.assertIn("3 flows completed, 0 failed", out.getvalue())
+        self.assertFalse(User.objects.filter(username__startswith='loadtest-').exists())
+
+
+class SeedScaleTests(AllShardsMixin, TestCase):
+    def test_generates_consistent_history_around_meal_times(self):
+        call_command(
+            'seed_scale', '--canteens', '2', '--categories', '3', '--items-per-canteen', '10',
+            '--users', '20', '--orders', '500', '--days', '14', '--batch-size', '200', '--seed', '3',
+            stdout=StringIO(),
+        )
+        self.assertEqual(count_across(Order.objects.all()), 500)
+        self.assertEqual(User.objects.filter(username__startswith='seed-user-').count(), 20)
+
+        order = Order.objects.prefetch_related('items').order_by('pk').last()
+        items = list(order.items.all())
+        self.assertEqual(order.item_count, sum(item.quantity for item in items))
+        self.assertEqual(order.total_price, sum(item.price * item.quantity for item in items))
+        hours = [timezone.localtime(created).hour
+                 for orders in fan_out(Order.objects.all()) for created in orders.values_list('created_at', flat=True)]
+        self.assertTrue(all(7 <= hour <= 22 for hour in hours))
+        self.assertGreater(hours.count(13), hours.count(10))
+        days = {day for orders in fan_out(Order.objects.all()) for day in orders.dates('created_at', 'day')}
+        self.assertGreater(len(days), 7)
+
+
+class AsyncReadViewTests(AllShardsMixin, TestCase):
+    def setUp(self):
+        self.canteen = Canteen.objects.create(name="Main")
+        self.tea = MenuItem.objects.create(canteen=self.canteen, name="Tea", price=Decimal('10.00'))
+        self.customer = User.objects.create_user("poller", password="pw")
+        self.token = Token.objects.create(user=self.customer)
+        self.order, = place_orders(self.customer, self.canteen, [{'lines': {self.tea: 2}}])
+
+    async def test_catalog_views_match_the_sync_endpoints(self):
+        sync = await sync_to_async(APIClient().get)('/api/menu-items/')
+        request = AsyncRequestFactory().get('/api/menu-items/')
+        response = await MenuItemListView.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), sync.json())
+        self.assertEqual(response['ETag'], sync['ETag'])
+
+        cached = AsyncRequestFactory().get('/api/menu-items/', headers={'If-None-Match': sync['ETag']})
+        self.assertEqual((await MenuItemListView.as_view()(cached)).status_code, 304)
+        missing = await CanteenDetailView.as_view()(AsyncRequestFactory().get('/api/canteens/0/'), pk=0)
+        self.assertEqual(missing.status_code, 404)
+
+    async def test_order_status_is_private_to_its_customer(self):
+        client = AsyncClient()
+        url = f'/api/orders/{self.order.id}/status/'
+        self.assertEqual((await client.get(url)).status_code, 401)
+
+        other = await sync_to_async(User.objects.create_user)("stranger", password="pw")
+        stranger = await Token.objects.acreate(user=other)
+        response = await client.get(url, headers={'Authorization': f'Token {stranger.key}'})
+        self.assertEqual(response.status_code, 404)
+
+        response = await client.get(url, headers={'Authorization': f'Token {self.token.key}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'PENDING')
+        self.assertIsNotNone(response.json()['estimated_ready_at'])
+
+
+class MenuImportTests(AllShardsMixin, TestCase):
+    def setUp(self):
+        self.canteen = Canteen.objects.create(name="Main")
+        Category.objects.create(name="Drinks")
+        self.tea = MenuItem.objects.create(canteen=self.canteen, name="Tea", price=Decimal('10.00'))
+        MenuItem.objects.create(canteen=self.canteen, name="Old Special", price=Decimal('50.00'))
+        admin = User.objects.create_user("menu-admin", password="pw", is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(admin)
+
+    def rows(self, count):
+        return [
+            {'canteen': 'main', 'category': 'Drinks', 'name': 'tea', 'price': '12.00'},
+            *({'canteen': self.canteen.id, 'name': f"Dish {n}", 'price': '30', 'daily_stock': 20} for n in range(count)),
+        ]
+
+    def test_import_applies_only_the_diff(self):
+        dry = self.client.post('/api/admin/menu-items/import/?dry_run=true', self.rows(3), format='json')
+        self.assertEqual(dry.data, {'created': 3, 'updated': 1, 'unchanged': 0, 'disabled': 0})
+        self.assertEqual(MenuItem.objects.count(), 2)
+
+        response = self.client.post('/api/admin/menu-items/import/?prune=true', self.rows(300), format='json')
+        self.assertEqual(response.data, {'created': 300, 'updated': 1, 'unchanged': 0, 'disabled': 1})
+        self.tea.refresh_from_db()
+        self.assertEqual((self.tea.price, self.tea.category.name), (Decimal('12.00'), 'Drinks'))
+        self.assertFalse(MenuItem.objects.get(name="Old Special").is_available)
+
+        with self.assertNumQueries(5): # canteen and category maps, stored items, an empty transaction
+            again = self.client.post('/api/admin/menu-items/import/', self.rows(300), format='json')
+        self.assertEqual(again.data['unchanged'], 301)
+
+    def test_invalid_rows_are_all_reported_and_nothing_is_written(self):
+        rows = self.rows(2) + [{'canteen': 'Nowhere', 'name': '', 'price': 'free', 'prep_units': 0}]
+        response = self.client.post('/api/admin/menu-items/import/', rows, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data['rows'][0]['errors']), {'canteen', 'name', 'price', 'prep_units'})
+        self.assertEqual(MenuItem.objects.count(), 2)
+
+    def test_ids_and_names_do_not_collide(self):
+        numbered = Canteen.objects.create(name=str(self.canteen.id)) # Named like the id of "Main"
+        rows = [
+            {'canteen': str(self.canteen.id), 'name': "By id", 'price': '10'},
+            {'canteen': self.canteen.id, 'name': "By JSON id", 'price': '10'},
+            {'canteen': 'main', 'name': "By name", 'price': '10'},
+            {'canteen': numbered.id, 'name': "In the other canteen", 'price': '10'},
+        ]
+        response = self.client.post('/api/admin/menu-items/import/', rows, format='json')
+        self.assertEqual(response.data['created'], 4)
+        canteens = {
+            name: canteen_id for items in fan_out(MenuItem.objects.all())
+            for name, canteen_id in items.values_list('name', 'canteen_id')
+        }
+        self.assertEqual(
+            [canteens[row['name']] for row in rows], [self.canteen.id, self.canteen.id, self.canteen.id, numbered.id],
+        )
+
+    def test_export_round_trips_through_csv_upload(self):
+        exported = self.client.get(f'/api/admin/menu-items/export/?output=csv&canteen={self.canteen.id}')
+        content = exported.content.decode().replace('Tea,,10.00', 'Tea,,11.00')
+        upload = SimpleUploadedFile('menu.csv', content.encode(), content_type='text/csv')
+        response = self.client.post('/api/admin/menu-items/import/', {'file': upload}, format='multipart')
+        self.assertEqual(response.data, {'created': 0, 'updated': 1, 'unchanged': 1, 'disabled': 0})
+
@@ -0,0 +1,115 @@
+"""
+Rate limiting and admission control for the write-heavy endpoints.
+
+``UserTokenBucketThrottle`` and ``IPTokenBucketThrottle`` keep one token bucket
+per (scope, identity) in the local cache; budgets live in ``settings.RATE_LIMITS``
+under the view's ``throttle_scope``. ``AdmissionControlMixin`` caps how many
+requests a worker process runs against the database at once and sheds the
+rest with 429 + Retry-After instead of queueing on the connection pool.
+"""
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+from rest_framework.throttling import BaseThrottle
+
+# The locmem cache is per process, so a process-wide lock makes the
+# read-modify-write of a bucket atomic for all threads sharing it.
+_bucket_lock = threading.Lock()
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Token bucket keyed by ``kind``; subclasses decide who a request belongs to."""
+    kind = None
+
+    def __init__(self):
+        self.retry_after = None
+
+    def get_identity(self, request):
+        raise NotImplementedError
+
+    def get_budget(self, view):
+        scope = getattr(view, 'throttle_scope', None)
+        return scope, settings.RATE_LIMITS.get(scope, {}).get(self.kind)
+
+    def allow_request(self, request, view):
+        scope, budget = self.get_budget(view)
+        identity = self.get_identity(request)
+        if not budget or identity is None:
+            return True
+
+        capacity = budget['burst']
+        refill_per_second = budget['per_minute'] / 60.0
+        key = f"ratelimit:{scope}:{self.kind}:{identity}"
+        cache = caches[settings.RATE_LIMIT_CACHE]
+        now = time.monotonic()
+        with _bucket_lock:
+            tokens, updated = cache.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * refill_per_second)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            else:
+                self.retry_after = (1 - tokens) / refill_per_second
+            # An idle bucket refills completely, so it can be dropped after that
+            cache.set(key, (tokens, now), timeout=math.ceil(capacity / refill_per_second) + 1)
+        return allowed
+
+    def wait(self):
+        return self.retry_after
+
+
+class UserTokenBucketThrottle(TokenBucketThrottle):
+    kind = 'user'
+
+    def get_identity(self, request):
+        return request.user.pk if request.user and request.user.is_authenticated else None
+
+
+class IPTokenBucketThrottle(TokenBucketThrottle):
+    kind = 'ip'
+
+    def get_identity(self, request):
+        return self.get_ident(request)
+
+
+class AdmissionController:
+    """Process-wide cap on concurrent database-bound requests."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._slots = threading.BoundedSemaphore(limit)
+
+    def acquire(self, timeout):
+        return self._slots.acquire(timeout=timeout)
+
+    def release(self):
+        self._slots.release()
+
+
+admission = AdmissionController(settings.ADMISSION_MAX_CONCURRENT)
+
+
+class AdmissionControlMixin:
+    """
+    Sheds requests with 429 when this process already has ``ADMISSION_MAX_CONCURRENT``
+    of them in flight. Only methods in ``admission_methods`` are counted.
+    """
+    admission_methods = ('POST',)
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in self.admission_methods:
+            return super().dispatch(request, *args, **kwargs)
+        if not admission.acquire(timeout=settings.ADMISSION_QUEUE_TIMEOUT_SECONDS):
+            response = JsonResponse(
+                {"detail": "The server is busy, please retry shortly."}, status=429
+            )
+            response['Retry-After'] = str(settings.ADMISSION_RETRY_AFTER_SECONDS)
+            return response
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            admission.release()
@@ -0,0 +1,36 @@
+"""
+Daily pickup tokens.
+
+Orders get a short number per canteen and day ("Token 42") to be called out
+at the counter. ``next_pickup_tokens`` reserves a run of numbers with one
+``UPDATE ... SET last_token = last_token + n`` on the canteen's
+``PickupTokenCounter`` row for the day, so there is no ``MAX()+1`` race and
+concurrent orders only wait on that single row, never on a table lock. The
+first order of a day creates the row; a concurrent first order that loses
+that insert falls back to the increment.
+
+The counter row stays locked until the order's transaction commits, so
+``place_orders`` takes tokens as its last step before the INSERTs. A rolled
+back order leaves a gap in the day's numbers, which is harmless.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import PickupTokenCounter
+from .sharding import use_canteen_shard
+
+
+def next_pickup_tokens(canteen, date, count=1):
+    """``count`` consecutive unused tokens of ``canteen`` on ``date``, on the canteen's shard."""
+    with use_canteen_shard(canteen) as alias:
+        counters = PickupTokenCounter.objects.filter(canteen=canteen, date=date)
+        if not counters.update(last_token=F('last_token') + count):
+            try:
+                with transaction.atomic(using=alias):
+                    PickupTokenCounter.objects.create(canteen=canteen, date=date, last_token=count)
+                return list(range(1, count + 1))
+            except IntegrityError:
+                # Another order created the day's counter first
+                counters.update(last_token=F('last_token') + count)
+        last = counters.values_list('last_token', flat=True).get()
+    return list(range(last - count + 1, last + 1))
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
@@ -9,11 +10,17 @@ from .views import (
     AdminOrderViewSet,
     CurrentUserView,
     DashboardStatsView,
+    DemandForecastView,
     UserRegistrationView,
     CustomerCategoryListViewSet,
     CustomerMenuItemListViewSet,
+    AdminPickupSlotViewSet,
+    AdminAvailabilityWindowViewSet,
+    PushSubscriptionViewSet,
+    CartQuoteView,
     CreateRazorpayOrderView, VerifyPaymentView #, RazorpayWebhookView
 )
+from . import async_views
 
 # Router for customer-facing, generally accessible endpoints
 router = DefaultRouter()
@@ -21,6 +28,7 @@ router.register(r'canteens', CustomerCanteenViewSet, basename='customer-canteen'
 router.register(r'categories', CustomerCategoryListViewSet, basename='customer-category')
 router.register(r'menu-items', CustomerMenuItemListViewSet, basename='customer-menuitem')
 router.register(r'orders', OrderViewSet, basename='order')
+router.register(r'push-subscriptions', PushSubscriptionViewSet, basename='push-subscription')
 
 # Router for admin-only endpoints
 admin_router = DefaultRouter()
@@ -28,6 +36,8 @@ admin_router.register(r'canteens', AdminCanteenViewSet, basename='admin-canteen'
 admin_router.register(r'categories', AdminCategoryViewSet, basename='admin-category')
 admin_router.register(r'menu-items', AdminMenuItemViewSet, basename='admin-menuitem')
 admin_router.register(r'orders', AdminOrderViewSet, basename='admin-order')
+admin_router.register(r'pickup-slots', AdminPickupSlotViewSet, basename='admin-pickupslot')
+admin_router.register(r'availability-windows', AdminAvailabilityWindowViewSet, basename='admin-availabilitywindow')
 
 # The API URLs are now determined automatically by the router.
 # Additionally, we include login URLs for the browsable API.
@@ -40,6 +50,7 @@ urlpatterns = [
     
     # Add the dashboard stats route explicitly
     path('admin/dashboard-stats/', DashboardStatsView.as_view(), name='dashboard-stats'),
+    path('admin/demand-forecast/', DemandForecastView.as_view(), name='demand-forecast'),
     
     # Add custom registration route 
     path('register/', UserRegistrationView.as_view(), name='user-register'),
@@ -51,7 +62,25 @@ urlpatterns = [
 ]
 
 urlpatterns += [
+    path('cart/quote/', CartQuoteView.as_view(), name='cart-quote'),
     path('payment/create-razorpay-order/', CreateRazorpayOrderView.as_view(), name='create_razorpay_order'),
     path('payment/verify-payment/', VerifyPaymentView.as_view(), name='verify_payment'),
     # path('payment/webhook/', RazorpayWebhookView.as_view(), name='razorpay_webhook'), # Optional webhook URL
-]
\ No newline at end of file
+]
+
+# Polled while an order is being prepared; async so waiting clients hold no worker thread
+urlpatterns += [
+    path('orders/<int:pk>/status/', async_views.OrderStatusView.as_view(), name='order-status'),
+]
+
+if settings.ASYNC_READ_VIEWS:
+    # Ahead of the router so these GETs resolve to the async views
+    urlpatterns = [
+        path('canteens/', async_views.CanteenListView.as_view()),
+        path('canteens/<int:pk>/', async_views.CanteenDetailView.as_view()),
+        path('categories/', async_views.CategoryListView.as_view()),
+        path('categories/<int:pk>/', async_views.CategoryDetailView.as_view()),
+        path('menu-items/', async_views.MenuItemListView.as_view()),
+        path('menu-items/<int:pk>/', async_views.MenuItemDetailView.as_view()),
+    ] + urlpatterns
+
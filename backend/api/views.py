@@ -4,8 +4,10 @@ from rest_framework import viewsets, permissions, generics, status
 from rest_framework.response import Response
 from django.contrib.auth.models import User
 from django.utils import timezone
-from django.db.models import Sum, Avg, Count
+from django.db.models import Sum, Avg, Count, Q
+from collections import defaultdict
 from datetime import timedelta
+from decimal import Decimal
 from .models import Canteen, Category, MenuItem, Order, OrderItem
 from .serializers import (
     CanteenSerializer, CategorySerializer, MenuItemSerializer, 
@@ -16,7 +18,6 @@ from .serializers import (
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from rest_framework.views import APIView
 from django.db.models.functions import TruncHour, TruncDay
-import razorpay
 from django.conf import settings
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -27,14 +28,48 @@ from django.utils.decorators import method_decorator
 
 from .models import Order, OrderItem, MenuItem, Canteen # Import necessary models
 from .serializers import OrderSerializer # Import necessary serializers
+from django.db import transaction
+from .inventory import OutOfStock, aggregate_quantities, commit_paid_order, ensure_stock_rolled_over, reserve_stock
+from .models import AvailabilityWindow, CheckoutCart, DemandForecast, PickupSlot, PushSubscription
+from .serializers import AvailabilityWindowSerializer, PickupSlotSerializer, PushSubscriptionSerializer
+from .scheduling import (
+    SlotUnavailable, assign_slot, release_expired_checkout_slots, release_slot, slot_availability, sync_slot_capacity,
+)
+from rest_framework.decorators import action
+from .throttling import AdmissionControlMixin, IPTokenBucketThrottle, UserTokenBucketThrottle
+from .idempotency import IdempotencyMixin, idempotent
+from .serializers import BulkOrderSerializer, OrderSummarySerializer
+from .pagination import EstimatedCountPagination, OrderHistoryPagination
+from .filters import AdminOrderFilter
+from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework import filters
+from .receipts import CONTENT_TYPES, ReceiptUnavailable, request_receipt
+from django.core.files.storage import default_storage
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils.http import quote_etag
+import posixpath
+from .ordering import place_orders
+from django.utils.dateparse import parse_date
+from .conditional import ConditionalGetMixin, not_modified, set_validators
+from .availability import cache_max_age, get_index as get_availability_index, is_orderable, roll_validators
+from .catalog import category_counts, menu_version, parse_canteen_id
+from .payments import GatewayNotConfigured, SignatureMismatch, get_gateway
+from .hashing import HashingBusy
+from .recommendations import recommend
+from .notifications import enqueue_status_change
+from .pricing import cart_total, check_prices, parse_cart, quote, to_paise
+from .menu_io import MenuImportError, export_rows, import_menu, parse_rows, rows_from_data, write_rows
+from .sharding import (
+    CanteenShardMixin, aggregate_across, current_shard, fan_out, shard_for_canteen, shard_for_id, use_canteen_shard,
+)
 
-class CanteenViewSet(viewsets.ReadOnlyModelViewSet):
+class CanteenViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     """ViewSet for listing and retrieving Canteens."""
     queryset = Canteen.objects.all()
     serializer_class = CanteenSerializer
     permission_classes = [permissions.AllowAny] # Anyone can view canteens
 
-class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
+class CategoryViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     """ViewSet for listing and retrieving Categories."""
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
@@ -58,40 +93,113 @@ class AdminMenuItemViewSet(viewsets.ModelViewSet):
             return MenuItemWriteSerializer
         return MenuItemSerializer
 
-class CustomerCanteenViewSet(viewsets.ReadOnlyModelViewSet):
+class CustomerCanteenViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     """ViewSet for CUSTOMERS listing and retrieving Canteens."""
     queryset = Canteen.objects.all()
     serializer_class = CanteenSerializer
     permission_classes = [permissions.AllowAny] # Customers don't need to be logged in to view canteens
 
-class CustomerCategoryListViewSet(viewsets.ReadOnlyModelViewSet):
+    @action(detail=True, methods=['get'], url_path='pickup-slots')
+    def pickup_slots(self, request, pk=None):
+        """Remaining capacity per pickup slot for ?date=YYYY-MM-DD (defaults to today)."""
+        canteen = self.get_object()
+        date = timezone.localdate()
+        if request.query_params.get('date'):
+            date = parse_date(request.query_params['date'])
+            if date is None:
+                return Response({"error": "Invalid date, expected YYYY-MM-DD"}, status=status.HTTP_400_BAD_REQUEST)
+        with use_canteen_shard(canteen):
+            slots = slot_availability(canteen, date)
+        return Response({'date': date, 'slots': slots})
+
+class CustomerCategoryListViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     """ 
-    Provides a read-only list of categories, filterable by canteen.
+    Provides a read-only list of categories. With ?canteen=ID only the categories
+    of that canteen's available items are listed, each with its ``item_count``.
     Accessible by any user (authenticated or not).
     """
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [permissions.AllowAny] # Allow anyone to see categories
-    filterset_fields = ['canteen'] # Enable filtering by /categories/?canteen=ID
 
-class CustomerMenuItemListViewSet(viewsets.ReadOnlyModelViewSet):
+    def list(self, request, *args, **kwargs):
+        if 'canteen' not in request.query_params:
+            return super().list(request, *args, **kwargs)
+        canteen_id = parse_canteen_id(request.query_params['canteen'])
+        if canteen_id is None:
+            return Response({"error": "Invalid canteen id"}, status=status.HTTP_400_BAD_REQUEST)
+        ensure_stock_rolled_over()
+        last_modified, etag = menu_version(canteen_id)
+        response = not_modified(request, last_modified, etag)
+        if response is None:
+            response = Response(category_counts(canteen_id, etag))
+        return set_validators(response, last_modified, etag, cache_max_age())
+
+class CustomerMenuItemListViewSet(ConditionalGetMixin, CanteenShardMixin, viewsets.ReadOnlyModelViewSet):
     """
     Provides a read-only list of menu items, filterable by canteen.
     Accessible by any user (authenticated or not).
     """
+    # The serializer shows canteen and category names
+    conditional_fields = ('updated_at', 'canteen__updated_at', 'category__updated_at')
     queryset = MenuItem.objects.filter(is_available=True) # Only show available items
     serializer_class = MenuItemSerializer
     permission_classes = [permissions.AllowAny] # Allow anyone to see menu items
     filterset_fields = ['canteen', 'category'] # Ensure filtering by canteen is enabled
 
-class OrderViewSet(viewsets.ModelViewSet):
+    def get_queryset(self):
+        ensure_stock_rolled_over() # Brings back yesterday's sold-out items
+        # Items with availability windows are hidden outside them
+        queryset = super().get_queryset()
+        closed = get_availability_index().closed_items()
+        return queryset.exclude(pk__in=closed) if closed else queryset
+
+    def finish_validators(self, last_modified, etag):
+        return roll_validators(last_modified, etag)
+
+    def get_cache_max_age(self):
+        return cache_max_age()
+
+    @action(detail=False, methods=['get'])
+    def recommendations(self, request):
+        """
+        Available items often ordered together with ?items=ID,ID (a menu item or
+        the cart), best first, with the share of orders that had both. ?limit=N.
+        """
+        try:
+            item_ids = [int(pk) for pk in request.query_params.get('items', '').split(',') if pk.strip()]
+            limit = int(request.query_params.get('limit', settings.PAIRING_TOP_K))
+        except ValueError:
+            return Response({"error": "items must be comma-separated menu item ids"}, status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= len(item_ids) <= 50 or not 1 <= limit <= 50:
+            return Response({"error": "Give 1 to 50 items and a limit of 1 to 50"}, status=status.HTTP_400_BAD_REQUEST)
+        results = recommend(item_ids, limit)
+        data = self.get_serializer([item for item, _ in results], many=True).data
+        for row, (_, pairing) in zip(data, results):
+            row['confidence'] = round(pairing.confidence, 3)
+            row['order_count'] = pairing.order_count
+        return Response(data)
+
+class OrderViewSet(AdmissionControlMixin, CanteenShardMixin, IdempotencyMixin, viewsets.ModelViewSet):
     """ViewSet for CUSTOMERS creating, listing, and retrieving their own Orders."""
     permission_classes = [permissions.IsAuthenticated] # Must be logged in to interact with orders
+    throttle_scope = 'orders'
+
+    def get_throttles(self):
+        # Reads are cheap; only order creation is rate limited
+        if self.action in ['create', 'bulk']:
+            return [UserTokenBucketThrottle(), IPTokenBucketThrottle()]
+        return []
+
+    pagination_class = OrderHistoryPagination # Applies to the summary list only
 
     def get_queryset(self):
         """Users can only see their own orders."""
         user = self.request.user
         if user.is_authenticated:
+            if self.action == 'list':
+                # Summaries come from the order row itself (order_history_idx)
+                return Order.objects.filter(customer=user).order_by('-created_at', '-id')
             # Add prefetching to optimize fetching related items and menu_items
             return Order.objects.filter(customer=user).prefetch_related('items__menu_item')
         return Order.objects.none() # Should not happen due to IsAuthenticated, but safe fallback
@@ -100,12 +208,57 @@ class OrderViewSet(viewsets.ModelViewSet):
         """Use different serializers for read and write actions."""
         if self.action in ['create', 'update', 'partial_update']:
             return OrderWriteSerializer
+        if self.action == 'bulk':
+            return BulkOrderSerializer
+        if self.action == 'list':
+            return OrderSummarySerializer
         return OrderSerializer
 
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
+    @action(detail=False, methods=['post'])
+    @idempotent
+    def bulk(self, request, *args, **kwargs):
+        """Place several orders for one canteen (e.g. a whole table) in one transaction."""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save(customer=request.user)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
     def perform_create(self, serializer):
         """Automatically set the customer to the logged-in user when creating an order."""
         serializer.save(customer=self.request.user)
 
+    @action(detail=True, methods=['get'])
+    def receipt(self, request, pk=None):
+        """The order's receipt; ?output=html (default) or pdf."""
+        return _receipt_response(request, self.get_object())
+
+def _receipt_response(request, order):
+    """Serve a stored receipt, or 202 + Retry-After while the pool renders it."""
+    output = request.query_params.get('output', 'html')
+    if order.status == 'CANCELLED':
+        return Response({"error": "Cancelled orders have no receipt"}, status=status.HTTP_409_CONFLICT)
+    try:
+        path = request_receipt(order, output)
+    except ReceiptUnavailable as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    if path is None:
+        response = Response({"status": "rendering"}, status=status.HTTP_202_ACCEPTED)
+        response['Retry-After'] = '2'
+        return response
+    # The file name is the content hash, so it doubles as a strong ETag
+    etag = quote_etag(posixpath.basename(path).split('.')[0])
+    if etag in request.headers.get('If-None-Match', ''):
+        return HttpResponseNotModified()
+    response = FileResponse(
+        default_storage.open(path, 'rb'), content_type=CONTENT_TYPES[output], filename=f"receipt-{order.pk}.{output}"
+    )
+    response['ETag'] = etag
+    return response
+
 # --- User Info View ---
 class CurrentUserView(generics.RetrieveAPIView):
     """Gets the details of the currently logged-in user."""
@@ -115,6 +268,19 @@ class CurrentUserView(generics.RetrieveAPIView):
     def get_object(self):
         return self.request.user
 
+# --- Push Subscription ViewSet ---
+class PushSubscriptionViewSet(viewsets.ModelViewSet):
+    """Web Push subscriptions of the logged-in user, used for order notifications."""
+    serializer_class = PushSubscriptionSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    http_method_names = ['get', 'post', 'delete', 'head', 'options']
+
+    def get_queryset(self):
+        return PushSubscription.objects.filter(user=self.request.user)
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
 # --- Admin Views ---
 
 # --- NEW: Admin Canteen ViewSet ---
@@ -126,17 +292,34 @@ class AdminCanteenViewSet(viewsets.ModelViewSet):
     # Add parser classes if image uploads are needed later
     # parser_classes = [MultiPartParser, FormParser, JSONParser] 
 
-class AdminOrderViewSet(viewsets.ModelViewSet):
+class AdminOrderViewSet(CanteenShardMixin, viewsets.ModelViewSet):
     """ViewSet for ADMINS viewing and updating Orders."""
     queryset = Order.objects.all().select_related('customer', 'canteen').prefetch_related('items__menu_item')
     serializer_class = OrderSerializer # Use the detailed serializer for viewing
     permission_classes = [permissions.IsAdminUser] # Only Admins
     http_method_names = ['get', 'patch', 'head', 'options'] # Allow GET (list/retrieve) and PATCH (update status)
-
-    # Potentially add filtering for status, canteen, date range etc.
-    # filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
-    # filterset_fields = ['status', 'canteen']
-    # ordering_fields = ['created_at', 'total_amount']
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_class = AdminOrderFilter
+    ordering_fields = ['id', 'created_at', 'total_price', 'status', 'customer__username', 'canteen__name']
+    ordering = ['-created_at']
+    pagination_class = EstimatedCountPagination # COUNT(*) over millions of orders is too slow per page
+
+    @action(detail=True, methods=['get'])
+    def receipt(self, request, pk=None):
+        """Receipt or invoice for accounting; ?output=html (default) or pdf."""
+        return _receipt_response(request, self.get_object())
+
+    def perform_update(self, serializer):
+        previous_status = serializer.instance.status
+        extra = {}
+        if serializer.validated_data.get('status') == 'READY' and previous_status != 'READY':
+            extra['ready_at'] = timezone.now() # Feeds the prep-time statistics behind ETAs
+        with transaction.atomic(using=current_shard()):
+            order = serializer.save(**extra)
+            if order.status == 'CANCELLED' and previous_status != 'CANCELLED':
+                release_slot(order) # Free the kitchen capacity for other customers
+            if order.status != previous_status:
+                enqueue_status_change(order) # Delivered by dispatch_notifications once this commits
 
     # Override get_serializer_class if needed for PATCH operations
     # Currently, OrderSerializer allows status updates as it's not read_only
@@ -150,8 +333,47 @@ class AdminCategoryViewSet(viewsets.ModelViewSet):
     serializer_class = CategorySerializer
     permission_classes = [permissions.IsAdminUser]
 
+# --- Admin Pickup Slot ViewSet ---
+class AdminPickupSlotViewSet(CanteenShardMixin, viewsets.ModelViewSet):
+    """ViewSet for ADMIN CRUD operations on a canteen's pickup slots."""
+    serializer_class = PickupSlotSerializer
+    permission_classes = [permissions.IsAdminUser]
+
+    def get_queryset(self):
+        queryset = PickupSlot.objects.all().select_related('canteen')
+        canteen_id = self.request.query_params.get('canteen')
+        if canteen_id is not None:
+            queryset = queryset.filter(canteen__id=canteen_id)
+        return queryset
+
+    def perform_update(self, serializer):
+        with transaction.atomic(using=current_shard()):
+            sync_slot_capacity(serializer.save())
+
+# --- Admin Availability Window ViewSet ---
+class AdminAvailabilityWindowViewSet(CanteenShardMixin, viewsets.ModelViewSet):
+    """ViewSet for ADMIN CRUD operations on menu item availability windows (?menu_item=ID to filter)."""
+    serializer_class = AvailabilityWindowSerializer
+    permission_classes = [permissions.IsAdminUser]
+
+    def get_shard(self, request):
+        # Windows live with their menu item
+        menu_item = request.query_params.get('menu_item')
+        if menu_item is None and isinstance(request.data, dict):
+            menu_item = request.data.get('menu_item')
+        if self.kwargs.get('pk') is None and menu_item is not None:
+            return shard_for_id(menu_item)
+        return super().get_shard(request)
+
+    def get_queryset(self):
+        queryset = AvailabilityWindow.objects.all()
+        menu_item_id = self.request.query_params.get('menu_item')
+        if menu_item_id is not None:
+            queryset = queryset.filter(menu_item__id=menu_item_id)
+        return queryset
+
 # --- Admin Menu Item ViewSet (Restore full definition) ---
-class AdminMenuItemViewSet(viewsets.ModelViewSet):
+class AdminMenuItemViewSet(CanteenShardMixin, viewsets.ModelViewSet):
     """ViewSet for ADMIN CRUD operations on Menu Items."""
     permission_classes = [permissions.IsAdminUser]
     parser_classes = [MultiPartParser, FormParser, JSONParser] # Keep parsers
@@ -169,6 +391,47 @@ class AdminMenuItemViewSet(viewsets.ModelViewSet):
             return MenuItemWriteSerializer # Use write serializer for modifications
         return MenuItemSerializer # Use read serializer for list/retrieve
 
+    @action(detail=False, methods=['post'], url_path='import')
+    def bulk_import(self, request):
+        """
+        Upsert many items at once from an uploaded ``file`` (CSV or JSON) or a
+        JSON body. ``?dry_run=true`` reports the changes without applying them,
+        ``?prune=true`` marks items missing from the import unavailable.
+        """
+        upload = request.FILES.get('file')
+        try:
+            if upload is not None:
+                fmt = 'csv' if upload.name.lower().endswith('.csv') else 'json'
+                rows = parse_rows(upload.read().decode('utf-8'), fmt)
+            else:
+                rows = rows_from_data(request.data)
+            counts = import_menu(
+                rows,
+                prune=request.query_params.get('prune') == 'true',
+                dry_run=request.query_params.get('dry_run') == 'true',
+            )
+        except UnicodeDecodeError:
+            return Response({"error": "File must be UTF-8 encoded"}, status=status.HTTP_400_BAD_REQUEST)
+        except MenuImportError as e:
+            return Response({"error": str(e), "rows": e.errors}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(counts)
+
+    @action(detail=False, methods=['get'], url_path='export')
+    def bulk_export(self, request):
+        """All items (or those of ``?canteen=``) as ``?output=json`` (default) or ``csv``."""
+        output = request.query_params.get('output', 'json')
+        if output not in ('json', 'csv'):
+            return Response({"error": "output must be json or csv"}, status=status.HTTP_400_BAD_REQUEST)
+        canteen = request.query_params.get('canteen')
+        if canteen is not None and not canteen.isdigit():
+            return Response({"error": "canteen must be an id"}, status=status.HTTP_400_BAD_REQUEST)
+        rows = export_rows([int(canteen)] if canteen else None)
+        content_type = 'text/csv' if output == 'csv' else 'application/json'
+        response = HttpResponse(content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="menu.{output}"'
+        write_rows(rows, response, output)
+        return response
+
 class DashboardStatsView(APIView):
     """Provides aggregated statistics for the admin dashboard."""
     permission_classes = [permissions.IsAdminUser]
@@ -183,55 +446,63 @@ class DashboardStatsView(APIView):
         start_of_week = start_of_day - timedelta(days=now.weekday()) # Monday of the current week
 
         # --- Calculate Stats --- 
+        # Orders live on the canteen shards: every figure is computed per shard and merged here
         orders_today = Order.objects.filter(created_at__gte=start_of_day, created_at__lte=end_of_day)
         orders_yesterday = Order.objects.filter(created_at__gte=start_of_yesterday, created_at__lte=end_of_yesterday)
         orders_this_week = Order.objects.filter(created_at__gte=start_of_week)
         completed_orders_this_week = orders_this_week.filter(status__in=['COMPLETED', 'READY'])
-        
-        total_orders_today = orders_today.count()
-        revenue_today_agg = orders_today.filter(status__in=['COMPLETED', 'READY']).aggregate(total=Sum('total_price'))
-        revenue_today = revenue_today_agg['total'] or 0
-        avg_order_today_agg = orders_today.filter(status__in=['COMPLETED', 'READY']).aggregate(avg=Avg('total_price'))
-        avg_order_today = avg_order_today_agg['avg'] or 0
-        pending_orders = Order.objects.filter(status__in=['PENDING', 'PROCESSING']).count()
+
+        def totals(queryset):
+            """(order count, revenue of completed orders, number of completed orders) over all shards."""
+            parts = aggregate_across(
+                queryset,
+                count=Count('id'),
+                revenue=Sum('total_price', filter=Q(status__in=['COMPLETED', 'READY'])),
+                completed=Count('id', filter=Q(status__in=['COMPLETED', 'READY'])),
+            )
+            return (
+                sum(part['count'] for part in parts),
+                sum((part['revenue'] or 0 for part in parts), 0),
+                sum(part['completed'] for part in parts),
+            )
+
+        total_orders_today, revenue_today, completed_today = totals(orders_today)
+        avg_order_today = revenue_today / completed_today if completed_today else 0
+        pending_orders = sum(qs.count() for qs in fan_out(Order.objects.filter(status__in=['PENDING', 'PROCESSING'])))
         total_customers = User.objects.filter(is_staff=False, is_superuser=False).count()
-        total_orders_yesterday = orders_yesterday.count()
-        revenue_yesterday_agg = orders_yesterday.filter(status__in=['COMPLETED', 'READY']).aggregate(total=Sum('total_price'))
-        revenue_yesterday = revenue_yesterday_agg['total'] or 0
+        total_orders_yesterday, revenue_yesterday, _ = totals(orders_yesterday)
         order_trend = ((total_orders_today - total_orders_yesterday) / total_orders_yesterday * 100) if total_orders_yesterday else (100 if total_orders_today > 0 else 0)
         revenue_trend = ((revenue_today - revenue_yesterday) / revenue_yesterday * 100) if revenue_yesterday else (100 if revenue_today > 0 else 0)
         
         # --- Calculate Chart Data --- 
         # Today's orders by hour
-        orders_by_hour = orders_today \
-            .annotate(hour=TruncHour('created_at')) \
-            .values('hour') \
-            .annotate(count=Count('id')) \
-            .order_by('hour')
+        orders_by_hour = defaultdict(int)
+        for shard_orders in fan_out(orders_today.annotate(hour=TruncHour('created_at')).values('hour').annotate(count=Count('id'))):
+            for hour_data in shard_orders:
+                orders_by_hour[hour_data['hour']] += hour_data['count']
         
         # Format for recharts: [{ name: '9AM', orders: 4 }, ...]
         daily_orders_chart_data = [
             {
-                'name': hour_data['hour'].strftime('%I%p').lstrip('0'), # Format hour e.g., 9AM, 12PM
-                'orders': hour_data['count']
+                'name': hour.strftime('%I%p').lstrip('0'), # Format hour e.g., 9AM, 12PM
+                'orders': count
             }
-            for hour_data in orders_by_hour
+            for hour, count in sorted(orders_by_hour.items())
         ]
         
         # Weekly revenue by day
-        revenue_by_day = completed_orders_this_week \
-            .annotate(day=TruncDay('created_at')) \
-            .values('day') \
-            .annotate(total_revenue=Sum('total_price')) \
-            .order_by('day')
+        revenue_by_day = defaultdict(int)
+        for shard_orders in fan_out(completed_orders_this_week.annotate(day=TruncDay('created_at')).values('day').annotate(total_revenue=Sum('total_price'))):
+            for day_data in shard_orders:
+                revenue_by_day[day_data['day']] += day_data['total_revenue']
         
         # Format for recharts: [{ name: 'Mon', revenue: 520 }, ...]
         weekly_revenue_chart_data = [
             {
-                'name': day_data['day'].strftime('%a'), # Format day e.g., Mon, Tue
-                'revenue': float(day_data['total_revenue'])
+                'name': day.strftime('%a'), # Format day e.g., Mon, Tue
+                'revenue': float(total_revenue)
             }
-            for day_data in revenue_by_day
+            for day, total_revenue in sorted(revenue_by_day.items())
         ]
 
         # --- Prepare Response Data --- 
@@ -250,34 +521,140 @@ class DashboardStatsView(APIView):
 
         return Response(stats)
 
+class DemandForecastView(APIView):
+    """
+    Expected portions per menu item and hour for ?canteen=ID on ?date=YYYY-MM-DD
+    (default tomorrow), busiest items first. Written by ``manage.py forecast_demand``.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, format=None):
+        canteen_id = parse_canteen_id(request.query_params.get('canteen'))
+        if canteen_id is None:
+            return Response({"error": "canteen is required"}, status=status.HTTP_400_BAD_REQUEST)
+        date = timezone.localdate() + timedelta(days=1)
+        if request.query_params.get('date'):
+            date = parse_date(request.query_params['date'])
+            if date is None:
+                return Response({"error": "Invalid date, expected YYYY-MM-DD"}, status=status.HTTP_400_BAD_REQUEST)
+
+        forecasts = (
+            DemandForecast.objects.using(shard_for_canteen(canteen_id))
+            .filter(canteen_id=canteen_id, date=date)
+            .select_related('menu_item')
+            .order_by('menu_item_id', 'hour')
+        )
+        items = {}
+        for forecast in forecasts:
+            item = items.setdefault(forecast.menu_item_id, {
+                'menu_item': forecast.menu_item_id, 'name': forecast.menu_item.name, 'total': 0, 'hours': [],
+            })
+            item['hours'].append({'hour': forecast.hour, 'quantity': forecast.quantity})
+            item['total'] += forecast.quantity
+        for item in items.values():
+            item['total'] = round(item['total'], 1)
+        return Response({
+            'canteen': canteen_id,
+            'date': date,
+            'items': sorted(items.values(), key=lambda item: -item['total']),
+        })
+
 # --- Custom Registration View ---
-class UserRegistrationView(generics.CreateAPIView):
+class UserRegistrationView(AdmissionControlMixin, generics.CreateAPIView):
     queryset = User.objects.all()
     permission_classes = [permissions.AllowAny] # Anyone can register
     serializer_class = UserRegistrationSerializer
+    throttle_classes = [IPTokenBucketThrottle]
+    throttle_scope = 'registration'
+
+    def create(self, request, *args, **kwargs):
+        try:
+            return super().create(request, *args, **kwargs)
+        except HashingBusy as e:
+            return Response({"detail": str(e)}, status=status.HTTP_429_TOO_MANY_REQUESTS,
+                            headers={'Retry-After': str(settings.ADMISSION_RETRY_AFTER_SECONDS)})
 
 # --- Razorpay Views --- 
 
-# Initialize Razorpay client
-# Ensure RAZORPAY_KEY_ID and RAZORPAY_KEY_SECRET are set in settings.py
-razorpay_client = None
-if settings.RAZORPAY_KEY_ID and settings.RAZORPAY_KEY_SECRET:
-    razorpay_client = razorpay.Client(
-        auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET)
+# Payments go through api.payments.get_gateway() (Razorpay unless settings.PAYMENT_GATEWAY says otherwise)
+
+def _load_order_lines(canteen_id, items_data):
+    """Resolve [{menu_item_id, quantity}] into {MenuItem: quantity} for one canteen."""
+    cart = parse_cart(items_data)
+    menu_items = MenuItem.objects.in_bulk(list(cart))
+    resolved = []
+    for menu_item_id, quantity in cart.items():
+        menu_item = menu_items.get(menu_item_id)
+        if menu_item is None:
+            raise MenuItem.DoesNotExist(f"Menu item {menu_item_id} not found")
+        if str(menu_item.canteen_id) != str(canteen_id):
+            raise ValueError(f"Menu item {menu_item_id} does not belong to canteen {canteen_id}")
+        resolved.append((menu_item, quantity))
+    return aggregate_quantities(resolved)
+
+FAILED_CAPTURE_MESSAGE = "This payment could not be turned into an order and will be refunded"
+
+def _record_failed_capture(razorpay_order_id, payment_id, error):
+    """Keep the cart of a captured payment that could not become an order, for refunds and reconciliation."""
+    CheckoutCart.objects.filter(razorpay_order_id=razorpay_order_id, status='OPEN').update(
+        status='FAILED', razorpay_payment_id=payment_id, last_error=str(error),
     )
-else:
-    print("WARNING: Razorpay client not initialized. Keys missing in settings.")
 
-class CreateRazorpayOrderView(APIView):
+class CartQuoteView(CanteenShardMixin, APIView):
+    """
+    Prices a cart ({canteen, items: [{menu_item_id, quantity}]}) the way checkout
+    will charge it. Answered from the in-memory price table (api.pricing).
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get_shard(self, request):
+        canteen_id = parse_canteen_id(request.data.get('canteen')) if isinstance(request.data, dict) else None
+        return shard_for_canteen(canteen_id) if canteen_id is not None else None
+
+    def post(self, request, *args, **kwargs):
+        canteen_id = parse_canteen_id(request.data.get('canteen'))
+        if canteen_id is None:
+            return Response({"error": "A valid canteen is required."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            return Response(quote(canteen_id, parse_cart(request.data.get('items'))))
+        except ValueError as e: # Includes UnknownMenuItem
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+class CreateRazorpayOrderView(AdmissionControlMixin, CanteenShardMixin, IdempotencyMixin, APIView):
     permission_classes = [IsAuthenticated]
+    throttle_classes = [UserTokenBucketThrottle, IPTokenBucketThrottle]
+    throttle_scope = 'payments'
 
+    @idempotent
     def post(self, request, *args, **kwargs):
-        if not razorpay_client:
-            return Response({"error": "Razorpay client not initialized"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        gateway = get_gateway()
 
-        amount = request.data.get('amount') # Amount should be in paise from frontend
-        if not amount or not isinstance(amount, int) or amount <= 0:
-            return Response({"error": "Invalid amount"}, status=status.HTTP_400_BAD_REQUEST)
+        # The cart ({canteen, items}) is priced here and held in stock until payment is verified
+        canteen_id = request.data.get('canteen')
+        try:
+            quantities = _load_order_lines(canteen_id, request.data.get('items'))
+        except MenuItem.DoesNotExist:
+            return Response({"error": "Invalid menu item specified"}, status=status.HTTP_400_BAD_REQUEST)
+        except ValueError as ve:
+            return Response({"error": str(ve)}, status=status.HTTP_400_BAD_REQUEST)
+        # Checked before payment; VerifyPaymentView must accept what was paid for
+        unavailable = [menu_item.name for menu_item in quantities if not is_orderable(menu_item)]
+        if unavailable:
+            return Response({"error": f"Currently unavailable: {', '.join(unavailable)}"}, status=status.HTTP_400_BAD_REQUEST)
+        canteen = Canteen.objects.get(pk=int(canteen_id))
+        pickup_slot_id = request.data.get('pickup_slot')
+        pickup_slot = PickupSlot.objects.filter(pk=pickup_slot_id).first() if pickup_slot_id else None
+        if pickup_slot_id and pickup_slot is None:
+            return Response({"error": "Invalid pickup slot specified"}, status=status.HTTP_400_BAD_REQUEST)
+
+        amount = to_paise(cart_total(quantities))
+        # The client's amount (paise) is what the customer was shown; never charge anything else
+        expected = request.data.get('amount')
+        if expected is not None and expected != amount:
+            check_prices(quantities) # A stale price table would repeat the old price
+            current = quote(int(canteen_id), {menu_item.pk: quantity for menu_item, quantity in quantities.items()})
+            return Response({"error": "Prices have changed, please review your cart.", "quote": current},
+                            status=status.HTTP_409_CONFLICT)
 
         try:
             order_currency = 'INR'
@@ -288,27 +665,46 @@ class CreateRazorpayOrderView(APIView):
                 # Add any other notes you want to pass to Razorpay
             }
 
-            razorpay_order = razorpay_client.order.create(dict(
-                amount=amount,
-                currency=order_currency,
-                receipt=order_receipt,
-                notes=notes,
-                payment_capture='1' # Auto capture payment
-            ))
+            razorpay_order = gateway.create_order(amount, order_currency, order_receipt, notes)
 
             print(f"Razorpay Order Created: {razorpay_order['id']}")
-            return Response({"order_id": razorpay_order['id']}, status=status.HTTP_201_CREATED)
 
+        except GatewayNotConfigured as e:
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         except Exception as e:
             print(f"Error creating Razorpay order: {e}")
             return Response({"error": "Could not create Razorpay order"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-class VerifyPaymentView(APIView):
+        # Hold stock and the pickup slot for the payment window, and keep the priced cart for VerifyPaymentView,
+        # so nothing that can run out is left to book after the customer has paid
+        release_expired_checkout_slots()
+        try:
+            with transaction.atomic(using=current_shard()):
+                reserve_stock(request.user, razorpay_order['id'], quantities)
+                slot, pickup_date, slot_load = assign_slot(canteen, quantities, slot=pickup_slot)
+                CheckoutCart.objects.create(
+                    razorpay_order_id=razorpay_order['id'], customer=request.user, canteen=canteen,
+                    lines={str(menu_item.pk): quantity for menu_item, quantity in quantities.items()},
+                    amount=amount, currency=order_currency,
+                    pickup_slot=slot, pickup_date=pickup_date, slot_load=slot_load, slot_held=slot is not None,
+                )
+        except (OutOfStock, SlotUnavailable) as e:
+            return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
+
+        return Response({"order_id": razorpay_order['id'], "amount": amount}, status=status.HTTP_201_CREATED)
+
+class VerifyPaymentView(AdmissionControlMixin, CanteenShardMixin, IdempotencyMixin, APIView):
     permission_classes = [IsAuthenticated]
+    # Not rate limited: a captured payment must always be able to become an order
+
+    def get_shard(self, request):
+        details = request.data.get('local_order_details') if isinstance(request.data, dict) else None
+        canteen_id = details.get('canteen') if isinstance(details, dict) else None
+        return shard_for_canteen(canteen_id) if canteen_id is not None else None
 
+    @idempotent
     def post(self, request, *args, **kwargs):
-        if not razorpay_client:
-            return Response({"error": "Razorpay client not initialized"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        gateway = get_gateway()
 
         payment_data = request.data
         razorpay_payment_id = payment_data.get('razorpay_payment_id')
@@ -319,56 +715,75 @@ class VerifyPaymentView(APIView):
         if not all([razorpay_payment_id, razorpay_order_id, razorpay_signature, local_order_details]):
             return Response({"error": "Missing payment verification data"}, status=status.HTTP_400_BAD_REQUEST)
 
-        params_dict = {
-            'razorpay_order_id': razorpay_order_id,
-            'razorpay_payment_id': razorpay_payment_id,
-            'razorpay_signature': razorpay_signature
-        }
-
         try:
-            razorpay_client.utility.verify_payment_signature(params_dict)
+            gateway.verify_payment_signature(razorpay_order_id, razorpay_payment_id, razorpay_signature)
             print(f"Razorpay Signature Verified for Order: {razorpay_order_id}")
 
             try:
                 canteen_id = local_order_details.get('canteen')
                 table_number = local_order_details.get('table_number')
                 items_data = local_order_details.get('items')
-                total_price = local_order_details.get('total_price')
 
                 if not canteen_id or not items_data:
                      raise ValueError("Missing canteen or items in local order details")
 
-                canteen = Canteen.objects.get(id=canteen_id)
-                
-                order = Order.objects.create(
-                    customer=request.user,
-                    canteen=canteen,
-                    table_number=table_number,
-                    total_price=total_price,
-                    status='PENDING',
-                    razorpay_order_id=razorpay_order_id,
-                    razorpay_payment_id=razorpay_payment_id
-                )
-
-                order_items_to_create = []
-                for item_data in items_data:
-                    menu_item_id = item_data.get('menu_item_id')
-                    if not menu_item_id:
-                        raise ValueError(f"Missing menu_item_id in item data: {item_data}")
-                    menu_item = MenuItem.objects.get(id=menu_item_id)
-                    order_items_to_create.append(
-                        OrderItem(
-                            order=order,
-                            menu_item=menu_item,
-                            quantity=item_data['quantity'],
-                            price=menu_item.price
-                        )
-                    )
-                OrderItem.objects.bulk_create(order_items_to_create)
+                # The order is built from the cart that was priced and charged, never from what the client resends
+                checkout = CheckoutCart.objects.filter(
+                    razorpay_order_id=razorpay_order_id, customer=request.user,
+                    created_at__gt=timezone.now() - timedelta(seconds=settings.CHECKOUT_CART_TTL_SECONDS),
+                ).first()
+                if checkout is None:
+                    return Response({"error": "No checkout found for this payment"}, status=status.HTTP_400_BAD_REQUEST)
+                if checkout.status == 'FAILED':
+                    return Response({"error": FAILED_CAPTURE_MESSAGE}, status=status.HTTP_409_CONFLICT)
+                paid_cart = {int(menu_item_id): quantity for menu_item_id, quantity in checkout.lines.items()}
+                if str(checkout.canteen_id) != str(canteen_id) or parse_cart(items_data) != paid_cart:
+                    return Response({"error": "The cart differs from the one that was paid for"},
+                                    status=status.HTTP_409_CONFLICT)
+                payment = gateway.fetch_payment(razorpay_payment_id)
+                if (payment['order_id'], payment['amount'], payment['currency']) != (
+                    razorpay_order_id, checkout.amount, checkout.currency
+                ):
+                    print(f"Payment {razorpay_payment_id} of {payment['amount']} does not match checkout {razorpay_order_id}")
+                    return Response({"error": "The payment does not match the checkout amount"},
+                                    status=status.HTTP_409_CONFLICT)
+
+                canteen = Canteen.objects.get(id=checkout.canteen_id)
+                quantities = _load_order_lines(checkout.canteen_id, items_data)
+
+                with transaction.atomic(using=current_shard()):
+                    checkout = CheckoutCart.objects.select_for_update().filter(pk=checkout.pk).first()
+                    if checkout is None:
+                        # A concurrent verification of the same payment won
+                        return Response({"error": "This payment was already verified"}, status=status.HTTP_409_CONFLICT)
+                    if checkout.status == 'FAILED':
+                        return Response({"error": FAILED_CAPTURE_MESSAGE}, status=status.HTTP_409_CONFLICT)
+                    if checkout.slot_held:
+                        slot = {'booked_slot': (checkout.pickup_slot, checkout.pickup_date, checkout.slot_load)}
+                    else: # No slots, or paid after the booking expired: book again
+                        slot = {'pickup_slot': checkout.pickup_slot}
+                    checkout.delete()
+                    commit_paid_order(request.user, razorpay_order_id, quantities)
+                    order, = place_orders(request.user, canteen, [{
+                        'lines': quantities,
+                        'table_number': table_number,
+                        'notes': local_order_details.get('notes'),
+                        **slot,
+                        'fields': { # The captured amount, never the client's total
+                            'total_price': Decimal(checkout.amount) / 100,
+                            'razorpay_order_id': razorpay_order_id,
+                            'razorpay_payment_id': razorpay_payment_id,
+                        },
+                    }], take_stock=False)
                 
                 print(f"Database Order Created: {order.id}")
                 return Response({"success": True, "orderId": order.id}, status=status.HTTP_201_CREATED)
 
+            except (OutOfStock, SlotUnavailable) as e:
+                 # Payment is captured but the order cannot be filled; the cart stays behind for the refund
+                 print(f"Order failed after payment {razorpay_payment_id}: {e}")
+                 _record_failed_capture(razorpay_order_id, razorpay_payment_id, e)
+                 return Response({"error": f"{e} {FAILED_CAPTURE_MESSAGE}."}, status=status.HTTP_409_CONFLICT)
             except Canteen.DoesNotExist:
                  print("Error creating DB order: Canteen not found")
                  return Response({"error": "Invalid canteen specified"}, status=status.HTTP_400_BAD_REQUEST)
@@ -382,7 +797,9 @@ class VerifyPaymentView(APIView):
                  print(f"Error creating database order after payment verification: {db_error}")
                  return Response({"error": "Order creation failed after payment verification"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        except razorpay.errors.SignatureVerificationError as e:
+        except GatewayNotConfigured as e:
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        except SignatureMismatch as e:
             print(f"Razorpay Signature Verification Failed: {e}")
             return Response({"error": "Payment signature verification failed"}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
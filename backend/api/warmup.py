@@ -0,0 +1,165 @@
+"""
+Worker warm-up.
+
+A fresh worker otherwise pays on its first requests for importing the views
+and their dependencies (numpy, scipy, DRF), populating the URL resolver,
+building serializer fields (which fills Django's model ``_meta`` caches) and
+loading the menu caches. ``warm_up`` does all of that up front:
+
+* gunicorn calls it from ``gunicorn.conf.py``, in the master before forking
+  when ``preload_app`` is on (workers inherit the warm process, including the
+  local-memory cache and the in-process availability index and price tables),
+  otherwise in each worker after it loads the app;
+* ``WarmupLifespan`` calls it on ASGI ``lifespan.startup`` for servers such as
+  uvicorn that run the app directly.
+
+Database connections opened while warming up are closed again so a preforking
+master never hands a connection to its workers. ``probe`` measures cold and
+warm startups for ``manage.py startup_profile``.
+"""
+import importlib
+import inspect
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.urls import get_resolver
+
+logger = logging.getLogger(__name__)
+
+_warmed = False
+
+
+def import_modules():
+    for name in settings.WARMUP_MODULES:
+        importlib.import_module(name)
+
+
+def populate_urls():
+    get_resolver().reverse_dict # Imports every urlconf and view and builds the reverse lookup tables
+
+
+def build_serializer_fields():
+    from rest_framework.serializers import BaseSerializer
+
+    from . import serializers
+
+    built = 0
+    for _, serializer_class in inspect.getmembers(serializers, inspect.isclass):
+        if issubclass(serializer_class, BaseSerializer) and serializer_class.__module__ == serializers.__name__:
+            try:
+                serializer_class().fields
+                built += 1
+            except Exception as e: # A serializer that needs context; it will be built on first use
+                logger.debug(f"Could not pre-build {serializer_class.__name__}: {e}")
+    return built
+
+
+def prime_payment_gateway():
+    from .payments import GatewayNotConfigured, get_gateway
+
+    gateway = get_gateway()
+    try:
+        getattr(gateway, 'client', None) # Imports the Razorpay SDK and builds its HTTP session
+    except GatewayNotConfigured:
+        pass
+
+
+def prime_menu_caches():
+    from .availability import get_index
+    from .catalog import category_counts, menu_version
+    from .eta import get_prep_table
+    from .inventory import ensure_stock_rolled_over
+    from .models import Canteen
+    from .pricing import get_price_table
+
+    get_index()
+    get_prep_table()
+    ensure_stock_rolled_over()
+    canteen_ids = list(Canteen.objects.values_list('pk', flat=True))
+    for canteen_id in canteen_ids:
+        get_price_table(canteen_id)
+        category_counts(canteen_id, menu_version(canteen_id)[1])
+    return len(canteen_ids)
+
+
+STEPS = [
+    ('imports', import_modules),
+    ('url resolver', populate_urls),
+    ('serializer fields', build_serializer_fields),
+    ('payment gateway', prime_payment_gateway),
+    ('menu caches', prime_menu_caches),
+]
+
+
+def warm_up():
+    """Run every warm-up step once per process; returns ``{step: seconds}``."""
+    global _warmed
+    timings = {}
+    if _warmed:
+        return timings
+    try:
+        for name, step in STEPS:
+            started = time.perf_counter()
+            try:
+                step()
+            except Exception:
+                # A cold cache is slower, not broken: never keep a worker from starting
+                logger.exception(f"Warm-up step '{name}' failed")
+            timings[name] = time.perf_counter() - started
+    finally:
+        connections.close_all()
+    _warmed = True
+    steps = ', '.join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in timings.items())
+    logger.info(f"Warmed up in {sum(timings.values()) * 1000:.0f} ms ({steps})")
+    return timings
+
+
+class WarmupLifespan:
+    """ASGI wrapper answering ``lifespan`` events (Django's handler only speaks HTTP) and warming up on startup."""
+
+    def __init__(self, application):
+        self.application = application
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'lifespan':
+            return await self.application(scope, receive, send)
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                if settings.WARMUP_ON_START:
+                    await sync_to_async(warm_up)()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+def probe(paths, warm, started):
+    """
+    Startup phases and first/second request latencies of this (fresh) process,
+    in milliseconds. ``started`` is the ``perf_counter()`` taken before Django
+    was imported; run by ``manage.py startup_profile`` in a subprocess.
+    """
+    from django.test import Client
+
+    phases = {'django.setup()': time.perf_counter() - started}
+    begun = time.perf_counter()
+    from canteen_backend.wsgi import application # noqa: F401 (builds the middleware chain)
+    phases['WSGI application'] = time.perf_counter() - begun
+    if warm:
+        phases.update({f"warm-up: {name}": seconds for name, seconds in warm_up().items()})
+
+    hosts = [host.lstrip('.') for host in settings.ALLOWED_HOSTS if host != '*']
+    client = Client(HTTP_HOST=hosts[0] if hosts else 'localhost')
+    requests = []
+    for path in paths:
+        timings = []
+        for _ in range(2):
+            begun = time.perf_counter()
+            response = client.get(path)
+            timings.append(time.perf_counter() - begun)
+        requests.append({'path': path, 'status': response.status_code, 'first': timings[0] * 1000, 'second': timings[1] * 1000})
+    return {'phases': {name: seconds * 1000 for name, seconds in phases.items()}, 'requests': requests}
@@ -2,6 +2,8 @@
 ASGI config for canteen_backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+``WarmupLifespan`` answers the server's lifespan events and warms the worker up
+on startup (see api.warmup).
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
@@ -13,4 +15,8 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'canteen_backend.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from api.warmup import WarmupLifespan  # noqa: E402 (needs the app registry loaded above)
+
+application = WarmupLifespan(django_application)
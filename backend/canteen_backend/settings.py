@@ -41,6 +41,7 @@ INSTALLED_APPS = [
 
     # Third-party apps
     'rest_framework',
+    'django_filters',
     'rest_framework.authtoken',
     'corsheaders',
     'dj_rest_auth',
@@ -132,6 +133,23 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Password hashing (see api.hashers and api.hashing). PBKDF2-SHA256 iterations;
+# values below Django's default (1,000,000) are raised to it, so lowering this
+# never weakens stored hashes. Signups stay fast by hashing on the
+# PASSWORD_HASH_WORKERS pool instead.
+PASSWORD_HASH_ITERATIONS = int(os.getenv('PASSWORD_HASH_ITERATIONS', 1_000_000))
+PASSWORD_HASHERS = [
+    'api.hashers.TunedPBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+# Threads hashing signup passwords per process, and signups allowed to wait for one
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+PASSWORD_HASH_QUEUE = int(os.getenv('PASSWORD_HASH_QUEUE', 16))
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/4.2/topics/i18n/
 
@@ -198,7 +216,9 @@ REST_FRAMEWORK = {
     # Change default permission to IsAuthenticated
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
-    ]
+    ],
+    # Proxies in front of the app, used to find the client IP for rate limits (1 on Render)
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', 0)),
 }
 
 # Required by dj-rest-auth
@@ -226,4 +246,169 @@ RAZORPAY_KEY_SECRET = os.getenv('RAZORPAY_KEY_SECRET')
 # Add checks to ensure keys are loaded
 if not RAZORPAY_KEY_ID or not RAZORPAY_KEY_SECRET:
     # Handle missing keys appropriately (e.g., raise ImproperlyConfigured)
-    print("WARNING: Razorpay keys not found in environment variables.")
\ No newline at end of file
+    print("WARNING: Razorpay keys not found in environment variables.")
+
+# Dotted path of the api.payments gateway; api.payments.FakeGateway for tests and load tests
+PAYMENT_GATEWAY = os.getenv('PAYMENT_GATEWAY', 'api.payments.RazorpayGateway')
+
+# Inventory
+# How long stock stays reserved for a customer between creating a Razorpay
+# order and verifying the payment. Expired holds are returned to stock.
+STOCK_RESERVATION_TTL_SECONDS = int(os.getenv('STOCK_RESERVATION_TTL_SECONDS', 15 * 60))
+# How long the priced cart of a checkout is kept for verifying its payment.
+# Payments verified later are refused and show up in the reconciliation report.
+CHECKOUT_CART_TTL_SECONDS = 24 * 60 * 60
+
+
+# Order ETAs (see api.eta and `manage.py refresh_prep_stats`)
+PREP_STATS_WINDOW_DAYS = int(os.getenv('PREP_STATS_WINDOW_DAYS', 28)) # Rolling history window
+PREP_STATS_MAX_SECONDS = 4 * 60 * 60 # Longer PENDING->READY durations are treated as noise
+PREP_STATS_CACHE_SECONDS = 5 * 60
+ETA_DEFAULT_PREP_SECONDS = 10 * 60 # Used until a canteen has history
+KITCHEN_PARALLELISM = int(os.getenv('KITCHEN_PARALLELISM', 3)) # Orders a kitchen prepares at once
+
+# "Frequently ordered together" (see api.recommendations and `manage.py build_pairings`)
+PAIRING_TOP_K = 10 # Neighbours stored per menu item
+PAIRING_MIN_ORDERS = 2 # Orders two items must share before they are recommended together
+
+# Hourly demand forecasts (see api.forecasting and `manage.py forecast_demand`)
+FORECAST_HISTORY_WEEKS = int(os.getenv('FORECAST_HISTORY_WEEKS', 104))
+FORECAST_HALF_LIFE_WEEKS = 4 # A week this much older counts half as much
+FORECAST_MIN_QUANTITY = 0.1 # Expected portions below this are not stored
+
+
+# Caches
+# Rate-limit buckets and the small lookup tables (prep times, menus) live in
+# a per-process local memory cache shared by all threads of a worker.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'canteen-flow',
+    }
+}
+
+
+# Rate limiting and admission control (see api.throttling)
+RATE_LIMIT_CACHE = 'default'
+# Token buckets per view throttle_scope: 'burst' requests at once, refilled at 'per_minute'.
+RATE_LIMITS = {
+    'orders': {
+        'user': {'burst': 5, 'per_minute': 10},
+        'ip': {'burst': 20, 'per_minute': 60},
+    },
+    'payments': {
+        'user': {'burst': 5, 'per_minute': 10},
+        'ip': {'burst': 20, 'per_minute': 60},
+    },
+    'registration': {
+        'ip': {'burst': 5, 'per_minute': 5},
+    },
+}
+# Requests a worker process runs against the database at once; keep at or below
+# the connections the database allows per worker. Extra requests wait up to
+# ADMISSION_QUEUE_TIMEOUT_SECONDS and are then rejected with 429.
+ADMISSION_MAX_CONCURRENT = int(os.getenv('ADMISSION_MAX_CONCURRENT', 10))
+ADMISSION_QUEUE_TIMEOUT_SECONDS = 0.5
+ADMISSION_RETRY_AFTER_SECONDS = 2
+
+
+# Idempotency-Key support (see api.idempotency)
+IDEMPOTENCY_KEY_TTL_SECONDS = 24 * 60 * 60 # How long a stored response is replayed
+IDEMPOTENCY_LOCK_TIMEOUT_SECONDS = 60 # After this an unfinished first request is considered lost
+IDEMPOTENCY_WAIT_SECONDS = 5 # How long a concurrent duplicate waits for the first response before a 409
+IDEMPOTENCY_POLL_SECONDS = 0.1
+
+
+# Group orders: most orders accepted by one POST /api/orders/bulk/ request
+BULK_ORDER_MAX_ORDERS = 50
+
+
+# Canteen sharding (see api.sharding)
+# SHARD_ALIASES=shard_1,shard_2 adds one database per alias, reusing the default
+# connection settings unless DB_NAME_<ALIAS> / DB_HOST_<ALIAS> override them.
+# The order of SHARD_DATABASES fixes each shard's id block, so only append to it.
+SHARD_DATABASES = ['default']
+for _alias in filter(None, os.getenv('SHARD_ALIASES', '').split(',')):
+    DATABASES[_alias] = {
+        **DATABASES['default'],
+        'NAME': os.getenv(f'DB_NAME_{_alias.upper()}', f"{DATABASES['default']['NAME']}_{_alias}"),
+        'HOST': os.getenv(f'DB_HOST_{_alias.upper()}', DATABASES['default']['HOST']),
+    }
+    SHARD_DATABASES.append(_alias)
+# Canteen id -> shard alias, e.g. CANTEEN_SHARDS=3:shard_1,4:shard_2. Unlisted canteens live on default.
+CANTEEN_SHARDS = {
+    int(canteen_id): alias
+    for canteen_id, alias in (entry.split(':') for entry in filter(None, os.getenv('CANTEEN_SHARDS', '').split(',')))
+}
+SHARD_ID_BLOCK = 10 ** 12 # Primary keys a shard may allocate before running into the next one
+DATABASE_ROUTERS = ['api.sharding.CanteenShardRouter']
+
+
+# Conditional GET on catalog endpoints (see api.conditional): seconds a client may
+# reuse a response before revalidating with If-None-Match / If-Modified-Since.
+CATALOG_CACHE_MAX_AGE = int(os.getenv('CATALOG_CACHE_MAX_AGE', 0))
+
+# Serve canteen, category and menu item reads from the async views in api.async_views.
+# Turn on when running under ASGI (uvicorn canteen_backend.asgi:application).
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', 'False') == 'True'
+
+# Menu availability windows (see api.availability): seconds a process keeps its
+# compiled index before reloading windows edited by other processes.
+AVAILABILITY_INDEX_SECONDS = int(os.getenv('AVAILABILITY_INDEX_SECONDS', 60))
+
+# Cart quotes (see api.pricing): seconds a process keeps a canteen's price table
+# before reloading prices edited by other processes.
+PRICE_TABLE_SECONDS = int(os.getenv('PRICE_TABLE_SECONDS', 60))
+
+# Per-canteen category counts (see api.catalog) are keyed by menu version, so
+# this only bounds how long superseded entries occupy the cache.
+CATEGORY_COUNTS_CACHE_SECONDS = 60 * 60
+
+
+# Admin order list: totals at or above this many rows come from the query planner
+# instead of COUNT(*) (PostgreSQL only); ?exact_count=1 forces an exact count.
+ESTIMATED_COUNT_THRESHOLD = 10000
+
+
+# Receipts (see api.receipts): rendered on a process pool and stored content-addressed
+# in the default storage. 0 workers renders inline, which only suits development.
+RECEIPT_RENDER_WORKERS = int(os.getenv('RECEIPT_RENDER_WORKERS', 2))
+RECEIPT_STORAGE_PREFIX = 'receipts'
+
+
+# Customer notifications (see api.notifications): order status changes are written
+# to an outbox with the change and delivered by `manage.py dispatch_notifications`.
+# Each channel sends up to BATCH_SIZE notifications per call, CONCURRENCY calls at once.
+NOTIFICATION_STATUSES = ['READY', 'CANCELLED']
+NOTIFICATION_CHANNELS = {}
+if os.getenv('NOTIFICATION_EMAIL', 'False') == 'True':
+    NOTIFICATION_CHANNELS['email'] = {
+        'BACKEND': 'api.notifications.EmailChannel', 'BATCH_SIZE': 50, 'CONCURRENCY': 2,
+    }
+if os.getenv('NOTIFICATION_WEBHOOK_URLS'):
+    NOTIFICATION_CHANNELS['webhook'] = {
+        'BACKEND': 'api.notifications.WebhookChannel', 'BATCH_SIZE': 100, 'CONCURRENCY': 4,
+        'URLS': os.getenv('NOTIFICATION_WEBHOOK_URLS').split(','),
+        'SECRET': os.getenv('NOTIFICATION_WEBHOOK_SECRET', ''),
+    }
+if os.getenv('VAPID_PRIVATE_KEY'): # Web Push needs the optional pywebpush package
+    NOTIFICATION_CHANNELS['push'] = {
+        'BACKEND': 'api.notifications.WebPushChannel', 'BATCH_SIZE': 50, 'CONCURRENCY': 8,
+        'VAPID_PRIVATE_KEY': os.getenv('VAPID_PRIVATE_KEY'),
+        'VAPID_SUBJECT': os.getenv('VAPID_SUBJECT', 'mailto:admin@example.com'),
+    }
+NOTIFICATION_MAX_ATTEMPTS = 8
+NOTIFICATION_RETRY_BASE_SECONDS = 30 # Doubles after every failed attempt...
+NOTIFICATION_RETRY_MAX_SECONDS = 60 * 60 # ...up to this
+NOTIFICATION_LEASE_SECONDS = 5 * 60 # A claimed batch is retried after this if its dispatcher died
+NOTIFICATION_POLL_SECONDS = 2
+NOTIFICATION_TIMEOUT_SECONDS = 10 # Per HTTP request to webhooks and push services
+
+
+# Worker warm-up (see api.warmup and gunicorn.conf.py): modules imported before the
+# first request, on top of everything the URL configuration pulls in.
+WARMUP_ON_START = os.getenv('WARMUP_ON_START', 'True') == 'True'
+WARMUP_MODULES = [
+    'api.views', 'api.async_views', 'api.serializers', 'api.recommendations', 'api.forecasting',
+    'api.notifications', 'api.receipts', 'rest_framework.authtoken.models',
+]
@@ -0,0 +1,39 @@
+"""
+Gunicorn settings, read automatically when gunicorn starts in this directory:
+
+    gunicorn canteen_backend.wsgi
+    gunicorn canteen_backend.asgi -k uvicorn.workers.UvicornWorker
+
+The app is loaded once in the master and warmed up there before the workers
+are forked (see api.warmup), so every new worker starts with imports, URL
+tables and menu caches in place. Set GUNICORN_PRELOAD=False to load and warm
+up in each worker instead, e.g. to reload code on HUP.
+"""
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', 2))
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+preload_app = os.getenv('GUNICORN_PRELOAD', 'True') == 'True'
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 0)) # Recycled workers are forked warm too
+max_requests_jitter = max_requests // 10
+
+
+def _warm_up():
+    from django.conf import settings
+
+    if settings.WARMUP_ON_START:
+        from api.warmup import warm_up
+        warm_up()
+
+
+def when_ready(server):
+    # Runs in the master after the preloaded app is imported, before any worker is forked
+    if server.cfg.preload_app:
+        _warm_up()
+
+
+def post_worker_init(worker):
+    if not worker.cfg.preload_app:
+        _warm_up()
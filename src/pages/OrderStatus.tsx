@@ -3,7 +3,7 @@ import { useNavigate, useParams } from 'react-router-dom';
 import { ArrowLeft, Clock, Check, Home, Loader2, RefreshCw } from 'lucide-react';
 import { useOrder, OrderItem } from '@/contexts/OrderContext';
 import Header from '@/components/Header';
-import { useQuery } from '@tanstack/react-query';
+import { useInfiniteQuery, useQuery } from '@tanstack/react-query';
 import { apiClient } from '@/lib/api';
 import { useAuth } from '@/contexts/AuthContext';
 import { useToast } from '@/hooks/use-toast';
@@ -16,6 +16,7 @@ import { Card, CardContent, CardDescription, CardHeader, CardTitle } from '@/com
 interface CurrentOrderStatus {
   id: number;
   status: 'PENDING' | 'PROCESSING' | 'READY' | 'COMPLETED' | 'CANCELLED';
+  estimated_ready_at?: string | null; // Backend ETA from queue depth and prep-time stats
 }
 
 // Re-added ApiOrderItem and OrderHistoryItem interfaces
@@ -33,19 +34,37 @@ interface ApiOrderItem {
   price: string;
 }
 
+interface OrderDetail {
+  id: number;
+  canteen: {
+    id: number;
+    name: string;
+  };
+  items: ApiOrderItem[];
+}
+
+// Summary rows from the paginated /orders/ list; items are only loaded on retrieve
 interface OrderHistoryItem {
   id: number;
+  canteen: number;
   created_at: string;
-  updated_at: string;
   status: 'PENDING' | 'PROCESSING' | 'READY' | 'COMPLETED' | 'CANCELLED';
   total_price: string;
   notes: string | null;
   table_number: string | null;
-  canteen: {
-    id: number;
-    name: string;
-  };
-  items: ApiOrderItem[];
+  item_count: number;
+  items_preview: string;
+}
+
+interface OrderHistoryPage {
+  count: number;
+  next: string | null;
+  results: OrderHistoryItem[];
+}
+
+interface ApiCanteen {
+  id: number;
+  name: string;
 }
 
 const OrderStatus = () => {
@@ -80,16 +99,36 @@ const OrderStatus = () => {
     refetchIntervalInBackground: true,
   });
 
-  const { data: historyOrders, isLoading: isLoadingHistory, error: historyError } = useQuery<OrderHistoryItem[]>({
+  const {
+    data: historyPages,
+    isLoading: isLoadingHistory,
+    error: historyError,
+    hasNextPage,
+    fetchNextPage,
+    isFetchingNextPage,
+  } = useInfiniteQuery<OrderHistoryPage>({
     queryKey: ['orderHistory'],
-    queryFn: () => {
+    queryFn: ({ pageParam }) => {
         if (isGuest) {
-            return Promise.resolve([]); // No order history for guests
+            return Promise.resolve({ count: 0, next: null, results: [] }); // No order history for guests
         }
-        return apiClient<OrderHistoryItem[]>('/orders/')
+        return apiClient<OrderHistoryPage>(`/orders/?page=${pageParam}`)
     },
+    initialPageParam: 1,
+    getNextPageParam: (lastPage, allPages) => (lastPage.next ? allPages.length + 1 : undefined),
     enabled: !!user,
   });
+  const historyOrders = useMemo(() => historyPages?.pages.flatMap(page => page.results), [historyPages]);
+
+  const { data: canteens } = useQuery<ApiCanteen[]>({
+    queryKey: ['canteens'],
+    queryFn: () => apiClient<ApiCanteen[]>('/canteens/'),
+    enabled: !!user && !isGuest,
+  });
+  const canteenNames = useMemo(
+    () => new Map((canteens ?? []).map(canteen => [canteen.id, canteen.name])),
+    [canteens]
+  );
 
   const { displayStatus, progress } = useMemo(() => {
     if (!currentOrderData) return { displayStatus: 'Loading...', progress: 0 };
@@ -103,7 +142,14 @@ const OrderStatus = () => {
     }
   }, [currentOrderData]);
 
-  const handleRepeatOrder = (order: OrderHistoryItem) => {
+  const handleRepeatOrder = async (summary: OrderHistoryItem) => {
+    let order: OrderDetail;
+    try {
+      order = await apiClient<OrderDetail>(`/orders/${summary.id}/`);
+    } catch (error) {
+      toast({ title: "Could not repeat order", description: (error as Error).message, variant: "destructive" });
+      return;
+    }
     clearCart();
     setSelectedCanteenId(order.canteen.id);
     order.items.forEach(apiItem => {
@@ -215,6 +261,11 @@ const OrderStatus = () => {
                           <div className="flex items-center text-yellow-600"><Clock size={24} className="mr-2" /><span className="font-semibold text-xl">{displayStatus}</span></div>
                         )}
                       </div>
+                      {(currentOrderData?.status === 'PENDING' || currentOrderData?.status === 'PROCESSING') && currentOrderData.estimated_ready_at && (
+                        <p className="text-center text-sm text-gray-600">
+                          Estimated ready by <span className="font-semibold">{format(parseISO(currentOrderData.estimated_ready_at), 'p')}</span>
+                        </p>
+                      )}
                     </div>
                     {currentOrderData?.status === 'READY' && (
                       <div className="bg-green-50 border-l-4 border-green-500 rounded-md p-4 text-sm text-green-700">
@@ -278,34 +329,15 @@ const OrderStatus = () => {
                       <CardContent className="px-5 py-4 space-y-4 text-sm flex-grow">
                         <div className="flex justify-between text-xs sm:text-sm">
                           <span className="font-medium text-gray-600">Canteen:</span>
-                          <span className="text-gray-800 text-right">{order.canteen.name}</span>
+                          <span className="text-gray-800 text-right">{canteenNames.get(order.canteen) ?? `#${order.canteen}`}</span>
                         </div>
                         <div className="flex justify-between text-xs sm:text-sm">
                           <span className="font-medium text-gray-600">Total:</span>
                           <span className="font-semibold text-gray-800">₹{parseFloat(order.total_price).toFixed(2)}</span>
                         </div>
                         <div>
-                          <p className="font-medium text-gray-600 mb-2 text-xs sm:text-sm">Items:</p>
-                          <ul className="space-y-2 max-h-32 overflow-y-auto pr-2">
-                            {order.items.map(item => (
-                              <li key={item.id} className="flex items-center space-x-2 text-xs text-gray-700">
-                                {item.menu_item.image_url && (
-                                  <img 
-                                    src={item.menu_item.image_url} 
-                                    alt={item.menu_item.name} 
-                                    className="w-10 h-10 object-cover rounded-md shadow-sm"
-                                    onError={(e) => (e.currentTarget.style.display = 'none')}
-                                  />
-                                )}
-                                <span className="flex-grow">
-                                  {item.quantity}x {item.menu_item.name}
-                                </span>
-                                <span className="text-gray-600 font-medium whitespace-nowrap">
-                                  ₹{parseFloat(item.price).toFixed(2)}
-                                </span>
-                              </li>
-                            ))}
-                          </ul>
+                          <p className="font-medium text-gray-600 mb-2 text-xs sm:text-sm">Items ({order.item_count}):</p>
+                          <p className="text-xs text-gray-700">{order.items_preview}</p>
                         </div>
                         {order.table_number && (
                            <div className="flex justify-between text-xs pt-1">
@@ -336,6 +368,17 @@ const OrderStatus = () => {
                       </div>
                     </Card>
                   ))}
+                  {hasNextPage && (
+                    <Button
+                      variant="outline"
+                      className="w-full"
+                      onClick={() => fetchNextPage()}
+                      disabled={isFetchingNextPage}
+                    >
+                      {isFetchingNextPage ? <Loader2 size={16} className="mr-2 animate-spin" /> : null}
+                      Load more orders
+                    </Button>
+                  )}
                 </div>
               )}
               {historyOrders && historyOrders.length === 0 && !isLoadingHistory && (
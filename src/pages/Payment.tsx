@@ -60,13 +60,18 @@ const Payment = () => {
 
   const createRazorpayOrderMutation = useMutation<CreateRazorpayOrderResponse, Error, { amount: number }>({ 
     mutationFn: async ({ amount }) => {
+        // The cart is sent along so the backend can hold stock during the payment window
         if (isGuest) {
             toast({ title: "Guest Mode", description: "Simulating payment initiation..." });
             return Promise.resolve({ order_id: `guest_order_${Date.now()}` });
         }
       return apiClient<CreateRazorpayOrderResponse>('/payment/create-razorpay-order/', {
         method: 'POST',
-        body: JSON.stringify({ amount: Math.round(amount * 100) }), 
+        body: JSON.stringify({
+          amount: Math.round(amount * 100),
+          canteen: selectedCanteenId,
+          items: items.map(item => ({ menu_item_id: item.menuItemId, quantity: item.quantity })),
+        }), 
       });
     },
     onError: (error) => {
@@ -84,6 +89,8 @@ const Payment = () => {
         }
       return apiClient<VerifyPaymentResponse>('/payment/verify-payment/', {
         method: 'POST',
+        // One key per payment so a retried verification never creates a second order
+        headers: { 'Idempotency-Key': `verify-${paymentData.razorpay_payment_id}` },
         body: JSON.stringify(paymentData),
       });
     },
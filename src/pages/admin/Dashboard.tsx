@@ -10,7 +10,7 @@ import { useQuery } from '@tanstack/react-query';
 import { apiClient } from '@/lib/api';
 import { Loader2 } from 'lucide-react';
 import { Table, TableBody, TableCell, TableHead, TableHeader, TableRow } from '@/components/ui/table';
-import { ApiAdminOrder, getStatusBadgeVariant } from './Orders';
+import { ApiAdminOrderPage, getStatusBadgeVariant } from './Orders';
 import { format } from 'date-fns';
 import { Badge } from '@/components/ui/badge';
 import { Card, CardContent, CardHeader, CardTitle, CardDescription, CardFooter } from '@/components/ui/card';
@@ -145,10 +145,11 @@ const Dashboard = () => {
   });
 
   // --- Fetch Recent Orders ---
-  const { data: recentOrders, isLoading: isLoadingOrders, error: ordersError } = useQuery<ApiAdminOrder[]>({
+  const { data: recentOrders, isLoading: isLoadingOrders, error: ordersError } = useQuery<ApiAdminOrderPage, Error, ApiAdminOrderPage['results']>({
     queryKey: ['recentAdminOrders'],
     // Fetch latest 5 orders
-    queryFn: () => apiClient<ApiAdminOrder[]>('/admin/orders/?limit=5&ordering=-created_at')
+    queryFn: () => apiClient<ApiAdminOrderPage>('/admin/orders/?page_size=5&ordering=-created_at'),
+    select: (page) => page.results,
   });
 
   // Combined Loading/Error States
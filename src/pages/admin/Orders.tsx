@@ -57,6 +57,15 @@ export interface ApiAdminOrder {
   // Add other fields like payment_method, table_number etc. if available
 }
 
+// Paginated /admin/orders/ response; large totals are planner estimates
+export interface ApiAdminOrderPage {
+  count: number;
+  count_is_estimate: boolean;
+  next: string | null;
+  previous: string | null;
+  results: ApiAdminOrder[];
+}
+
 // Helper to get badge variant based on status
 export const getStatusBadgeVariant = (status: OrderStatusType): "default" | "secondary" | "outline" | "destructive" => {
   switch (status) {
@@ -89,23 +98,24 @@ const Orders = () => {
   const [canteenFilter, setCanteenFilter] = useState<string | null>(null);
   const [sortField, setSortField] = useState<string>('-created_at'); // Default sort by newest
   const [selectedOrder, setSelectedOrder] = useState<ApiAdminOrder | null>(null);
+  const [page, setPage] = useState(1);
   const { toast } = useToast();
   const queryClient = useQueryClient();
 
   // --- Data Fetching ---
   const ADMIN_ORDERS_URL = '/admin/orders/';
 
-  const { data: ordersData, isLoading: isLoadingOrders, error: ordersError } = useQuery<ApiAdminOrder[]>({
-    queryKey: ['adminOrders', statusFilter, canteenFilter, searchTerm, sortField],
+  const { data: ordersData, isLoading: isLoadingOrders, error: ordersError } = useQuery<ApiAdminOrderPage>({
+    queryKey: ['adminOrders', statusFilter, canteenFilter, searchTerm, sortField, page],
     queryFn: async () => {
-      const params = new URLSearchParams();
+      const params = new URLSearchParams({ page: page.toString() });
       if (statusFilter) params.append('status', statusFilter);
       if (canteenFilter) params.append('canteen', canteenFilter);
       if (searchTerm) params.append('search', searchTerm);
       if (sortField) params.append('ordering', sortField);
       
       const url = `${ADMIN_ORDERS_URL}?${params.toString()}`;
-      return apiClient<ApiAdminOrder[]>(url);
+      return apiClient<ApiAdminOrderPage>(url);
     },
     placeholderData: (prev) => prev,
   });
@@ -130,8 +140,11 @@ const Orders = () => {
     onSuccess: (updatedOrder) => {
         queryClient.invalidateQueries({ queryKey: ['adminOrders'] });
         // Optionally update the specific order in the cache for instant feedback
-        queryClient.setQueryData<ApiAdminOrder[]>(['adminOrders', statusFilter, canteenFilter, searchTerm, sortField], (oldData) =>
-            oldData?.map(order => order.id === updatedOrder.id ? updatedOrder : order)
+        queryClient.setQueryData<ApiAdminOrderPage>(['adminOrders', statusFilter, canteenFilter, searchTerm, sortField, page], (oldData) =>
+            oldData && {
+              ...oldData,
+              results: oldData.results.map(order => order.id === updatedOrder.id ? updatedOrder : order),
+            }
         );
         toast({ title: "Success", description: `Order #${updatedOrder.id} status updated to ${updatedOrder.status}.` });
     },
@@ -144,6 +157,7 @@ const Orders = () => {
   const handleSort = (field: string) => {
     const newSortField = sortField === field ? `-${field}` : field;
     setSortField(newSortField);
+    setPage(1);
   };
 
   const isLoading = isLoadingOrders || isLoadingCanteens;
@@ -162,7 +176,7 @@ const Orders = () => {
     return <div className="text-destructive p-4 bg-destructive/10 rounded-md">Error loading orders: {(ordersError as Error).message}</div>;
   }
 
-  const orders = ordersData || [];
+  const orders = ordersData?.results ?? [];
 
   return (
     <div className="space-y-6 p-1">
@@ -187,10 +201,10 @@ const Orders = () => {
                 placeholder="Search by Order ID, Customer..."
                 className="pl-9 h-9"
                 value={searchTerm}
-                onChange={(e) => setSearchTerm(e.target.value)}
+                onChange={(e) => { setSearchTerm(e.target.value); setPage(1); }}
               />
             </div>
-            <Select onValueChange={(value) => setStatusFilter(value === 'all' ? null : value as OrderStatusType)} value={statusFilter ?? 'all'}>
+            <Select onValueChange={(value) => { setStatusFilter(value === 'all' ? null : value as OrderStatusType); setPage(1); }} value={statusFilter ?? 'all'}>
               <SelectTrigger className="w-full md:w-[180px] h-9">
                   <SelectValue placeholder="Filter by Status" />
               </SelectTrigger>
@@ -201,7 +215,7 @@ const Orders = () => {
                   ))}
               </SelectContent>
               </Select>
-            <Select onValueChange={(value) => setCanteenFilter(value === 'all' ? null : value)} value={canteenFilter ?? 'all'}>
+            <Select onValueChange={(value) => { setCanteenFilter(value === 'all' ? null : value); setPage(1); }} value={canteenFilter ?? 'all'}>
               <SelectTrigger className="w-full md:w-[180px] h-9">
                   <SelectValue placeholder="Filter by Canteen" />
               </SelectTrigger>
@@ -303,10 +317,17 @@ const Orders = () => {
             </Table>
           </div>
         </CardContent>
-        {/* Add Pagination if needed */}
-        {/* <CardFooter className="border-t p-4">
-           Pagination Controls
-        </CardFooter> */}
+        {ordersData && (ordersData.next || ordersData.previous) && (
+          <CardFooter className="border-t p-4 flex justify-between items-center">
+            <span className="text-sm text-muted-foreground">
+              {ordersData.count_is_estimate ? 'About ' : ''}{ordersData.count.toLocaleString()} orders
+            </span>
+            <div className="flex gap-2">
+              <Button variant="outline" size="sm" disabled={!ordersData.previous} onClick={() => setPage(p => p - 1)}>Previous</Button>
+              <Button variant="outline" size="sm" disabled={!ordersData.next} onClick={() => setPage(p => p + 1)}>Next</Button>
+            </div>
+          </CardFooter>
+        )}
       </Card>
 
        {/* Order Details Dialog */}